@@ -0,0 +1,112 @@
+"""Núcleo de análisis sin UI: indicadores, resúmenes, impacto de eventos y figuras del dashboard."""
+from dataclasses import dataclass, field
+
+from anomalias import detectar
+from cubo import GRANULARIDADES, CuboRollup, resumen_periodos
+from eventos import EVENTO_PRINCIPAL, EVENTOS_BASE, VENTANAS_DIAS, IndiceImpacto, etiqueta_fecha
+from figuras import (figura_area, figura_comparacion, figura_crecimiento, figura_impacto_eventos, figura_periodos,
+                     figura_saldo, figura_ventana)
+from tablas import recortar_rango, ventana_alrededor
+
+COLUMNAS_TOP = ['fecha', 'saldo_rem', 'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario']
+GRANULARIDADES_REPORTE = ('W', 'M', 'Q')
+
+
+def indicadores_generales(df):
+    """Saldo, crecimiento total, MAU y saldo por MAU al inicio y al final de `df`"""
+    saldo_inicial = df['saldo_rem'].iloc[0]
+    saldo_actual = df['saldo_rem'].iloc[-1]
+    return {
+        'saldo_inicial': saldo_inicial,
+        'saldo_actual': saldo_actual,
+        'crecimiento_total': ((saldo_actual / saldo_inicial) - 1) * 100,
+        'mau_inicial': int(df['mau_rem'].iloc[0]),
+        'mau_actual': int(df['mau_rem'].iloc[-1]),
+        'saldo_por_mau_inicial': df['saldo_por_mau'].iloc[0],
+        'saldo_por_mau_actual': df['saldo_por_mau'].iloc[-1],
+    }
+
+
+def indicadores_velocidad(df):
+    """Crecimiento promedio diario, semanal y mensual, absoluto (MM CLP) y porcentual"""
+    return {
+        'diario_abs': df['saldo_crecimiento_absoluto_diario'].mean(),
+        'diario_pct': df['saldo_crecimiento_pct_diario'].mean(),
+        'semanal_abs': df['saldo_crecimiento_absoluto_semanal'].mean(),
+        'semanal_pct': df['saldo_crecimiento_pct_semanal'].mean(),
+        'mensual_abs': df['saldo_crecimiento_absoluto_mensual'].mean(),
+        'mensual_pct': df['saldo_crecimiento_pct_mensual'].mean(),
+    }
+
+
+def top_dias(df, n=10):
+    """(mayores crecimientos, mayores decrecimientos) diarios"""
+    return (
+        df.nlargest(n, 'saldo_crecimiento_absoluto_diario')[COLUMNAS_TOP],
+        df.nsmallest(n, 'saldo_crecimiento_absoluto_diario')[COLUMNAS_TOP],
+    )
+
+
+@dataclass
+class Reporte:
+    """Todo lo que muestra el dashboard para un rango y un evento foco, sin depender de Streamlit"""
+    nombre: str
+    rango: tuple
+    evento: object
+    indicadores: dict
+    velocidad: dict
+    periodos: dict
+    impacto: object
+    top_mayores: object
+    top_menores: object
+    anomalias: object = None
+    cambios: object = None
+    figuras: dict = field(default_factory=dict)
+
+
+def generar_reporte(datos, nombre, rango=None, evento=EVENTO_PRINCIPAL, eventos=EVENTOS_BASE,
+                    ventanas=VENTANAS_DIAS, dias_ventana=7):
+    """Reporte completo de `datos` (dataset con métricas derivadas) acotado a `rango`
+
+    Lanza ValueError si el rango no tiene datos.
+    """
+    df = recortar_rango(datos, rango)
+    if df.empty:
+        raise ValueError("Sin datos en el rango" if rango is None else f"Sin datos entre {rango[0]} y {rango[1]}")
+    eventos = tuple(eventos) if evento in eventos else tuple(eventos) + (evento,)
+    cubo = CuboRollup(df)
+    periodos = {g: resumen_periodos(cubo, g) for g in GRANULARIDADES_REPORTE}
+    indice = IndiceImpacto(df)
+    impacto = indice.evaluar(eventos, (None,) + tuple(ventanas))
+    foco = indice.evaluar((evento,), (None,)).iloc[0]
+    mayores, menores = top_dias(df)
+    deteccion = detectar(df)
+    cambios_saldo = deteccion.fechas_cambio('saldo_rem')
+
+    figuras = {
+        'saldo': figura_saldo(df, evento.fecha, cambios=cambios_saldo),
+        'mau': figura_area(df, 'mau_rem', '#A23B72', 'rgba(162, 59, 114, 0.2)', "MAU"),
+        'engagement': figura_area(df, 'dau_mau_ratio', '#6A994E', 'rgba(106, 153, 78, 0.2)', "DAU/MAU %",
+                                  cambios=deteccion.fechas_cambio('dau_mau_ratio')),
+        'crecimiento': figura_crecimiento(df, evento.fecha, cambios_saldo),
+        'periodos': figura_periodos(periodos['M'], GRANULARIDADES['M']),
+        'eventos': figura_impacto_eventos(impacto, eventos, (None,) + tuple(ventanas)),
+    }
+    if foco['dias_antes'] > 0 and foco['dias_despues'] > 0:
+        figuras['comparacion'] = figura_comparacion(foco['velocidad_antes'], foco['velocidad_despues'], etiqueta_fecha(evento.fecha))
+        figuras['ventana'] = figura_ventana(ventana_alrededor(df, evento.fecha, dias_ventana), evento.fecha, dias_ventana, evento.nombre)
+
+    return Reporte(
+        nombre=nombre,
+        rango=(df['fecha'].min().date(), df['fecha'].max().date()),
+        evento=evento,
+        indicadores=indicadores_generales(df),
+        velocidad=indicadores_velocidad(df),
+        periodos=periodos,
+        impacto=impacto,
+        top_mayores=mayores,
+        top_menores=menores,
+        anomalias=deteccion.anomalias,
+        cambios=deteccion.cambios,
+        figuras=figuras,
+    )
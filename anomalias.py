@@ -0,0 +1,215 @@
+"""Anomalías por z-score robusto móvil en todas las métricas a la vez y cambios de régimen con PELT."""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Métricas evaluadas (columna -> nombre para mostrar)
+METRICAS_ANOMALIAS = {
+    'saldo_rem': 'Saldo',
+    'saldo_crecimiento_absoluto_diario': 'Crecimiento diario',
+    'saldo_crecimiento_pct_diario': 'Crecimiento diario %',
+    'mau_rem': 'MAU',
+    'dau_rem': 'DAU',
+    'dau_mau_ratio': 'DAU/MAU',
+    'saldo_por_mau': 'Saldo/MAU',
+}
+# Serie segmentada por PELT para cada métrica con cambios de régimen: el saldo por su velocidad
+SERIES_CAMBIOS = {
+    'saldo_rem': 'saldo_crecimiento_pct_diario',
+    'dau_mau_ratio': 'dau_mau_ratio',
+}
+VENTANA_DIAS = 29  # impar para que la mediana centrada caiga en el día evaluado
+UMBRAL_Z = 3.5  # Iglewicz-Hoaglin
+MIN_MESES_EFECTO_MES = 3  # con menos meses el efecto por día del mes sobreajusta
+TAMANO_MINIMO_SEGMENTO = 14
+FACTOR_MAD = 1.4826  # MAD -> desviación estándar bajo normalidad
+ITERACIONES_DESCOMPOSICION = 3  # la tendencia converge en pocas pasadas
+MAX_AUTOCORRELACION = 0.9
+MAX_PUNTOS_PELT = 4000  # sobre esto PELT corta en bordes de bloque: su peor caso es cuadrático
+
+
+def _efecto(residuos, claves):
+    """Mediana de los residuos de cada columna por clave de calendario (día de semana, día del mes)"""
+    return residuos.groupby(claves).transform('median').fillna(0)
+
+
+def descomponer(datos, columnas, ventana=VENTANA_DIAS):
+    """(tendencia, residuos) de cada columna: mediana móvil centrada y lo que queda sin efectos de calendario
+
+    Se restan los efectos de día de semana y, con suficientes meses, de día del mes: las
+    métricas acumuladas dentro del mes (MAU, DAU/MAU) tienen un diente de sierra mensual.
+    Como en STL, la tendencia se vuelve a estimar sobre la serie sin esos efectos: la
+    mediana móvil del diente de sierra es una escalera que salta a mitad y a fin de mes.
+    """
+    valores = datos[list(columnas)].astype(float)
+    fechas = datos['fecha'].dt
+    dia_semana = fechas.dayofweek.to_numpy()
+    dia_mes = fechas.day.to_numpy() if fechas.to_period('M').nunique() >= MIN_MESES_EFECTO_MES else None
+    efectos = 0
+    for _ in range(ITERACIONES_DESCOMPOSICION):
+        tendencia = (valores - efectos).rolling(ventana, center=True, min_periods=ventana // 2 + 1).median()
+        residuos = valores - tendencia
+        efectos = _efecto(residuos, dia_semana)
+        if dia_mes is not None:
+            efectos = efectos + _efecto(residuos - efectos, dia_mes)
+    return tendencia, residuos - efectos
+
+
+def zscores_robustos(datos, columnas=tuple(METRICAS_ANOMALIAS), ventana=VENTANA_DIAS):
+    """z-score robusto de cada día y columna: residuo sobre 1,4826 × MAD móvil de los residuos
+
+    Todas las columnas se procesan juntas con ventanas móviles de pandas; el costo es
+    O(n log ventana) por columna.
+    """
+    columnas = [c for c in columnas if c in datos.columns]
+    _, residuos = descomponer(datos, columnas, ventana)
+    mad = residuos.abs().rolling(ventana, center=True, min_periods=ventana // 2 + 1).median()
+    # Piso de escala: evita z infinitos en tramos casi constantes
+    piso = residuos.abs().median().replace(0, np.nan) * 0.1
+    escala = FACTOR_MAD * mad.clip(lower=piso, axis=1)
+    return residuos / escala, residuos
+
+
+def tabla_anomalias(datos, zscores, residuos, umbral=UMBRAL_Z):
+    """Una fila por (día, métrica) con |z| sobre `umbral`: valor, valor esperado y z, de mayor a menor |z|"""
+    columnas = list(zscores.columns)
+    z = zscores.to_numpy()
+    filas, cols = np.nonzero(np.abs(np.nan_to_num(z)) > umbral)
+    valores = datos[columnas].to_numpy(dtype=float)
+    tabla = pd.DataFrame({
+        'fecha': datos['fecha'].to_numpy()[filas],
+        'metrica': np.asarray([METRICAS_ANOMALIAS.get(c, c) for c in columnas])[cols],
+        'columna': np.asarray(columnas)[cols],
+        'valor': valores[filas, cols],
+        'esperado': valores[filas, cols] - residuos.to_numpy()[filas, cols],
+        'z': z[filas, cols],
+    })
+    return tabla.iloc[np.argsort(-np.abs(tabla['z'].to_numpy()), kind='stable')].reset_index(drop=True)
+
+
+def pelt(x, penalizacion=None, tamano_minimo=TAMANO_MINIMO_SEGMENTO, max_puntos=MAX_PUNTOS_PELT):
+    """Posiciones de cambio en la media de `x` con PELT (costo gaussiano, poda exacta)
+
+    El costo de cada segmento sale de sumas prefijas en O(1). La poda descarta los
+    candidatos que ya no pueden ser óptimos, pero con pocos cambios descarta casi nada y
+    el peor caso es cuadrático. Por eso, con más de `max_puntos` días los cortes se buscan
+    sólo en los bordes de bloques de días contiguos (costos exactos, no promedios) y
+    después cada cambio se afina día a día dentro del bloque vecino.
+    Sin `penalizacion` se usa BIC sobre la serie estandarizada con la MAD de sus desvíos
+    respecto de la mediana móvil, inflada por la autocorrelación de esos desvíos (varianza
+    de largo plazo, (1 + ρ) / (1 − ρ)): con ruido autocorrelacionado, como el que deja el
+    diente de sierra mensual, la escala iid lo subestima y la serie se sobresegmenta.
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    if n < 2 * tamano_minimo:
+        return []
+    local = pd.Series(x).rolling(VENTANA_DIAS, center=True, min_periods=1).median().to_numpy()
+    desvios = x - local
+    sigma = FACTOR_MAD * np.median(np.abs(desvios))
+    if sigma > 0:
+        rho = np.clip(np.nan_to_num(np.corrcoef(desvios[1:], desvios[:-1])[0, 1]), 0, MAX_AUTOCORRELACION)
+        sigma *= np.sqrt((1 + rho) / (1 - rho))
+    if sigma > 0:
+        x = (x - np.median(x)) / sigma
+    beta = 2 * np.log(n) if penalizacion is None else penalizacion
+
+    suma = np.concatenate([[0.0], np.cumsum(x)])
+    cuadrados = np.concatenate([[0.0], np.cumsum(x * x)])
+
+    def costo(s, t):
+        largo = t - s
+        return cuadrados[t] - cuadrados[s] - (suma[t] - suma[s]) ** 2 / largo
+
+    # Cortes posibles: cada día, o el borde de cada bloque si la serie es larga
+    bloque = -(-n // max_puntos)
+    bordes = np.append(np.arange(0, n, bloque), n)
+    minimo = -(-tamano_minimo // bloque)
+    m = len(bordes) - 1
+
+    optimo = np.full(m + 1, np.inf)
+    optimo[0] = -beta
+    anterior = np.zeros(m + 1, dtype=np.int64)
+    candidatos = np.array([0], dtype=np.int64)
+    for t in range(minimo, m + 1):
+        nuevo = t - minimo
+        if nuevo >= minimo:
+            candidatos = np.append(candidatos, nuevo)
+        parciales = optimo[candidatos] + costo(bordes[candidatos], bordes[t])
+        mejor = np.argmin(parciales)
+        optimo[t] = parciales[mejor] + beta
+        anterior[t] = candidatos[mejor]
+        candidatos = candidatos[parciales <= optimo[t]]
+
+    cambios = []
+    t = anterior[m]
+    while t > 0:
+        cambios.append(int(bordes[t]))
+        t = anterior[t]
+    cambios = sorted(cambios)
+    if bloque > 1:
+        limites = [0] + cambios + [n]
+        for i in range(1, len(limites) - 1):
+            dias = np.arange(max(limites[i] - bloque + 1, limites[i - 1] + tamano_minimo),
+                             min(limites[i] + bloque, limites[i + 1] - tamano_minimo + 1))
+            if len(dias):
+                limites[i] = int(dias[np.argmin(costo(limites[i - 1], dias) + costo(dias, limites[i + 1]))])
+        cambios = limites[1:-1]
+    return cambios
+
+
+def cambios_de_regimen(datos, series=SERIES_CAMBIOS, penalizacion=None, tamano_minimo=TAMANO_MINIMO_SEGMENTO):
+    """Una fila por cambio detectado: métrica, fecha y media de la serie segmentada antes y después"""
+    partes = []
+    columnas = [c for c in dict.fromkeys(series.values()) if c in datos.columns]
+    # Se segmenta la serie sin efectos de calendario, para no confundirlos con regímenes
+    tendencia, residuos = descomponer(datos, columnas)
+    ajustadas = tendencia + residuos
+    for metrica, columna in series.items():
+        if columna not in ajustadas.columns:
+            continue
+        serie = ajustadas[columna].to_numpy()
+        validos = np.flatnonzero(np.isfinite(serie))
+        posiciones = pelt(serie[validos], penalizacion, tamano_minimo)
+        if not posiciones:
+            continue
+        limites = [0] + posiciones + [len(validos)]
+        medias = [np.mean(serie[validos[a:b]]) for a, b in zip(limites[:-1], limites[1:])]
+        partes.append(pd.DataFrame({
+            'metrica': METRICAS_ANOMALIAS.get(metrica, metrica),
+            'columna': metrica,
+            'serie': columna,
+            'fecha': datos['fecha'].to_numpy()[validos[posiciones]],
+            'media_antes': medias[:-1],
+            'media_despues': medias[1:],
+        }))
+    if not partes:
+        return pd.DataFrame(columns=['metrica', 'columna', 'serie', 'fecha', 'media_antes', 'media_despues', 'cambio'])
+    cambios = pd.concat(partes, ignore_index=True)
+    cambios['cambio'] = cambios['media_despues'] - cambios['media_antes']
+    return cambios
+
+
+@dataclass(frozen=True)
+class ResultadoAnomalias:
+    """Anomalías y cambios de régimen de una versión de datos"""
+    version: str
+    zscores: pd.DataFrame
+    anomalias: pd.DataFrame
+    cambios: pd.DataFrame
+
+    def fechas_cambio(self, columna):
+        """Fechas de cambio de régimen de una métrica, como tupla (sirve de parámetro de caché de figuras)"""
+        return tuple(pd.Timestamp(f) for f in self.cambios.loc[self.cambios['columna'] == columna, 'fecha'])
+
+
+def detectar(datos, version=None, umbral=UMBRAL_Z):
+    """z-scores, anomalías sobre `umbral` y cambios de régimen de `datos` (dataset con métricas derivadas)"""
+    zscores, residuos = zscores_robustos(datos)
+    return ResultadoAnomalias(
+        version=version,
+        zscores=zscores,
+        anomalias=tabla_anomalias(datos, zscores, residuos, umbral),
+        cambios=cambios_de_regimen(datos),
+    )
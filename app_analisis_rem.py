@@ -1,10 +1,37 @@
+import time
+# Desde acá se mide el render completo; en el primer run del proceso incluye las importaciones
+inicio_script = time.perf_counter()
 import streamlit as st
 import pandas as pd
-import pandas_gbq
-import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime, timedelta
+import functools
+import hashlib
+import os
 import numpy as np
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from consultas import PROJECT_ID, historial_cargas
+from fuentes import FuenteBigQuery, FuenteSQLLocal
+from sincronizacion import DIRECTORIO_ALMACEN, FECHA_INICIO_HISTORIA, AlmacenParticionado, sincronizar
+from metricas import MotorMetricas, calcular_metricas, version_datos
+from segmentos import DIMENSIONES, agregar_segmentos, segmentos_de, serie_segmento
+from refresco import FRACCION_REFRESCO, TTL_SEGUNDOS, RefrescoDatos
+from cache_compartido import CacheCompartido
+from cubo import GRANULARIDADES, CacheCubos, resumen_periodos
+from analisis import indicadores_generales, indicadores_velocidad
+from anomalias import METRICAS_ANOMALIAS, UMBRAL_Z, detectar
+from exportacion import DETALLES, FORMATOS, generar_exportacion
+from tablas import formatear_pagina, pagina, recortar_rango, total_paginas, ventana_alrededor
+from muestreo import ANCHO_OBJETIVO_PX, UMBRAL_WEBGL
+from memoria import RegistroSesiones, bytes_dataframe, rss_bytes
+from instrumentacion import HOST_METRICAS, TELEMETRIA, configurar_log, filas_de, instrumentar_cache, servir_metricas
+from figuras import (CacheFiguras, figura_area, figura_comparacion, figura_crecimiento, figura_impacto_eventos,
+                     figura_periodos, figura_saldo, figura_ventana)
+from eventos import EVENTO_PRINCIPAL, TIPOS_EVENTO, VENTANAS_DIAS, Evento, IndiceImpacto, cargar_eventos, etiqueta_fecha
+from snapshot import RUTA_CSV, RUTA_SNAPSHOT_PROCESADO, construir_snapshot_procesado, leer_snapshot_procesado, snapshot_procesado_vigente
+
+# Las sesiones comparten un único DataFrame de sólo lectura: con Copy-on-Write (siempre activo
+# desde pandas 3) los cortes son vistas y cualquier escritura copia en vez de mutar el original
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # Configuración de la página
 st.set_page_config(
@@ -49,138 +76,313 @@ st.markdown("---")
 # Sidebar para opciones
 st.sidebar.header("⚙️ Configuración")
 usar_cache = st.sidebar.checkbox("Usar datos guardados (más rápido)", value=True)
-fecha_reduccion_tasa = pd.to_datetime('2025-12-21')
+contenedor_estado_datos = st.sidebar.container()
+resolucion_completa = st.sidebar.checkbox(
+    "Gráficos en resolución completa",
+    value=False,
+    help=f"Por defecto las series largas se reducen a ~{ANCHO_OBJETIVO_PX} puntos (LTTB) y sobre {UMBRAL_WEBGL:,} puntos se dibujan con WebGL"
+)
+max_puntos = None if resolucion_completa else ANCHO_OBJETIVO_PX
+metricas_en_warehouse = st.sidebar.checkbox(
+    "Calcular métricas en BigQuery",
+    value=False,
+    disabled=usar_cache,
+    help="Con datos de BigQuery, la consulta devuelve diffs, medias móviles y primeros/últimos del mes ya calculados"
+)
+mostrar_diagnostico = st.sidebar.checkbox(
+    "Diagnóstico de rendimiento",
+    value=False,
+    help="Tiempo, filas y memoria por etapa y aciertos/fallos de cada caché de este proceso"
+)
+eventos_registrados = cargar_eventos()
+fecha_reduccion_tasa = EVENTO_PRINCIPAL.fecha
 
 # Función para cargar datos
-@st.cache_data(ttl=3600)
-def cargar_datos_bq():
-    """Carga datos desde BigQuery"""
-    project_id = "tenpo-bi-prod"
-
-    query = """
-    WITH base_revenue AS (
-      SELECT fecha, user, SUM(revenue) * 1000000 AS revenue_servicios
-      FROM `tenpo-bi-prod.kpitos.dataform_revenue_app`
-      WHERE tipo = "revenue_servicios" AND fecha >= "2025-01-01"
-      GROUP BY 1,2
-    ),
-    base_mau_rem AS (
-      SELECT fecha, COUNT(DISTINCT user) AS mau_rem
-      FROM `tenpo-bi-prod.kpitos.cohorts_cuenta_rem`
-      WHERE fecha >= '2025-01-01'
-      GROUP BY 1
-    ),
-    base_limpia AS (
-      SELECT * FROM `business-data-raw.ingestor_paid_account_public.interest_payment`
-      QUALIFY ROW_NUMBER() OVER(PARTITION BY date, user_id ORDER BY updated_at DESC) = 1
-    ),
-    diario AS (
-      SELECT
-        i.date AS fecha,
-        SUM(i.user_balance) AS saldo_rem,
-        IFNULL(m.mau_rem, 0) AS mau_rem,
-        COUNT(DISTINCT i.user_id) AS dau_rem
-      FROM base_limpia i
-      LEFT JOIN base_revenue r ON i.user_id = r.user AND i.date = r.fecha
-      LEFT JOIN base_mau_rem m ON i.date = m.fecha
-      WHERE i.status = "SUCCEEDED"
-        AND i.date <= DATE_SUB(CURRENT_DATE(), INTERVAL 2 DAY)
-        AND i.date >= "2025-01-01"
-      GROUP BY 1, 3
-    )
-    SELECT
-      fecha,
-      saldo_rem/1000000 AS saldo_rem,
-      SUM(mau_rem) OVER (PARTITION BY EXTRACT(YEAR FROM fecha), EXTRACT(MONTH FROM fecha) ORDER BY fecha ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS mau_rem,
-      dau_rem
-    FROM diario
-    ORDER BY fecha
-    """
-
-    with st.spinner('Cargando datos desde BigQuery...'):
-        df = pandas_gbq.read_gbq(query, project_id=project_id, use_bqstorage_api=False)
-
+def crear_fuente(metricas_en_warehouse=False):
+    """Fuente para el modo BigQuery; con REM_BD_LOCAL usa el motor SQL local sobre esa base SQLite"""
+    ruta_local = os.environ.get('REM_BD_LOCAL')
+    if ruta_local:
+        return FuenteSQLLocal(ruta_local, metricas_en_warehouse)
+    return FuenteBigQuery(metricas_en_warehouse)
+
+def leer_almacen(almacen, metricas_en_warehouse=False):
+    """Dataset completo del almacén local con su versión de contenido"""
+    df = almacen.leer()
+    df.attrs['version_datos'] = version_datos(df)
+    df.attrs['metricas_precalculadas'] = metricas_en_warehouse
     return df
 
-@st.cache_data
+@st.cache_resource
+def obtener_cache_compartido():
+    """Caché en disco compartida con los demás procesos y réplicas de la app"""
+    return CacheCompartido()
+
+@st.cache_resource
+def obtener_refresco(metricas_en_warehouse=False):
+    """Refresco en segundo plano del modo BigQuery, compartido entre sesiones"""
+    fuente = crear_fuente(metricas_en_warehouse)
+    almacen = AlmacenParticionado(DIRECTORIO_ALMACEN + ('_sql' if metricas_en_warehouse else ''))
+    compartido = obtener_cache_compartido()
+    espacio = 'bigquery_sql' if metricas_en_warehouse else 'bigquery'
+
+    def consultar_warehouse():
+        """Trae sólo los días nuevos al almacén local y devuelve el dataset completo"""
+        with TELEMETRIA.etapa('consulta_warehouse') as medicion:
+            sincronizar(fuente, almacen)
+            df = leer_almacen(almacen, metricas_en_warehouse)
+            medicion.filas = len(df)
+        return df
+
+    def cargar():
+        """Un solo proceso consulta el warehouse por período de refresco; el resto lee lo que publicó"""
+        return compartido.obtener_o_refrescar(espacio, consultar_warehouse, TTL_SEGUNDOS * FRACCION_REFRESCO)
+
+    def respaldo():
+        """Lo último publicado o sincronizado, para servir de inmediato mientras se refresca"""
+        publicado = compartido.leer_dataset(espacio)
+        if publicado is not None:
+            return publicado
+        momento = almacen.momento_sincronizacion()
+        if momento is None:
+            return None
+        return leer_almacen(almacen, metricas_en_warehouse), momento
+
+    def emergencia():
+        """Snapshot procesado o CSV locales si el warehouse falla y todavía no se sincronizó nada"""
+        datos = cargar_datos_csv()
+        if datos is None:
+            return None
+        ruta = RUTA_SNAPSHOT_PROCESADO if os.path.exists(RUTA_SNAPSHOT_PROCESADO) else RUTA_CSV
+        return datos, os.path.getmtime(ruta)
+
+    return RefrescoDatos(cargar, respaldo, nombre=fuente.nombre, emergencia=emergencia)
+
+def cargar_datos_bq(metricas_en_warehouse=False):
+    """Datos del modo BigQuery: se sirve el último dataset bueno y se refresca en segundo plano"""
+    refresco = obtener_refresco(metricas_en_warehouse)
+    hay_datos = refresco.hay_datos()
+    TELEMETRIA.registrar_cache('datos_bq', hay_datos)
+    if hay_datos:
+        return refresco.obtener()
+    try:
+        with st.spinner(f'Cargando datos desde {refresco.nombre}...'), TELEMETRIA.etapa('datos_bq') as medicion:
+            datos = refresco.obtener()
+            medicion.filas = filas_de(datos)
+    except Exception as e:
+        st.error(f"No se pudieron cargar datos desde {refresco.nombre} y no hay datos locales ({type(e).__name__}: {e})")
+        st.stop()
+    return datos
+
+@instrumentar_cache('datos_csv', st.cache_resource)
 def cargar_datos_csv():
-    """Carga datos desde CSV local"""
+    """Carga el snapshot procesado, con las métricas ya derivadas (se regenera si falta, si el CSV es más nuevo o si cambió la derivación)"""
     try:
-        df = pd.read_csv('datos_saldo_detallado.csv')
-        return df
+        if not snapshot_procesado_vigente(RUTA_SNAPSHOT_PROCESADO, RUTA_CSV):
+            with TELEMETRIA.etapa('parseo_csv'):
+                construir_snapshot_procesado(RUTA_CSV, RUTA_SNAPSHOT_PROCESADO)
+        df = leer_snapshot_procesado(RUTA_SNAPSHOT_PROCESADO)
     except:
-        return None
+        df = None
+    if df is None:
+        try:
+            df = pd.read_csv(RUTA_CSV)
+        except:
+            return None
+        df.attrs['version_datos'] = version_datos(df)
+    return df
+
+@st.cache_resource
+def obtener_motor_metricas():
+    """Motor de métricas compartido entre sesiones y reruns (y entre procesos vía la caché en disco)"""
+    return MotorMetricas(compartido=obtener_cache_compartido())
+
+@st.cache_resource
+def obtener_cache_figuras():
+    """Caché de figuras compartida entre sesiones, acotada en cantidad de entradas"""
+    return CacheFiguras(max_entradas=64)
+
+@st.cache_resource
+def obtener_cache_cubos():
+    """Cubos de agregados por período compartidos entre sesiones, uno por versión de datos"""
+    return CacheCubos(max_entradas=4)
+
+def obtener_cubo(version, datos):
+    """Cubo de la versión; si sólo se agregaron días a la anterior, se extiende el cubo anterior"""
+    resultado = obtener_motor_metricas().resultado(version)
+    if resultado is None:
+        return obtener_cache_cubos().obtener(version, datos)
+    return obtener_cache_cubos().obtener(version, datos, resultado.anterior, resultado.agregadas)
+
+@instrumentar_cache('indice_impacto', st.cache_resource(max_entries=4))
+def obtener_indice_impacto(version, _datos):
+    """Sumas prefijas para evaluar eventos, construidas una vez por versión de datos"""
+    return IndiceImpacto(_datos, version)
+
+@instrumentar_cache('anomalias', st.cache_resource(max_entries=4))
+def obtener_anomalias(version, _datos):
+    """z-scores robustos, anomalías y cambios de régimen, calculados una vez por versión de datos"""
+    return detectar(_datos, version)
+
+def origen_segmentos():
+    """Origen de las filas por usuario para los segmentos, o None si sólo hay datos agregados"""
+    ruta_local = os.environ.get('REM_BD_LOCAL')
+    if ruta_local:
+        return ('sqlite', ruta_local)
+    if not usar_cache:
+        return ('bigquery', PROJECT_ID)
+    return None
+
+@instrumentar_cache('segmentos', st.cache_resource(ttl=TTL_SEGUNDOS))
+def obtener_segmentos(origen):
+    """Series por segmento, compartidas entre procesos y recalculadas por un solo proceso por período"""
+    def agregar():
+        segmentos = agregar_segmentos(origen, FECHA_INICIO_HISTORIA)
+        hashes = pd.util.hash_pandas_object(segmentos, index=False).values
+        segmentos.attrs['version_datos'] = hashlib.sha1(hashes.tobytes()).hexdigest()[:16]
+        return segmentos
+
+    with st.spinner("Agregando segmentos desde las filas por usuario..."):
+        segmentos, _ = obtener_cache_compartido().obtener_o_refrescar(
+            f'segmentos_{origen[0]}', agregar, TTL_SEGUNDOS * FRACCION_REFRESCO
+        )
+    return segmentos
+
+@instrumentar_cache('metricas_segmento', st.cache_resource(max_entries=16))
+def obtener_metricas_segmento(version_segmentos, dimension, segmento, _segmentos):
+    """Serie de un segmento con las mismas métricas derivadas que el dataset global"""
+    return calcular_metricas(serie_segmento(_segmentos, dimension, segmento))
+
+@st.cache_resource
+def iniciar_exportacion_telemetria():
+    """Log JSON por etapa (REM_LOG_TELEMETRIA) y endpoint /metrics (REM_PUERTO_METRICAS en REM_HOST_METRICAS), una vez por proceso"""
+    ruta_log = os.environ.get('REM_LOG_TELEMETRIA')
+    if ruta_log:
+        configurar_log(ruta_log)
+    puerto = os.environ.get('REM_PUERTO_METRICAS')
+    return servir_metricas(int(puerto), host=os.environ.get('REM_HOST_METRICAS', HOST_METRICAS)) if puerto else None
+
+servidor_metricas = iniciar_exportacion_telemetria()
 
 # Cargar datos
+refresco = None
 if usar_cache:
     df = cargar_datos_csv()
     if df is None:
         st.warning("No se encontró archivo local. Cargando desde BigQuery...")
         df = cargar_datos_bq()
+        refresco = obtener_refresco()
 else:
-    df = cargar_datos_bq()
-
-# Procesar datos
-df['fecha'] = pd.to_datetime(df['fecha'])
-df = df.sort_values('fecha').reset_index(drop=True)
-
-# Calcular métricas derivadas
-df['saldo_crecimiento_absoluto_diario'] = df['saldo_rem'].diff()
-df['saldo_crecimiento_pct_diario'] = df['saldo_rem'].pct_change() * 100
-df['saldo_crecimiento_absoluto_semanal'] = df['saldo_rem'].diff(7)
-df['saldo_crecimiento_pct_semanal'] = ((df['saldo_rem'] / df['saldo_rem'].shift(7)) - 1) * 100
-df['saldo_ma7'] = df['saldo_rem'].rolling(window=7, min_periods=1).mean()
-df['crecimiento_diario_ma7'] = df['saldo_crecimiento_pct_diario'].rolling(window=7, min_periods=1).mean()
-df['saldo_por_mau'] = (df['saldo_rem'] / df['mau_rem']) * 1000000
-df['dau_mau_ratio'] = (df['dau_rem'] / df['mau_rem']) * 100
-
-# Dividir en períodos
-df_antes = df[df['fecha'] < fecha_reduccion_tasa].copy()
-df_despues = df[df['fecha'] >= fecha_reduccion_tasa].copy()
-
-# Tabs principales
-tab1, tab2, tab3, tab4 = st.tabs(["📈 Overview", "⚡ Velocidad de Crecimiento", "🎯 Impacto Reducción Tasa", "📊 Datos Detallados"])
-
+    df = cargar_datos_bq(metricas_en_warehouse)
+    refresco = obtener_refresco(metricas_en_warehouse)
+estado_carga = refresco.estado() if refresco is not None else None
+if estado_carga is not None and estado_carga.emergencia:
+    st.warning(f"No se pudo cargar desde {refresco.nombre} ({estado_carga.ultimo_error}); "
+               "se muestran los datos locales hasta que el próximo refresco funcione")
+
+def formatear_edad(segundos):
+    if segundos is None:
+        return "s/d"
+    if segundos < 90:
+        return f"{segundos:,.0f} s"
+    if segundos < 5400:
+        return f"{segundos / 60:,.0f} min"
+    return f"{segundos / 3600:,.1f} h"
+
+@st.fragment(run_every=15)
+def estado_datos(refresco, version_servida):
+    """Antigüedad y estado del refresco; recarga la app cuando termina un refresco con datos nuevos"""
+    estado = refresco.estado()
+    iconos = {'vigente': '🟢', 'refrescando': '🔄', 'error': '🟠', 'sin datos': '⚪'}
+    st.caption(f"{iconos[estado.estado]} {refresco.nombre}: datos de hace {formatear_edad(estado.edad_segundos)} · {estado.estado}")
+    if estado.ultimo_error:
+        st.caption(f"Último refresco falló, se sirven los datos anteriores ({estado.ultimo_error})")
+    if estado.version is not None and estado.version != version_servida:
+        st.rerun()
+
+with contenedor_estado_datos:
+    if refresco is not None:
+        estado_datos(refresco, df.attrs['version_datos'])
+    elif os.path.exists(RUTA_SNAPSHOT_PROCESADO):
+        st.caption(f"💾 Snapshot local de hace {formatear_edad(time.time() - os.path.getmtime(RUTA_SNAPSHOT_PROCESADO))}")
+
+cargas = historial_cargas()
+if cargas:
+    with st.sidebar.expander("💸 Costo de cargas"):
+        for carga in cargas[:5]:
+            escaneo = f"{carga.bytes_estimados / 1e9:,.2f} GB" if carga.bytes_estimados is not None else "s/d"
+            memoria = f"{carga.bytes_memoria / 1e6:,.2f} MB" if carga.bytes_memoria is not None else "s/d"
+            st.write(f"{carga.desde} → {carga.hasta} ({carga.modo}): {escaneo} escaneados, "
+                     f"{carga.segundos:,.1f} s, {carga.filas:,} filas, {memoria} en memoria")
+
+# Procesar datos (sólo se recalcula cuando cambia la versión de los datos)
+resultado_metricas = obtener_motor_metricas().obtener(df)
+df = resultado_metricas.datos
+version = resultado_metricas.version
+cache_figuras = obtener_cache_figuras()
+
+def medir_tab(nombre):
+    """Registra en la sesión el tiempo de render de una tab y lo muestra al pie de ella"""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            func(*args, **kwargs)
+            ms = (time.perf_counter() - inicio) * 1000
+            st.session_state.setdefault('tiempos_tabs', {})[nombre] = ms
+            TELEMETRIA.registrar_etapa(f'tab: {nombre}', ms / 1000)
+            st.caption(f"⏱️ {nombre}: {ms:,.0f} ms")
+        return envoltura
+    return decorador
+
+def mostrar_figura(figura, **kwargs):
+    """st.plotly_chart midiendo la serialización de la figura"""
+    trazas = figura['data'] if isinstance(figura, dict) else figura.to_plotly_json()['data']
+    with TELEMETRIA.etapa('serializacion_plotly', filas=sum(len(t.get('x', ())) for t in trazas)):
+        st.plotly_chart(figura, **kwargs)
+
+def mostrar_tabla(tabla, **kwargs):
+    """st.dataframe midiendo el formateo del Styler"""
+    with TELEMETRIA.etapa('formato_tablas', filas=len(getattr(tabla, 'data', tabla))):
+        st.dataframe(tabla, **kwargs)
+
+# Cada tab es un fragmento: sus widgets sólo re-ejecutan esa tab, no la app completa
 # TAB 1: OVERVIEW
-with tab1:
+@st.fragment
+@medir_tab("Overview")
+def tab_overview(df, version):
     st.header("Resumen Ejecutivo")
 
     # Métricas principales
     col1, col2, col3, col4 = st.columns(4)
 
-    saldo_inicial = df['saldo_rem'].iloc[0]
-    saldo_actual = df['saldo_rem'].iloc[-1]
-    crecimiento_total = ((saldo_actual / saldo_inicial) - 1) * 100
+    indicadores = indicadores_generales(df)
 
     with col1:
         st.metric(
             label="💰 Saldo Actual",
-            value=f"${saldo_actual:,.0f}M",
-            delta=f"+${saldo_actual - saldo_inicial:,.0f}M"
+            value=f"${indicadores['saldo_actual']:,.0f}M",
+            delta=f"+${indicadores['saldo_actual'] - indicadores['saldo_inicial']:,.0f}M"
         )
 
     with col2:
         st.metric(
             label="📈 Crecimiento Total",
-            value=f"{crecimiento_total:.1f}%",
-            delta=f"{crecimiento_total:.1f}% YTD"
+            value=f"{indicadores['crecimiento_total']:.1f}%",
+            delta=f"{indicadores['crecimiento_total']:.1f}% YTD"
         )
 
     with col3:
-        mau_actual = int(df['mau_rem'].iloc[-1])
-        mau_inicial = int(df['mau_rem'].iloc[0])
         st.metric(
             label="👥 MAU Actual",
-            value=f"{mau_actual:,}",
-            delta=f"+{mau_actual - mau_inicial:,}"
+            value=f"{indicadores['mau_actual']:,}",
+            delta=f"+{indicadores['mau_actual'] - indicadores['mau_inicial']:,}"
         )
 
     with col4:
-        saldo_por_mau_actual = df['saldo_por_mau'].iloc[-1]
         st.metric(
             label="💵 Saldo/MAU",
-            value=f"${saldo_por_mau_actual:,.0f}",
-            delta=f"${saldo_por_mau_actual - df['saldo_por_mau'].iloc[0]:,.0f}"
+            value=f"${indicadores['saldo_por_mau_actual']:,.0f}",
+            delta=f"${indicadores['saldo_por_mau_actual'] - indicadores['saldo_por_mau_inicial']:,.0f}"
         )
 
     st.markdown("---")
@@ -188,104 +390,89 @@ with tab1:
     # Gráfico principal - Evolución del saldo
     st.subheader("Evolución del Saldo REM 2025")
 
-    fig_saldo = go.Figure()
-
-    fig_saldo.add_trace(go.Scatter(
-        x=df['fecha'],
-        y=df['saldo_rem'],
-        mode='lines',
-        name='Saldo REM',
-        line=dict(color='#2E86AB', width=2),
-        fill='tozeroy',
-        fillcolor='rgba(46, 134, 171, 0.2)'
-    ))
-
-    fig_saldo.add_trace(go.Scatter(
-        x=df['fecha'],
-        y=df['saldo_ma7'],
-        mode='lines',
-        name='Media Móvil 7d',
-        line=dict(color='#F18F01', width=2, dash='dash')
-    ))
-
-    # Línea vertical para reducción de tasa
-    fig_saldo.add_vline(
-        x=fecha_reduccion_tasa.timestamp() * 1000,
-        line_dash="dash",
-        line_color="red",
-        annotation_text="Reducción de Tasa",
-        annotation_position="top"
+    # Al acotar el rango la reducción de puntos se aplica sólo sobre el tramo visible
+    fecha_min, fecha_max = df['fecha'].min().date(), df['fecha'].max().date()
+    rango_visible = st.slider(
+        "Rango visible",
+        min_value=fecha_min,
+        max_value=fecha_max,
+        value=(fecha_min, fecha_max),
+        format="YYYY-MM-DD"
     )
-
-    fig_saldo.update_layout(
-        height=500,
-        hovermode='x unified',
-        xaxis_title="Fecha",
-        yaxis_title="Saldo (Millones CLP)",
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-    )
-
-    st.plotly_chart(fig_saldo, width='stretch')
+    rango = None if rango_visible == (fecha_min, fecha_max) else rango_visible
+
+    # Filtro por segmento: los gráficos pasan a la serie del segmento elegido
+    origen = origen_segmentos()
+    if origen is not None:
+        col_dimension, col_segmento = st.columns(2)
+        with col_dimension:
+            dimension = st.selectbox(
+                "Segmentar por",
+                [None] + list(DIMENSIONES),
+                format_func=lambda d: "Todos los usuarios" if d is None else DIMENSIONES[d]
+            )
+        if dimension is not None:
+            segmentos = obtener_segmentos(origen)
+            with col_segmento:
+                segmento = st.selectbox("Segmento", segmentos_de(segmentos, dimension))
+            version_segmentos = segmentos.attrs['version_datos']
+            df = obtener_metricas_segmento(version_segmentos, dimension, segmento, segmentos)
+            version = f"{version_segmentos}:{dimension}:{segmento}"
+            st.caption("En un segmento, el MAU cuenta usuarios distintos con pago exitoso en el mes (interest_payment); "
+                       "el MAU global sale de cohorts_cuenta_rem, así que el de los segmentos no suma el total. "
+                       "Saldo y DAU sí suman el total.")
+    else:
+        st.caption("Los segmentos requieren filas por usuario (modo BigQuery o REM_BD_LOCAL)")
+
+    anomalias = obtener_anomalias(version, df)
+    fig_saldo = cache_figuras.obtener(figura_saldo, version, df, fecha_reduccion_tasa, max_puntos, rango,
+                                      anomalias.fechas_cambio('saldo_rem'))
+
+    mostrar_figura(fig_saldo, width='stretch')
 
     # Dos columnas para gráficos adicionales
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("MAU REM - Evolución")
-        fig_mau = go.Figure()
-        fig_mau.add_trace(go.Scatter(
-            x=df['fecha'],
-            y=df['mau_rem'],
-            mode='lines',
-            fill='tozeroy',
-            line=dict(color='#A23B72', width=2),
-            fillcolor='rgba(162, 59, 114, 0.2)'
-        ))
-        fig_mau.update_layout(height=300, xaxis_title="Fecha", yaxis_title="MAU")
-        st.plotly_chart(fig_mau, width='stretch')
+        fig_mau = cache_figuras.obtener(figura_area, version, df, 'mau_rem', '#A23B72', 'rgba(162, 59, 114, 0.2)', "MAU", max_puntos, rango)
+        mostrar_figura(fig_mau, width='stretch')
 
     with col2:
         st.subheader("DAU/MAU Ratio (Engagement)")
-        fig_engagement = go.Figure()
-        fig_engagement.add_trace(go.Scatter(
-            x=df['fecha'],
-            y=df['dau_mau_ratio'],
-            mode='lines',
-            fill='tozeroy',
-            line=dict(color='#6A994E', width=2),
-            fillcolor='rgba(106, 153, 78, 0.2)'
-        ))
-        fig_engagement.update_layout(height=300, xaxis_title="Fecha", yaxis_title="DAU/MAU %")
-        st.plotly_chart(fig_engagement, width='stretch')
+        fig_engagement = cache_figuras.obtener(figura_area, version, df, 'dau_mau_ratio', '#6A994E', 'rgba(106, 153, 78, 0.2)', "DAU/MAU %", max_puntos, rango,
+                                               anomalias.fechas_cambio('dau_mau_ratio'))
+        mostrar_figura(fig_engagement, width='stretch')
 
 # TAB 2: VELOCIDAD DE CRECIMIENTO
-with tab2:
+@st.fragment
+@medir_tab("Velocidad de Crecimiento")
+def tab_velocidad(df, version):
     st.header("Velocidad de Crecimiento del Saldo")
 
     # Métricas de velocidad
     col1, col2, col3 = st.columns(3)
+    velocidad = indicadores_velocidad(df)
 
     with col1:
         st.metric(
             label="📅 Crecimiento Diario Promedio",
-            value=f"${df['saldo_crecimiento_absoluto_diario'].mean():,.0f}M",
-            delta=f"{df['saldo_crecimiento_pct_diario'].mean():.3f}%"
+            value=f"${velocidad['diario_abs']:,.0f}M",
+            delta=f"{velocidad['diario_pct']:.3f}%"
         )
 
     with col2:
         st.metric(
             label="📆 Crecimiento Semanal Promedio",
-            value=f"${df['saldo_crecimiento_absoluto_semanal'].mean():,.0f}M",
-            delta=f"{df['saldo_crecimiento_pct_semanal'].mean():.2f}%"
+            value=f"${velocidad['semanal_abs']:,.0f}M",
+            delta=f"{velocidad['semanal_pct']:.2f}%"
         )
 
     with col3:
-        crecimiento_mensual_abs = df['saldo_rem'].diff(30).mean()
-        crecimiento_mensual_pct = ((df['saldo_rem'] / df['saldo_rem'].shift(30)) - 1).mean() * 100
         st.metric(
             label="📊 Crecimiento Mensual Promedio",
-            value=f"${crecimiento_mensual_abs:,.0f}M",
-            delta=f"{crecimiento_mensual_pct:.2f}%"
+            value=f"${velocidad['mensual_abs']:,.0f}M",
+            delta=f"{velocidad['mensual_pct']:.2f}%"
         )
 
     st.markdown("---")
@@ -293,83 +480,32 @@ with tab2:
     # Gráfico de crecimiento diario
     st.subheader("Crecimiento Diario Absoluto")
 
-    fig_crecimiento = go.Figure()
-
-    colors = ['#28a745' if x > 0 else '#dc3545' for x in df['saldo_crecimiento_absoluto_diario']]
+    cambios_saldo = obtener_anomalias(version, df).fechas_cambio('saldo_rem')
+    fig_crecimiento = cache_figuras.obtener(figura_crecimiento, version, df, fecha_reduccion_tasa, cambios_saldo)
 
-    fig_crecimiento.add_trace(go.Bar(
-        x=df['fecha'],
-        y=df['saldo_crecimiento_absoluto_diario'],
-        marker_color=colors,
-        name='Crecimiento Diario',
-        opacity=0.6
-    ))
+    mostrar_figura(fig_crecimiento, width='stretch')
 
-    fig_crecimiento.add_trace(go.Scatter(
-        x=df['fecha'],
-        y=df['saldo_crecimiento_absoluto_diario'].rolling(7).mean(),
-        mode='lines',
-        name='Media Móvil 7d',
-        line=dict(color='black', width=2)
-    ))
-
-    fig_crecimiento.add_vline(
-        x=fecha_reduccion_tasa.timestamp() * 1000,
-        line_dash="dash",
-        line_color="red",
-        annotation_text="Reducción de Tasa"
-    )
-
-    fig_crecimiento.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
-
-    fig_crecimiento.update_layout(
-        height=400,
-        xaxis_title="Fecha",
-        yaxis_title="Cambio Diario (Millones CLP)",
-        hovermode='x unified'
+    # Análisis mensual
+    st.subheader("Análisis por Período")
+
+    granularidad = st.radio(
+        "Granularidad",
+        options=['W', 'M', 'Q'],
+        index=1,
+        format_func=lambda g: GRANULARIDADES[g],
+        horizontal=True
     )
+    nombre_periodo = GRANULARIDADES[granularidad]
 
-    st.plotly_chart(fig_crecimiento, width='stretch')
+    resumen_mensual = resumen_periodos(obtener_cubo(version, df), granularidad)
 
-    # Análisis mensual
-    st.subheader("Análisis Mensual")
-
-    df['año_mes'] = df['fecha'].dt.to_period('M').astype(str)
-    resumen_mensual = df.groupby('año_mes').agg({
-        'saldo_rem': ['first', 'last', 'mean'],
-        'saldo_crecimiento_absoluto_diario': 'mean'
-    }).round(2)
-
-    resumen_mensual.columns = ['Saldo_Inicial', 'Saldo_Final', 'Saldo_Promedio', 'Crecimiento_Diario_Promedio']
-    resumen_mensual['Crecimiento_Total'] = resumen_mensual['Saldo_Final'] - resumen_mensual['Saldo_Inicial']
-    resumen_mensual['Crecimiento_Pct'] = ((resumen_mensual['Saldo_Final'] / resumen_mensual['Saldo_Inicial']) - 1) * 100
-    resumen_mensual = resumen_mensual.reset_index()
-
-    # Gráfico de barras del crecimiento mensual
-    fig_mensual = go.Figure()
-
-    colors_mensual = ['#28a745' if x > 0 else '#dc3545' for x in resumen_mensual['Crecimiento_Total']]
-
-    fig_mensual.add_trace(go.Bar(
-        x=resumen_mensual['año_mes'],
-        y=resumen_mensual['Crecimiento_Total'],
-        marker_color=colors_mensual,
-        text=resumen_mensual['Crecimiento_Total'].round(0),
-        texttemplate='%{text:,.0f}M',
-        textposition='outside'
-    ))
-
-    fig_mensual.update_layout(
-        height=400,
-        xaxis_title="Mes",
-        yaxis_title="Crecimiento Mensual (Millones CLP)",
-        showlegend=False
-    )
+    # Gráfico de barras del crecimiento por período
+    fig_mensual = cache_figuras.obtener(figura_periodos, version, resumen_mensual, nombre_periodo)
 
-    st.plotly_chart(fig_mensual, width='stretch')
+    mostrar_figura(fig_mensual, width='stretch')
 
-    # Tabla de resumen mensual
-    st.dataframe(
+    # Tabla de resumen por período
+    mostrar_tabla(
         resumen_mensual.style.format({
             'Saldo_Inicial': '${:,.0f}M',
             'Saldo_Final': '${:,.0f}M',
@@ -382,55 +518,70 @@ with tab2:
     )
 
 # TAB 3: IMPACTO REDUCCIÓN DE TASA
-with tab3:
-    st.header("🎯 Impacto de la Reducción de Tasa (21-dic-2025)")
+def agregar_evento():
+    """Suma a la sesión el evento del formulario (antes del rerun, para que ya aparezca en el selector)"""
+    nombre = st.session_state['evento_nombre'].strip()
+    if nombre:
+        st.session_state.setdefault('eventos_extra', []).append(
+            Evento(pd.Timestamp(st.session_state['evento_fecha']), nombre, st.session_state['evento_tipo'])
+        )
 
-    st.warning("⚠️ El 21 de diciembre de 2025 se redujo la tasa de interés entregada a clientes")
+@st.fragment
+@medir_tab("Impacto Reducción Tasa")
+def tab_impacto(df, version):
+    eventos = eventos_registrados + tuple(st.session_state.get('eventos_extra', ()))
+    col_evento, col_ventana = st.columns([3, 1])
+    with col_evento:
+        evento = st.selectbox(
+            "Evento",
+            eventos,
+            index=eventos.index(EVENTO_PRINCIPAL),
+            format_func=lambda e: f"{e.nombre} ({etiqueta_fecha(e.fecha)}-{e.fecha:%Y})"
+        )
+    with col_ventana:
+        dias_ventana = st.selectbox("Ventana detallada (días)", VENTANAS_DIAS, index=0)
+    etiqueta = etiqueta_fecha(evento.fecha)
+
+    # Antes/después sobre todo el período, desde las sumas prefijas del índice
+    indice = obtener_indice_impacto(version, df)
+    impacto = indice.evaluar((evento,), (None,)).iloc[0]
+
+    st.header(f"🎯 Impacto de {evento.nombre} ({etiqueta}-{evento.fecha:%Y})")
+
+    if evento == EVENTO_PRINCIPAL:
+        st.warning("⚠️ El 21 de diciembre de 2025 se redujo la tasa de interés entregada a clientes")
 
     # Comparación antes/después
-    st.subheader("Comparación: Antes vs Después del 21-dic")
+    st.subheader(f"Comparación: Antes vs Después del {etiqueta}")
 
     col1, col2 = st.columns(2)
 
     with col1:
-        st.markdown("### 📅 ANTES (01-ene a 20-dic)")
-        dias_antes = len(df_antes)
-        saldo_inicial_antes = df_antes['saldo_rem'].iloc[0]
-        saldo_final_antes = df_antes['saldo_rem'].iloc[-1]
-        crecimiento_antes = ((saldo_final_antes / saldo_inicial_antes) - 1) * 100
-        velocidad_diaria_antes = df_antes['saldo_crecimiento_absoluto_diario'].mean()
-        velocidad_pct_antes = df_antes['saldo_crecimiento_pct_diario'].mean()
-
-        st.metric("Días analizados", f"{dias_antes}")
-        st.metric("Saldo inicial", f"${saldo_inicial_antes:,.0f}M")
-        st.metric("Saldo final", f"${saldo_final_antes:,.0f}M")
-        st.metric("Crecimiento total", f"{crecimiento_antes:.2f}%")
-        st.metric("Velocidad diaria", f"${velocidad_diaria_antes:,.0f}M/día", delta=f"{velocidad_pct_antes:.3f}%/día")
+        st.markdown(f"### 📅 ANTES (hasta {etiqueta_fecha(evento.fecha - pd.Timedelta(days=1))})")
+        if impacto['dias_antes'] > 0:
+            st.metric("Días analizados", f"{impacto['dias_antes']}")
+            st.metric("Saldo inicial", f"${impacto['saldo_inicial_antes']:,.0f}M")
+            st.metric("Saldo final", f"${impacto['saldo_final_antes']:,.0f}M")
+            st.metric("Crecimiento total", f"{impacto['crecimiento_antes']:.2f}%")
+            st.metric("Velocidad diaria", f"${impacto['velocidad_antes']:,.0f}M/día", delta=f"{impacto['tasa_antes']:.3f}%/día")
 
     with col2:
-        st.markdown("### 📅 DESPUÉS (21-dic en adelante)")
-        if len(df_despues) > 0:
-            dias_despues = len(df_despues)
-            saldo_inicial_despues = df_despues['saldo_rem'].iloc[0]
-            saldo_final_despues = df_despues['saldo_rem'].iloc[-1]
-            crecimiento_despues = ((saldo_final_despues / saldo_inicial_despues) - 1) * 100 if saldo_inicial_despues > 0 else 0
-            velocidad_diaria_despues = df_despues['saldo_crecimiento_absoluto_diario'].mean()
-            velocidad_pct_despues = df_despues['saldo_crecimiento_pct_diario'].mean()
-
-            st.metric("Días analizados", f"{dias_despues}")
-            st.metric("Saldo inicial", f"${saldo_inicial_despues:,.0f}M")
-            st.metric("Saldo final", f"${saldo_final_despues:,.0f}M")
-            st.metric("Crecimiento total", f"{crecimiento_despues:.2f}%")
-            st.metric("Velocidad diaria", f"${velocidad_diaria_despues:,.0f}M/día", delta=f"{velocidad_pct_despues:.3f}%/día")
+        st.markdown(f"### 📅 DESPUÉS ({etiqueta} en adelante)")
+        if impacto['dias_despues'] > 0:
+            st.metric("Días analizados", f"{impacto['dias_despues']}")
+            st.metric("Saldo inicial", f"${impacto['saldo_inicial_despues']:,.0f}M")
+            st.metric("Saldo final", f"${impacto['saldo_final_despues']:,.0f}M")
+            st.metric("Crecimiento total", f"{np.nan_to_num(impacto['crecimiento_despues']):.2f}%")
+            st.metric("Velocidad diaria", f"${impacto['velocidad_despues']:,.0f}M/día", delta=f"{impacto['tasa_despues']:.3f}%/día")
 
     st.markdown("---")
 
     # Impacto medido
-    if len(df_despues) > 0:
+    if impacto['dias_antes'] > 0 and impacto['dias_despues'] > 0:
         st.subheader("📊 Impacto Medido")
 
-        cambio_velocidad_diaria = velocidad_diaria_despues - velocidad_diaria_antes
-        cambio_velocidad_pct = ((velocidad_pct_despues / velocidad_pct_antes) - 1) * 100
+        cambio_velocidad_diaria = impacto['cambio_velocidad']
+        cambio_velocidad_pct = impacto['cambio_velocidad_pct']
 
         col1, col2, col3 = st.columns(3)
 
@@ -444,10 +595,9 @@ with tab3:
             )
 
         with col2:
-            cambio_tasa_diaria = velocidad_pct_despues - velocidad_pct_antes
             st.metric(
                 "Cambio en tasa de crecimiento diario",
-                f"{cambio_tasa_diaria:+.3f} pp",
+                f"{impacto['cambio_tasa_pp']:+.3f} pp",
                 delta=f"{cambio_velocidad_pct:+.2f}%",
                 delta_color=delta_color
             )
@@ -461,114 +611,125 @@ with tab3:
         # Gráfico comparativo
         st.subheader("Comparación Visual")
 
-        fig_comparacion = go.Figure()
-
-        fig_comparacion.add_trace(go.Bar(
-            x=['Antes 21-dic', 'Después 21-dic'],
-            y=[velocidad_diaria_antes, velocidad_diaria_despues],
-            marker_color=['#2E86AB', '#F18F01'],
-            text=[f'${velocidad_diaria_antes:,.0f}M', f'${velocidad_diaria_despues:,.0f}M'],
-            textposition='outside',
-            textfont=dict(size=14, color='black', family='Arial Black')
-        ))
-
-        fig_comparacion.update_layout(
-            title="Velocidad Promedio de Crecimiento Diario",
-            yaxis_title="Crecimiento Diario Promedio (Millones CLP)",
-            height=400,
-            showlegend=False
+        fig_comparacion = cache_figuras.obtener_parametros(
+            figura_comparacion, version, impacto['velocidad_antes'], impacto['velocidad_despues'], etiqueta
         )
 
-        st.plotly_chart(fig_comparacion, width='stretch')
+        mostrar_figura(fig_comparacion, width='stretch')
 
-        # Análisis de 7 días antes y después
-        st.subheader("Análisis Detallado: 7 días antes y después del 21-dic")
+        # Análisis de N días antes y después
+        st.subheader(f"Análisis Detallado: {dias_ventana} días antes y después del {etiqueta}")
 
-        ventana = df[(df['fecha'] >= fecha_reduccion_tasa - timedelta(days=7)) &
-                     (df['fecha'] <= fecha_reduccion_tasa + timedelta(days=7))].copy()
+        ventana = ventana_alrededor(df, evento.fecha, dias_ventana)
 
-        fig_ventana = go.Figure()
+        fig_ventana = cache_figuras.obtener(figura_ventana, version, ventana, evento.fecha, dias_ventana, evento.nombre)
 
-        colors_ventana = ['#2E86AB' if fecha < fecha_reduccion_tasa else '#F18F01' for fecha in ventana['fecha']]
-
-        fig_ventana.add_trace(go.Bar(
-            x=ventana['fecha'],
-            y=ventana['saldo_crecimiento_absoluto_diario'],
-            marker_color=colors_ventana,
-            text=ventana['saldo_crecimiento_absoluto_diario'].round(0),
-            texttemplate='%{text:+,.0f}M',
-            textposition='outside'
-        ))
-
-        fig_ventana.add_vline(
-            x=fecha_reduccion_tasa.timestamp() * 1000,
-            line_dash="dash",
-            line_color="red",
-            line_width=3,
-            annotation_text="REDUCCIÓN DE TASA",
-            annotation_position="top"
-        )
-
-        fig_ventana.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
-
-        fig_ventana.update_layout(
-            title="Crecimiento Diario: 7 días antes y después",
-            xaxis_title="Fecha",
-            yaxis_title="Cambio Diario (Millones CLP)",
-            height=400
-        )
-
-        st.plotly_chart(fig_ventana, width='stretch')
+        mostrar_figura(fig_ventana, width='stretch')
 
         # Tabla detallada
-        ventana_display = ventana[['fecha', 'saldo_rem', 'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario']].copy()
-        ventana_display['Período'] = ventana_display['fecha'].apply(lambda x: '🔵 Antes' if x < fecha_reduccion_tasa else '🟠 Después')
-        ventana_display['Es reducción'] = ventana_display['fecha'] == fecha_reduccion_tasa
+        ventana_display = ventana[['fecha', 'saldo_rem', 'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario']].assign(**{
+            'Período': np.where(ventana['fecha'] < evento.fecha, '🔵 Antes', '🟠 Después'),
+            'Es evento': ventana['fecha'] == evento.fecha,
+        })
 
-        st.dataframe(
+        mostrar_tabla(
             ventana_display.style.format({
                 'saldo_rem': '${:,.0f}M',
                 'saldo_crecimiento_absoluto_diario': '${:+,.0f}M',
                 'saldo_crecimiento_pct_diario': '{:+.2f}%'
-            }).apply(lambda x: ['background-color: #ffebee' if x['Es reducción'] else '' for _ in range(len(x))], axis=1),
+            }).apply(lambda x: ['background-color: #ffebee' if x['Es evento'] else '' for _ in range(len(x))], axis=1),
             width='stretch'
         )
 
+    # Todos los eventos y ventanas en una sola pasada
+    st.markdown("---")
+    st.subheader("📋 Comparación de Eventos")
+
+    with st.expander("➕ Agregar evento"):
+        with st.form("nuevo_evento", clear_on_submit=True):
+            col1, col2, col3 = st.columns([2, 2, 1])
+            with col1:
+                st.text_input("Nombre", key="evento_nombre")
+            with col2:
+                st.date_input("Fecha", value=df['fecha'].max().date(), key="evento_fecha")
+            with col3:
+                st.selectbox("Tipo", TIPOS_EVENTO, key="evento_tipo")
+            st.form_submit_button("Agregar", on_click=agregar_evento)
+
+    ventanas = tuple(st.multiselect(
+        "Ventanas (días)",
+        VENTANAS_DIAS + (None,),
+        default=list(VENTANAS_DIAS),
+        format_func=lambda w: "Período completo" if w is None else f"±{w} días"
+    ))
+    comparacion = indice.evaluar(eventos, ventanas)
+    if len(comparacion) == 0:
+        st.info("Selecciona al menos una ventana")
+        return
+
+    fig_eventos = cache_figuras.obtener(figura_impacto_eventos, version, comparacion, eventos, ventanas)
+    mostrar_figura(fig_eventos, width='stretch')
+
+    mostrar_tabla(
+        comparacion[[
+            'evento', 'fecha', 'ventana_dias', 'dias_antes', 'dias_despues', 'velocidad_antes', 'velocidad_despues',
+            'cambio_velocidad', 'cambio_velocidad_pct', 'tasa_antes', 'tasa_despues', 'cambio_tasa_pp',
+        ]].style.format({
+            'fecha': lambda f: f.strftime('%Y-%m-%d'),
+            'ventana_dias': lambda w: f"±{w}" if w else "completo",
+            'velocidad_antes': '${:,.0f}M',
+            'velocidad_despues': '${:,.0f}M',
+            'cambio_velocidad': '${:+,.0f}M',
+            'cambio_velocidad_pct': '{:+.2f}%',
+            'tasa_antes': '{:.3f}%',
+            'tasa_despues': '{:.3f}%',
+            'cambio_tasa_pp': '{:+.3f} pp',
+        }, na_rep='s/d'),
+        width='stretch',
+        hide_index=True
+    )
+
 # TAB 4: DATOS DETALLADOS
-with tab4:
+@st.fragment
+@medir_tab("Datos Detallados")
+def tab_datos(df, version):
     st.header("📊 Datos Detallados")
 
-    st.subheader("Top Eventos")
+    anomalias = obtener_anomalias(version, df)
 
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.markdown("### 🚀 Top 10 Mayores Crecimientos")
-        top_crecimientos = df.nlargest(10, 'saldo_crecimiento_absoluto_diario')[
-            ['fecha', 'saldo_rem', 'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario']
-        ]
-        st.dataframe(
-            top_crecimientos.style.format({
-                'saldo_rem': '${:,.0f}M',
-                'saldo_crecimiento_absoluto_diario': '${:+,.0f}M',
-                'saldo_crecimiento_pct_diario': '{:+.2f}%'
-            }),
-            width='stretch'
-        )
+    st.subheader("🔎 Anomalías")
+    st.caption(
+        f"Días con |z| > {UMBRAL_Z} sobre la tendencia móvil, descontados los efectos de día de semana y día del mes"
+    )
+    metricas = st.multiselect(
+        "Métricas",
+        list(METRICAS_ANOMALIAS.values()),
+        default=list(METRICAS_ANOMALIAS.values())
+    )
+    tabla = anomalias.anomalias[anomalias.anomalias['metrica'].isin(metricas)]
+    mostrar_tabla(
+        tabla[['fecha', 'metrica', 'valor', 'esperado', 'z']].style.format({
+            'fecha': lambda f: f.strftime('%Y-%m-%d'),
+            'valor': '{:,.2f}',
+            'esperado': '{:,.2f}',
+            'z': '{:+.1f}',
+        }),
+        width='stretch',
+        hide_index=True
+    )
 
-    with col2:
-        st.markdown("### 📉 Top 10 Mayores Decrecimientos")
-        top_decrecimientos = df.nsmallest(10, 'saldo_crecimiento_absoluto_diario')[
-            ['fecha', 'saldo_rem', 'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario']
-        ]
-        st.dataframe(
-            top_decrecimientos.style.format({
-                'saldo_rem': '${:,.0f}M',
-                'saldo_crecimiento_absoluto_diario': '${:+,.0f}M',
-                'saldo_crecimiento_pct_diario': '{:+.2f}%'
-            }),
-            width='stretch'
-        )
+    st.subheader("📍 Cambios de Régimen")
+    st.caption("Cambios en la media de la velocidad del saldo (%) y del DAU/MAU detectados con PELT")
+    mostrar_tabla(
+        anomalias.cambios[['fecha', 'metrica', 'media_antes', 'media_despues', 'cambio']].style.format({
+            'fecha': lambda f: f.strftime('%Y-%m-%d'),
+            'media_antes': '{:.3f}',
+            'media_despues': '{:.3f}',
+            'cambio': '{:+.3f}',
+        }),
+        width='stretch',
+        hide_index=True
+    )
 
     st.markdown("---")
 
@@ -582,11 +743,23 @@ with tab4:
     with col2:
         fecha_fin = st.date_input("Fecha fin", value=df['fecha'].max().date())
 
-    df_filtrado = df[(df['fecha'] >= pd.to_datetime(fecha_inicio)) & (df['fecha'] <= pd.to_datetime(fecha_fin))]
+    df_filtrado = recortar_rango(df, (fecha_inicio, fecha_fin))
 
-    st.dataframe(
-        df_filtrado[['fecha', 'saldo_rem', 'mau_rem', 'dau_rem', 'saldo_crecimiento_absoluto_diario',
-                     'saldo_crecimiento_pct_diario', 'saldo_por_mau', 'dau_mau_ratio']].style.format({
+    # Sólo se formatea la página visible
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        tamano_pagina = st.selectbox("Filas por página", options=[50, 100, 250, 500], index=1)
+    n_paginas = total_paginas(len(df_filtrado), tamano_pagina)
+    with col2:
+        numero_pagina = st.number_input("Página", min_value=1, max_value=n_paginas, value=1, step=1)
+    with col3:
+        primera = (numero_pagina - 1) * tamano_pagina
+        st.caption(f"Filas {min(primera + 1, len(df_filtrado)):,}–{min(primera + tamano_pagina, len(df_filtrado)):,} de {len(df_filtrado):,} · página {numero_pagina} de {n_paginas}")
+
+    columnas_dataset = ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem', 'saldo_crecimiento_absoluto_diario',
+                        'saldo_crecimiento_pct_diario', 'saldo_por_mau', 'dau_mau_ratio']
+    mostrar_tabla(
+        formatear_pagina(pagina(df_filtrado[columnas_dataset], numero_pagina, tamano_pagina), {
             'saldo_rem': '${:,.0f}M',
             'mau_rem': '{:,.0f}',
             'dau_rem': '{:,.0f}',
@@ -602,14 +775,115 @@ with tab4:
     # Descargar datos
     st.subheader("💾 Descargar Datos")
 
-    csv = df_filtrado.to_csv(index=False).encode('utf-8')
+    col1, col2 = st.columns(2)
+    with col1:
+        formato = st.radio("Formato", options=list(FORMATOS), format_func=str.upper, horizontal=True)
+    with col2:
+        detalle = st.radio("Contenido", options=list(DETALLES), format_func=DETALLES.get, horizontal=True)
+
+    # El archivo se genera recién al hacer click, por chunks y cacheado por versión y rango
+    def exportar():
+        """Archivo exportado, abierto para que Streamlit lo sirva
+
+        La escritura tiene memoria acotada, pero la descarga no: Streamlit lee el archivo
+        entero y lo guarda como bytes en su almacén de medios mientras la sesión lo use.
+        """
+        return open(generar_exportacion(df_filtrado, version, fecha_inicio, fecha_fin, formato, detalle), 'rb')
+
     st.download_button(
-        label="📥 Descargar CSV",
-        data=csv,
-        file_name=f'datos_rem_{fecha_inicio}_{fecha_fin}.csv',
-        mime='text/csv',
+        label=f"📥 Descargar {formato.upper()}",
+        data=exportar,
+        file_name=f'datos_rem_{fecha_inicio}_{fecha_fin}.{formato}',
+        mime=FORMATOS[formato],
     )
 
+# Tabs principales: sólo se ejecuta la tab abierta
+tab1, tab2, tab3, tab4 = st.tabs(
+    ["📈 Overview", "⚡ Velocidad de Crecimiento", "🎯 Impacto Reducción Tasa", "📊 Datos Detallados"],
+    key="tab_activa",
+    on_change="rerun"
+)
+
+with tab1:
+    if tab1.open:
+        tab_overview(df, version)
+
+with tab2:
+    if tab2.open:
+        tab_velocidad(df, version)
+
+with tab3:
+    if tab3.open:
+        tab_impacto(df, version)
+
+with tab4:
+    if tab4.open:
+        tab_datos(df, version)
+
+with st.sidebar.expander("⏱️ Tiempos por tab"):
+    for nombre, ms in st.session_state.get('tiempos_tabs', {}).items():
+        st.write(f"{nombre}: {ms:,.0f} ms")
+
+@st.cache_resource
+def obtener_registro_sesiones():
+    """Sesiones activas del proceso, para repartir el RSS entre ellas"""
+    return RegistroSesiones()
+
+registro_sesiones = obtener_registro_sesiones()
+contexto = get_script_run_ctx()
+if contexto is not None:
+    registro_sesiones.registrar(contexto.session_id)
+
+with st.sidebar.expander("🧠 Memoria"):
+    rss = rss_bytes()
+    sesiones_activas = registro_sesiones.activas()
+    st.write(f"Dataset compartido: {bytes_dataframe(df) / 1e6:,.2f} MB (una sola copia por proceso)")
+    if rss is not None:
+        st.write(f"RSS del proceso: {rss / 1e6:,.1f} MB")
+        st.write(f"Sesiones activas: {sesiones_activas} · {rss / 1e6 / max(sesiones_activas, 1):,.1f} MB por sesión")
+
+@st.cache_resource
+def estado_arranque():
+    """Marca compartida del proceso para registrar una sola vez el primer render"""
+    return {'primer_render': None}
+
+segundos_render = time.perf_counter() - inicio_script
+arranque = estado_arranque()
+if arranque['primer_render'] is None:
+    arranque['primer_render'] = segundos_render
+    TELEMETRIA.registrar_etapa('primer_render', segundos_render)
+TELEMETRIA.registrar_etapa('render_app', segundos_render)
+
+if mostrar_diagnostico:
+    with st.sidebar.expander("🩺 Diagnóstico", expanded=True):
+        st.markdown("**Etapas** (acumulado del proceso)")
+        st.dataframe(pd.DataFrame([
+            {
+                'Etapa': nombre,
+                'Llamadas': e.llamadas,
+                'Última (ms)': e.ultimo_segundos * 1000,
+                'Promedio (ms)': e.promedio_segundos * 1000,
+                'Máx (ms)': e.segundos_max * 1000,
+                'Filas': e.ultimas_filas,
+                'Δ RSS (MB)': e.ultimo_delta_memoria / 1e6 if e.ultimo_delta_memoria is not None else None,
+            }
+            for nombre, e in TELEMETRIA.etapas().items()
+        ]).style.format({'Última (ms)': '{:,.1f}', 'Promedio (ms)': '{:,.1f}', 'Máx (ms)': '{:,.1f}',
+                         'Filas': '{:,.0f}', 'Δ RSS (MB)': '{:+,.2f}'}, na_rep='s/d'), hide_index=True)
+        st.markdown("**Cachés**")
+        st.dataframe(pd.DataFrame([
+            {'Caché': nombre, 'Aciertos': aciertos, 'Fallos': fallos, 'Tasa de aciertos': aciertos / max(aciertos + fallos, 1) * 100}
+            for nombre, (aciertos, fallos) in TELEMETRIA.caches().items()
+        ]).style.format({'Tasa de aciertos': '{:.0f}%'}), hide_index=True)
+        st.caption(f"Primer render del proceso: {arranque['primer_render'] * 1000:,.0f} ms (incluye importaciones)")
+        if servidor_metricas is not None:
+            host, puerto = servidor_metricas.server_address[:2]
+            st.caption(f"Métricas Prometheus en {host}:{puerto}/metrics")
+        elif os.environ.get('REM_PUERTO_METRICAS'):
+            st.caption(f"No se pudo exponer /metrics en el puerto {os.environ['REM_PUERTO_METRICAS']} (ocupado)")
+        if os.environ.get('REM_LOG_TELEMETRIA'):
+            st.caption(f"Eventos JSON en {os.environ['REM_LOG_TELEMETRIA']}")
+
 # Footer
 st.markdown("---")
 st.markdown("**📅 Última actualización:** " + df['fecha'].max().strftime('%Y-%m-%d'))
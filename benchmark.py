@@ -0,0 +1,349 @@
+"""Benchmark del pipeline con datos sintéticos a escala: tiempo y memoria por etapa, líneas base y regresiones."""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analisis import top_dias
+from anomalias import detectar
+from cubo import CuboRollup, resumen_periodos
+from eventos import VENTANAS_DIAS, Evento, IndiceImpacto
+from figuras import figura_area, figura_crecimiento, figura_periodos, figura_saldo
+from memoria import rss_bytes
+from metricas import calcular_metricas
+from muestreo import ANCHO_OBJETIVO_PX
+from snapshot import RUTA_CSV, convertir_csv_a_snapshot, leer_snapshot
+from tablas import formatear_pagina, pagina
+
+RUTA_LINEA_BASE = 'benchmark_linea_base.json'
+# Una etapa es regresión si tarda (o usa memoria) más de este factor sobre su línea base
+UMBRAL_REGRESION = 0.25
+# Por debajo de este tiempo la variación es ruido del reloj y no se marca
+MINIMO_SEGUNDOS = 0.005
+REPETICIONES = 3
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+# Módulos cuya importación se mide en frío: la app, y el stack del warehouse que ahora se difiere
+MODULOS_IMPORTACION = ('consultas', 'fuentes', 'pandas_gbq', 'google.cloud.bigquery')
+TAMANO_PAGINA = 100
+
+FORMATOS_TABLA = {
+    'saldo_rem': '${:,.0f}M',
+    'saldo_crecimiento_absoluto_diario': '${:+,.0f}M',
+    'saldo_crecimiento_pct_diario': '{:+.2f}%',
+}
+
+
+@dataclass(frozen=True)
+class Escenario:
+    nombre: str
+    anios: int
+    productos: int = 1
+    usuarios: int = 0  # filas por usuario para la carga con el motor SQL local; 0 la omite
+    dias_usuarios: int = 90
+
+
+ESCENARIOS = {
+    e.nombre: e for e in (
+        Escenario('1a', anios=1, usuarios=2000),
+        Escenario('3a', anios=3, productos=3),
+        Escenario('10a', anios=10, usuarios=5000, dias_usuarios=365),
+        Escenario('10a_x10', anios=10, productos=10),
+    )
+}
+
+
+def generar_serie(dias, desde=date(2025, 1, 1), semilla=0, escala=1.0):
+    """Serie diaria con el esquema base (fecha, saldo_rem, mau_rem, dau_rem)
+
+    El saldo sigue un paseo geométrico con estacionalidad semanal; el MAU es acumulado
+    dentro de cada mes, como en la consulta real, y nunca menor que el DAU.
+    """
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(desde, periods=dias, freq='D')
+    retornos = rng.normal(0.004, 0.006, dias) + 0.002 * np.sin(2 * np.pi * np.arange(dias) / 7)
+    saldo = 50000 * escala * np.exp(np.cumsum(retornos))
+
+    dau = (70000 * escala * np.linspace(1, 1 + dias / 365, dias) * rng.normal(1, 0.05, dias)).astype(np.int64)
+    nuevos = np.where(fechas.day == 1, dau, (dau * 0.08).astype(np.int64))
+    mau = pd.Series(nuevos).groupby(fechas.to_period('M')).cumsum().to_numpy()
+    return pd.DataFrame({
+        'fecha': fechas,
+        'saldo_rem': saldo,
+        'mau_rem': np.maximum(mau, dau),
+        'dau_rem': dau,
+    })
+
+
+def generar_dataset(escenario, semilla=0):
+    """Series de todos los productos del escenario, con las métricas derivadas como en el CSV de datos"""
+    dias = 365 * escenario.anios
+    series = []
+    for i in range(escenario.productos):
+        serie = calcular_metricas(generar_serie(dias, semilla=semilla + i, escala=1 + i / 2))
+        if escenario.productos > 1:
+            serie.insert(0, 'producto', f'producto_{i + 1}')
+        series.append(serie)
+    return pd.concat(series, ignore_index=True)
+
+
+def eventos_sinteticos(df, cada_dias=30):
+    """Un evento cada `cada_dias` días a lo largo de `df`"""
+    fechas = pd.date_range(df['fecha'].min(), df['fecha'].max(), freq=f'{cada_dias}D')[1:]
+    return tuple(Evento(f, f'evento {f:%Y-%m-%d}', 'otro') for f in fechas)
+
+
+def _por_producto(df):
+    if 'producto' not in df.columns:
+        return [df]
+    return [g.drop(columns='producto').reset_index(drop=True) for _, g in df.groupby('producto', observed=True)]
+
+
+def _figuras(serie):
+    fecha = serie['fecha'].iloc[len(serie) // 2]
+    figuras = [
+        figura_saldo(serie, fecha, ANCHO_OBJETIVO_PX),
+        figura_area(serie, 'mau_rem', '#A23B72', 'rgba(162, 59, 114, 0.2)', "MAU", ANCHO_OBJETIVO_PX),
+        figura_crecimiento(serie, fecha),
+        figura_periodos(resumen_periodos(CuboRollup(serie), 'M'), 'Mes'),
+    ]
+    # La serialización es lo que paga cada render al enviar la figura al navegador
+    return [f.to_json() for f in figuras]
+
+
+def _estilos(serie):
+    mayores, menores = top_dias(serie)
+    return [
+        mayores.style.format(FORMATOS_TABLA).to_html(),
+        menores.style.format(FORMATOS_TABLA).to_html(),
+        formatear_pagina(pagina(serie, 1, TAMANO_PAGINA), FORMATOS_TABLA).to_html(),
+    ]
+
+
+def etapas(escenario, directorio):
+    """(nombre, función sin argumentos) de cada etapa del pipeline para `escenario`
+
+    Las etapas posteriores a la carga trabajan sobre cada producto por separado, como
+    el dashboard sobre su única serie.
+    """
+    dataset = generar_dataset(escenario)
+    ruta_csv = os.path.join(directorio, f'{escenario.nombre}.csv')
+    ruta_snapshot = os.path.join(directorio, f'{escenario.nombre}.arrow')
+    dataset.to_csv(ruta_csv, index=False)
+    series = _por_producto(dataset)
+    base = [s[['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']] for s in series]
+    eventos = [eventos_sinteticos(s) for s in series]
+
+    lista = [
+        ('carga_csv', lambda: leer_snapshot(convertir_csv_a_snapshot(ruta_csv, ruta_snapshot))),
+    ]
+    if escenario.usuarios:
+        from fuentes import FuenteSQLLocal, crear_fixtures_locales
+
+        ruta_bd = os.path.join(directorio, f'{escenario.nombre}_u{escenario.usuarios}_d{escenario.dias_usuarios}.db')
+        if not os.path.exists(ruta_bd):
+            crear_fixtures_locales(ruta_bd, dias=escenario.dias_usuarios, usuarios=escenario.usuarios)
+        desde = date(2025, 1, 1)
+        hasta = desde + timedelta(days=escenario.dias_usuarios - 1)
+        lista.append(('carga_sql_local', lambda: FuenteSQLLocal(ruta_bd).cargar(desde, hasta)))
+    lista += [
+        ('metricas', lambda: [calcular_metricas(b) for b in base]),
+        ('rollup_mensual', lambda: [resumen_periodos(CuboRollup(s), 'M') for s in series]),
+        ('impacto', lambda: [IndiceImpacto(s).evaluar(e, (None,) + VENTANAS_DIAS) for s, e in zip(series, eventos)]),
+        ('top_dias', lambda: [top_dias(s) for s in series]),
+        ('anomalias', lambda: [detectar(s) for s in series]),
+        ('figuras', lambda: [_figuras(s) for s in series]),
+        ('estilos_tablas', lambda: [_estilos(s) for s in series]),
+    ]
+    return len(dataset), lista
+
+
+def medir(funcion, repeticiones=REPETICIONES):
+    """(mejor tiempo en segundos, pico de memoria asignada en bytes, crecimiento de RSS en bytes)
+
+    El tiempo se mide sin tracemalloc; la memoria en una corrida aparte, porque el
+    rastreo de asignaciones encarece cada llamada.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    gc.collect()
+    rss_inicial = rss_bytes() or 0
+    tracemalloc.start()
+    resultado = funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_final = rss_bytes() or 0
+    del resultado
+    return min(tiempos), pico, max(rss_final - rss_inicial, 0)
+
+
+def ejecutar_escenario(escenario, directorio, repeticiones=REPETICIONES):
+    filas, lista = etapas(escenario, directorio)
+    resultados = {}
+    for nombre, funcion in lista:
+        segundos, pico, rss = medir(funcion, repeticiones)
+        resultados[nombre] = {'segundos': segundos, 'memoria_mb': pico / 1e6, 'rss_mb': rss / 1e6}
+    return {'filas': filas, 'etapas': resultados}
+
+
+def medir_importacion(modulo):
+    """Segundos de importar `modulo` (con sus dependencias) en un intérprete nuevo, según -X importtime"""
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=DIRECTORIO_APP, capture_output=True, text=True,
+    )
+    if salida.returncode != 0:
+        return None
+    # La última línea es el módulo pedido, con el tiempo acumulado de todo lo que arrastró
+    acumulado = salida.stderr.strip().splitlines()[-1].split('|')[1]
+    return int(acumulado) / 1e6
+
+
+_PRIMER_RENDER = '''
+import sys, time, json
+sys.path.insert(0, {directorio!r})
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({ruta!r}, default_timeout=300)
+inicio = time.perf_counter()
+app.run()
+print(json.dumps({{'segundos': time.perf_counter() - inicio, 'errores': [str(e.value) for e in app.exception]}}))
+'''
+
+
+def medir_primer_render(directorio, ruta_app=os.path.join(DIRECTORIO_APP, 'app_analisis_rem.py')):
+    """Segundos del primer run de la app en un proceso nuevo, con `directorio` como directorio de trabajo
+
+    Es el primer render que ve un usuario tras un reinicio: incluye importar los módulos
+    de la app, cargar los datos y derivar lo que no venga precalculado.
+    """
+    codigo = _PRIMER_RENDER.format(directorio=DIRECTORIO_APP, ruta=ruta_app)
+    salida = subprocess.run([sys.executable, '-c', codigo], cwd=directorio, capture_output=True, text=True)
+    resultado = json.loads(salida.stdout.strip().splitlines()[-1])
+    if resultado['errores']:
+        raise RuntimeError(resultado['errores'][0])
+    return resultado['segundos']
+
+
+def medir_arranque(directorio, ruta_csv=RUTA_CSV):
+    """Importaciones en frío y primer render sin snapshot procesado (debe parsear y derivar) y con él"""
+    resultados = {f'importar_{m}': medir_importacion(m) for m in MODULOS_IMPORTACION}
+    trabajo = os.path.join(directorio, 'arranque')
+    shutil.rmtree(trabajo, ignore_errors=True)
+    os.makedirs(trabajo)
+    shutil.copy(os.path.join(DIRECTORIO_APP, ruta_csv), trabajo)
+    resultados['primer_render_desde_csv'] = medir_primer_render(trabajo)
+    resultados['primer_render_snapshot_procesado'] = medir_primer_render(trabajo)
+    return resultados
+
+
+def entorno():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'maquina': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def cargar_linea_base(ruta=RUTA_LINEA_BASE):
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta) as f:
+        return json.load(f)
+
+
+def guardar_linea_base(resultados, ruta=RUTA_LINEA_BASE):
+    """Reemplaza en la línea base los escenarios medidos; conserva los demás"""
+    linea_base = cargar_linea_base(ruta)
+    linea_base.setdefault('escenarios', {}).update(resultados)
+    linea_base['entorno'] = entorno()
+    with open(ruta, 'w') as f:
+        json.dump(linea_base, f, indent=2, sort_keys=True)
+
+
+def regresiones(resultados, linea_base, umbral=UMBRAL_REGRESION):
+    """Lista de (escenario, etapa, métrica, base, actual) que superan la línea base en más de `umbral`"""
+    encontradas = []
+    for nombre, resultado in resultados.items():
+        base = linea_base.get('escenarios', {}).get(nombre)
+        if base is None:
+            continue
+        for etapa, actual in resultado['etapas'].items():
+            previa = base['etapas'].get(etapa)
+            if previa is None:
+                continue
+            for metrica, minimo in (('segundos', MINIMO_SEGUNDOS), ('memoria_mb', 0.1)):
+                if actual[metrica] > max(previa[metrica], minimo) * (1 + umbral):
+                    encontradas.append((nombre, etapa, metrica, previa[metrica], actual[metrica]))
+    return encontradas
+
+
+def _imprimir(nombre, resultado, linea_base):
+    base = linea_base.get('escenarios', {}).get(nombre, {}).get('etapas', {})
+    print(f'\n{nombre}: {resultado["filas"]:,} filas')
+    for etapa, medida in resultado['etapas'].items():
+        previa = base.get(etapa)
+        cambio = f'  ({medida["segundos"] / previa["segundos"] - 1:+.0%} vs base)' if previa and previa['segundos'] else ''
+        print(f'  {etapa:<16} {medida["segundos"] * 1000:>10,.1f} ms  {medida["memoria_mb"]:>8,.1f} MB  '
+              f'(RSS +{medida["rss_mb"]:,.1f} MB){cambio}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark por etapa con datos sintéticos a escala')
+    parser.add_argument('--escenarios', nargs='*', choices=list(ESCENARIOS), default=['1a', '10a'])
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION, help='Fracción sobre la línea base que cuenta como regresión')
+    parser.add_argument('--linea-base', default=RUTA_LINEA_BASE)
+    parser.add_argument('--guardar', action='store_true', help='Guarda los resultados como nueva línea base')
+    parser.add_argument('--arranque', action='store_true', help='Mide importaciones en frío y tiempo al primer render')
+    parser.add_argument('--directorio', default=os.path.join(tempfile.gettempdir(), 'benchmark_rem'),
+                        help='Dónde se escriben los CSV, snapshots y bases SQLite sintéticos')
+    args = parser.parse_args()
+
+    os.makedirs(args.directorio, exist_ok=True)
+    linea_base = cargar_linea_base(args.linea_base)
+    if not linea_base and not args.guardar:
+        print(f'Sin línea base en {args.linea_base}: no se buscan regresiones (se crea con --guardar)')
+    resultados = {}
+    for nombre in args.escenarios:
+        resultados[nombre] = ejecutar_escenario(ESCENARIOS[nombre], args.directorio, args.repeticiones)
+        _imprimir(nombre, resultados[nombre], linea_base)
+
+    if args.arranque:
+        print('\narranque (procesos nuevos):')
+        arranque = medir_arranque(args.directorio)
+        base = linea_base.get('escenarios', {}).get('arranque', {}).get('etapas', {})
+        for nombre, segundos in arranque.items():
+            previa = base.get(nombre)
+            cambio = f'  ({segundos / previa["segundos"] - 1:+.0%} vs base)' if segundos and previa and previa['segundos'] else ''
+            print(f'  {nombre:<36} ' + (f'{segundos * 1000:>10,.1f} ms{cambio}' if segundos is not None else 'no instalado'))
+        # Se guarda y compara como un escenario más, sin memoria medida
+        resultados['arranque'] = {'etapas': {
+            nombre: {'segundos': segundos, 'memoria_mb': 0.0, 'rss_mb': 0.0}
+            for nombre, segundos in arranque.items() if segundos is not None
+        }}
+
+    encontradas = regresiones(resultados, linea_base, args.umbral)
+    for nombre, etapa, metrica, previa, actual in encontradas:
+        print(f'REGRESIÓN {nombre}/{etapa}: {metrica} {previa:,.4f} → {actual:,.4f}')
+    if args.guardar:
+        guardar_linea_base(resultados, args.linea_base)
+        print(f'\nLínea base guardada en {args.linea_base}')
+    sys.exit(1 if encontradas and not args.guardar else 0)
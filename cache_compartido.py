@@ -0,0 +1,141 @@
+"""Caché en disco compartida entre procesos y réplicas: datasets y métricas por versión, con refresco single-flight."""
+import contextlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin coordinación entre procesos
+    fcntl = None
+
+from instrumentacion import TELEMETRIA
+from snapshot import escribir_snapshot, leer_snapshot
+
+# Con varias réplicas debe apuntar a un volumen compartido que soporte flock
+DIRECTORIO_CACHE = os.environ.get('REM_CACHE_COMPARTIDO', '.cache_compartido')
+MAX_VERSIONES = 4
+
+
+def _mtime(ruta):
+    try:
+        return os.path.getmtime(ruta)
+    except FileNotFoundError:
+        return 0.0
+
+
+@contextlib.contextmanager
+def bloqueo_archivo(ruta):
+    """Lock exclusivo entre procesos sobre `ruta`; espera a que lo suelte quien lo tenga"""
+    with open(ruta, 'a') as archivo:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+class CacheCompartido:
+    """Datasets por espacio (p. ej. 'bigquery') y métricas derivadas por versión, en Arrow IPC
+
+    Cada espacio tiene un puntero `<espacio>.json` a su versión vigente. Los archivos de
+    datos nunca se reescriben: una versión nueva es un archivo nuevo y luego se mueve el
+    puntero, así que los lectores no necesitan lock.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_CACHE, max_versiones=MAX_VERSIONES):
+        self.directorio = directorio
+        self.max_versiones = max_versiones
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def puntero(self, espacio):
+        """Versión vigente del espacio: dict con version, momento y atributos, o None"""
+        ruta = self._ruta(f'{espacio}.json')
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta) as f:
+            return json.load(f)
+
+    def leer_dataset(self, espacio):
+        """(datos, momento) de la versión vigente del espacio, o None si no hay"""
+        puntero = self.puntero(espacio)
+        if puntero is None:
+            return None
+        ruta = self._ruta(f"dataset_{espacio}_{puntero['version']}.arrow")
+        try:
+            df = leer_snapshot(ruta)
+        except FileNotFoundError:
+            # Otro proceso la limpió entre leer el puntero y abrirla: cuenta como fallo
+            return None
+        df.attrs.update(puntero['atributos'])
+        return df, puntero['momento']
+
+    def publicar_dataset(self, espacio, df, momento=None):
+        """Escribe `df` como versión vigente del espacio; `df.attrs['version_datos']` es la clave"""
+        version = df.attrs['version_datos']
+        momento = momento or time.time()
+        ruta = self._ruta(f'dataset_{espacio}_{version}.arrow')
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            escribir_snapshot(df, ruta)
+        tmp = self._ruta(f'{espacio}.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': version, 'momento': momento, 'atributos': dict(df.attrs)}, f)
+        os.replace(tmp, self._ruta(f'{espacio}.json'))
+        self._limpiar(f'dataset_{espacio}_')
+        return momento
+
+    def obtener_o_refrescar(self, espacio, cargar, max_edad):
+        """(datos, momento) del espacio; si tiene más de `max_edad` segundos, un solo proceso llama a `cargar()`
+
+        Los demás esperan el lock y, al obtenerlo, encuentran la versión que publicó el primero.
+        """
+        with bloqueo_archivo(self._ruta(f'{espacio}.lock')):
+            puntero = self.puntero(espacio)
+            if puntero is not None and time.time() - puntero['momento'] < max_edad:
+                vigente = self.leer_dataset(espacio)
+                if vigente is not None:
+                    TELEMETRIA.registrar_cache(f'compartido_{espacio}', True)
+                    return vigente
+            TELEMETRIA.registrar_cache(f'compartido_{espacio}', False)
+            df = cargar()
+            return df, self.publicar_dataset(espacio, df)
+
+    def obtener_metricas(self, version, calcular):
+        """Métricas derivadas de `version`; sólo un proceso llama a `calcular()`, los demás leen su resultado"""
+        ruta = self._ruta(f'metricas_{version}.arrow')
+        try:
+            df = leer_snapshot(ruta)
+        except FileNotFoundError:
+            df = None
+        calculadas = False
+        if df is None:
+            # Bajo el lock nadie limpia las métricas, así que lo escrito se puede leer
+            with bloqueo_archivo(self._ruta('metricas.lock')):
+                if not os.path.exists(ruta):
+                    escribir_snapshot(calcular(), ruta)
+                    self._limpiar('metricas_')
+                    calculadas = True
+                df = leer_snapshot(ruta)
+        TELEMETRIA.registrar_cache('compartido_metricas', not calculadas)
+        return df
+
+    def _limpiar(self, prefijo):
+        """Borra las versiones más antiguas; otro proceso puede estar limpiando a la vez"""
+        archivos = sorted(
+            (self._ruta(nombre) for nombre in os.listdir(self.directorio)
+             if nombre.startswith(prefijo) and nombre.endswith('.arrow')),
+            key=_mtime
+        )
+        for ruta in archivos[:-self.max_versiones]:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,264 @@
+"""Constructor de la consulta diaria REM con fechas como parámetros, ingesta columnar y medición del costo de cada carga."""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from snapshot import tabla_a_dataframe
+
+PROJECT_ID = "tenpo-bi-prod"
+MAX_REGISTROS = 50
+
+
+@dataclass
+class ConsultaParametrizada:
+    """SQL con parámetros con nombre (@desde, @hasta) de tipo DATE"""
+    sql: str
+    parametros: dict
+
+    def configuracion(self):
+        """Configuración de job en formato REST (la que acepta pandas_gbq.read_gbq)"""
+        return {
+            'query': {
+                'parameterMode': 'NAMED',
+                'queryParameters': [
+                    {'name': nombre, 'parameterType': {'type': 'DATE'}, 'parameterValue': {'value': valor.isoformat()}}
+                    for nombre, valor in self.parametros.items()
+                ],
+            }
+        }
+
+    def parametros_bigquery(self):
+        """Parámetros como objetos de google-cloud-bigquery"""
+        from google.cloud import bigquery
+
+        return [bigquery.ScalarQueryParameter(nombre, 'DATE', valor) for nombre, valor in self.parametros.items()]
+
+
+@dataclass
+class EstadisticasCarga:
+    """Costo de una carga: bytes que BigQuery estima escanear (dry-run), tiempo de la consulta real
+    y memoria que ocupa el resultado ya convertido a DataFrame
+    """
+    desde: date
+    hasta: date
+    bytes_estimados: int
+    segundos: float
+    filas: int
+    momento: float
+    modo: str = 'arrow'
+    bytes_memoria: int = None
+
+
+_registro = deque(maxlen=MAX_REGISTROS)
+_lock_registro = threading.Lock()
+
+
+def registrar_carga(estadisticas):
+    with _lock_registro:
+        _registro.append(estadisticas)
+
+
+def historial_cargas():
+    """Estadísticas de las últimas cargas de este proceso, de la más reciente a la más antigua"""
+    with _lock_registro:
+        return list(reversed(_registro))
+
+
+# Tablas de origen en BigQuery y sus equivalentes en el motor SQL local
+TABLAS_BIGQUERY = {
+    'revenue': '`tenpo-bi-prod.kpitos.dataform_revenue_app`',
+    'cohortes': '`tenpo-bi-prod.kpitos.cohorts_cuenta_rem`',
+    'pagos': '`business-data-raw.ingestor_paid_account_public.interest_payment`',
+}
+TABLAS_LOCALES = {
+    'revenue': 'dataform_revenue_app',
+    'cohortes': 'cohorts_cuenta_rem',
+    'pagos': 'interest_payment',
+}
+
+_DIALECTOS = {
+    'bigquery': {
+        'tablas': TABLAS_BIGQUERY,
+        'hoy_menos_2': 'DATE_SUB(CURRENT_DATE(), INTERVAL 2 DAY)',
+        'mes': 'EXTRACT(YEAR FROM fecha), EXTRACT(MONTH FROM fecha)',
+        'dias_desde': 'DATE_DIFF(i.date, @desde, DAY)',
+        'mes_entero': "CAST(FORMAT_DATE('%Y%m', MIN(fecha)) AS INT64)",
+    },
+    'sqlite': {
+        'tablas': TABLAS_LOCALES,
+        'hoy_menos_2': "date('now', '-2 day')",
+        'mes': "strftime('%Y-%m', fecha)",
+        'dias_desde': 'CAST(julianday(i.date) - julianday(@desde) AS INTEGER)',
+        'mes_entero': "CAST(strftime('%Y%m', MIN(fecha)) AS INTEGER)",
+    },
+}
+
+
+def _deduplicado(dialecto, tabla):
+    """Última versión de cada (date, user_id) dentro del rango; SQLite no soporta QUALIFY"""
+    orden = 'ROW_NUMBER() OVER(PARTITION BY date, user_id ORDER BY updated_at DESC)'
+    if dialecto == 'bigquery':
+        return f"""SELECT * FROM {tabla}
+      WHERE date BETWEEN @desde AND @hasta
+      QUALIFY {orden} = 1"""
+    return f"""SELECT * FROM (
+        SELECT *, {orden} AS rn FROM {tabla}
+        WHERE date BETWEEN @desde AND @hasta
+      ) WHERE rn = 1"""
+
+
+def construir_consulta_diaria(desde, hasta=None, dialecto='bigquery'):
+    """Serie diaria (fecha, saldo_rem, mau_rem, dau_rem) en [desde, hasta]
+
+    Las fechas van en todos los CTE, incluido el deduplicado de interest_payment y el
+    join con dataform_revenue_app, para que BigQuery pode particiones antes de escanear.
+    Con dialecto 'sqlite' se genera la misma lógica para las tablas locales.
+    """
+    hasta = hasta or date.today() - timedelta(days=2)
+    d = _DIALECTOS[dialecto]
+    tablas = d['tablas']
+    sql = f"""
+    WITH base_revenue AS (
+      SELECT fecha, user, SUM(revenue) * 1000000 AS revenue_servicios
+      FROM {tablas['revenue']}
+      WHERE tipo = 'revenue_servicios' AND fecha BETWEEN @desde AND @hasta
+      GROUP BY 1,2
+    ),
+    base_mau_rem AS (
+      SELECT fecha, COUNT(DISTINCT user) AS mau_rem
+      FROM {tablas['cohortes']}
+      WHERE fecha BETWEEN @desde AND @hasta
+      GROUP BY 1
+    ),
+    base_limpia AS (
+      {_deduplicado(dialecto, tablas['pagos'])}
+    ),
+    diario AS (
+      SELECT
+        i.date AS fecha,
+        SUM(i.user_balance) AS saldo_rem,
+        IFNULL(m.mau_rem, 0) AS mau_rem,
+        COUNT(DISTINCT i.user_id) AS dau_rem
+      FROM base_limpia i
+      LEFT JOIN base_revenue r ON i.user_id = r.user AND i.date = r.fecha
+      LEFT JOIN base_mau_rem m ON i.date = m.fecha
+      WHERE i.status = 'SUCCEEDED'
+        AND i.date <= {d['hoy_menos_2']}
+      GROUP BY 1, 3
+    )
+    SELECT
+      fecha,
+      saldo_rem/1000000.0 AS saldo_rem,
+      SUM(mau_rem) OVER (PARTITION BY {d['mes']} ORDER BY fecha ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS mau_rem,
+      dau_rem
+    FROM diario
+    """
+    return ConsultaParametrizada(sql, {'desde': desde, 'hasta': hasta})
+
+
+def construir_consulta_usuarios(desde, hasta=None, dialecto='bigquery'):
+    """Filas por (día, usuario) con pago exitoso: saldo y si tuvo revenue_servicios ese día
+
+    `dia` es el número de días desde `desde`. Ordenadas por fecha. Todas las tablas se
+    filtran por [desde, hasta]; la cohorte sale de `construir_consulta_cohortes`, una sola
+    vez por agregación, para no escanear la historia de cohortes en cada tramo.
+    """
+    hasta = hasta or date.today() - timedelta(days=2)
+    d = _DIALECTOS[dialecto]
+    tablas = d['tablas']
+    sql = f"""
+    WITH base_limpia AS (
+      {_deduplicado(dialecto, tablas['pagos'])}
+    ),
+    con_revenue AS (
+      SELECT DISTINCT fecha, user
+      FROM {tablas['revenue']}
+      WHERE tipo = 'revenue_servicios' AND fecha BETWEEN @desde AND @hasta
+    )
+    SELECT
+      {d['dias_desde']} AS dia,
+      i.user_id,
+      i.user_balance AS saldo,
+      CASE WHEN r.user IS NULL THEN 0 ELSE 1 END AS con_revenue
+    FROM base_limpia i
+    LEFT JOIN con_revenue r ON i.user_id = r.user AND i.date = r.fecha
+    WHERE i.status = 'SUCCEEDED'
+      AND i.date <= {d['hoy_menos_2']}
+    ORDER BY i.date
+    """
+    return ConsultaParametrizada(sql, {'desde': desde, 'hasta': hasta})
+
+
+def construir_consulta_cohortes(desde, hasta=None, dialecto='bigquery'):
+    """Mes de cohorte de cada usuario (primer mes en cohorts_cuenta_rem entre `desde` y `hasta`) como entero YYYYMM"""
+    hasta = hasta or date.today() - timedelta(days=2)
+    d = _DIALECTOS[dialecto]
+    sql = f"""
+    SELECT user, {d['mes_entero']} AS cohorte
+    FROM {d['tablas']['cohortes']}
+    WHERE fecha BETWEEN @desde AND @hasta
+    GROUP BY user
+    """
+    return ConsultaParametrizada(sql, {'desde': desde, 'hasta': hasta})
+
+
+def estimar_bytes(consulta, project_id=PROJECT_ID):
+    """Bytes que escanearía la consulta, según un dry-run de BigQuery (no tiene costo)"""
+    from google.cloud import bigquery
+
+    cliente = bigquery.Client(project=project_id)
+    config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=consulta.parametros_bigquery()
+    )
+    return cliente.query(consulta.sql, job_config=config).total_bytes_processed
+
+
+def leer_arrow(consulta, project_id=PROJECT_ID):
+    """Resultado de la consulta como tabla Arrow, descargado en streams columnares con la Storage Read API"""
+    from google.cloud import bigquery
+
+    cliente = bigquery.Client(project=project_id)
+    config = bigquery.QueryJobConfig(query_parameters=consulta.parametros_bigquery())
+    return cliente.query(consulta.sql, job_config=config).to_arrow(create_bqstorage_client=True)
+
+
+def registrar_ingesta(consulta, df, inicio, modo, bytes_estimados=None):
+    """Registra tiempo, filas y memoria del DataFrame resultante de una carga que empezó en `inicio`"""
+    registrar_carga(EstadisticasCarga(
+        desde=consulta.parametros['desde'],
+        hasta=consulta.parametros['hasta'],
+        bytes_estimados=bytes_estimados,
+        segundos=time.perf_counter() - inicio,
+        filas=len(df),
+        momento=time.time(),
+        modo=modo,
+        bytes_memoria=int(df.memory_usage(deep=True).sum()),
+    ))
+
+
+def ejecutar_consulta(consulta, project_id=PROJECT_ID, dry_run=True, arrow=True):
+    """Ejecuta la consulta y registra bytes estimados, tiempo transcurrido y memoria del resultado
+
+    Con `arrow` el resultado llega como tabla Arrow y se convierte directo a los tipos compactos
+    del snapshot (fecha datetime64, enteros int32). Sin `arrow` se usa la ruta REST de
+    pandas_gbq, fila a fila y con tipos genéricos; queda como referencia para comparar.
+    """
+    bytes_estimados = estimar_bytes(consulta, project_id) if dry_run else None
+    inicio = time.perf_counter()
+    if arrow:
+        df = tabla_a_dataframe(leer_arrow(consulta, project_id))
+    else:
+        import pandas_gbq
+
+        df = pandas_gbq.read_gbq(
+            consulta.sql,
+            project_id=project_id,
+            configuration=consulta.configuracion(),
+            use_bqstorage_api=False
+        )
+    registrar_ingesta(consulta, df, inicio, 'arrow' if arrow else 'rest', bytes_estimados)
+    return df
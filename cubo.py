@@ -0,0 +1,149 @@
+"""Cubo de agregados por período (día/semana/mes/trimestre) construido una vez por versión de datos."""
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from instrumentacion import TELEMETRIA
+from metricas import COLUMNAS_EXTREMOS_MES
+
+GRANULARIDADES = {
+    'D': 'Día',
+    'W': 'Semana',
+    'M': 'Mes',
+    'Q': 'Trimestre',
+}
+METRICAS_CUBO = ['saldo_rem', 'mau_rem', 'dau_rem']
+COLUMNA_CRECIMIENTO_DIARIO = 'saldo_crecimiento_absoluto_diario'
+
+
+def _agregar_parcial(datos, granularidad):
+    """Agregados combinables (first/last/sum/count) por período
+
+    Si los datos traen el saldo inicial y final de cada mes calculado en el warehouse,
+    el nivel mensual los toma de ahí en vez de recalcularlos.
+    """
+    periodo = datos['fecha'].dt.to_period(granularidad).rename('periodo')
+    grupos = datos.groupby(periodo, sort=True)
+    extremos_warehouse = granularidad == 'M' and all(c in datos.columns for c in COLUMNAS_EXTREMOS_MES)
+    partes = []
+    for col in METRICAS_CUBO + [COLUMNA_CRECIMIENTO_DIARIO]:
+        funciones = ['sum', 'count'] if extremos_warehouse and col == 'saldo_rem' else ['first', 'last', 'sum', 'count']
+        agregados = grupos[col].agg(funciones)
+        agregados.columns = [f'{col}_{agg}' for agg in agregados.columns]
+        partes.append(agregados)
+    parcial = pd.concat(partes, axis=1)
+    if extremos_warehouse:
+        extremos = grupos[COLUMNAS_EXTREMOS_MES].last()
+        parcial['saldo_rem_first'] = extremos['saldo_inicial_mes']
+        parcial['saldo_rem_last'] = extremos['saldo_final_mes']
+    parcial['dias'] = grupos.size()
+    return parcial
+
+
+def _completar(nivel):
+    """Deriva promedio y crecimiento a partir de los agregados combinables"""
+    for col in METRICAS_CUBO + [COLUMNA_CRECIMIENTO_DIARIO]:
+        nivel[f'{col}_mean'] = nivel[f'{col}_sum'] / nivel[f'{col}_count']
+    for col in METRICAS_CUBO:
+        nivel[f'{col}_crecimiento'] = nivel[f'{col}_last'] - nivel[f'{col}_first']
+        nivel[f'{col}_crecimiento_pct'] = ((nivel[f'{col}_last'] / nivel[f'{col}_first']) - 1) * 100
+    return nivel
+
+
+def _combinar(viejo, nuevo):
+    """Une los agregados de un mismo período repartido entre datos viejos y nuevos"""
+    combinado = viejo.copy()
+    for col in METRICAS_CUBO + [COLUMNA_CRECIMIENTO_DIARIO]:
+        combinado[f'{col}_last'] = nuevo[f'{col}_last'].fillna(viejo[f'{col}_last'])
+        combinado[f'{col}_sum'] = viejo[f'{col}_sum'] + nuevo[f'{col}_sum']
+        combinado[f'{col}_count'] = viejo[f'{col}_count'] + nuevo[f'{col}_count']
+    combinado['dias'] = viejo['dias'] + nuevo['dias']
+    return combinado
+
+
+class CuboRollup:
+    """Agregados de saldo/MAU/DAU por granularidad, indexados por período para consultas por rango"""
+
+    def __init__(self, datos, version=None, granularidades=tuple(GRANULARIDADES)):
+        self.version = version
+        self.niveles = {g: _completar(_agregar_parcial(datos, g)) for g in granularidades}
+
+    def consultar(self, granularidad, desde=None, hasta=None):
+        """Períodos de `granularidad` que tocan [desde, hasta]; es un slice por búsqueda binaria"""
+        nivel = self.niveles[granularidad]
+        inicio = 0 if desde is None else nivel.index.searchsorted(pd.Period(desde, freq=granularidad), side='left')
+        fin = len(nivel) if hasta is None else nivel.index.searchsorted(pd.Period(hasta, freq=granularidad), side='right')
+        return nivel.iloc[inicio:fin]
+
+    def extender(self, nuevas, version=None):
+        """Cubo nuevo con días posteriores a los ya agregados, recalculando sólo los períodos afectados
+
+        El cubo original no se modifica: puede seguir sirviendo a quien lea su versión.
+        """
+        extendido = CuboRollup.__new__(CuboRollup)
+        extendido.version = version
+        extendido.niveles = {}
+        for granularidad, nivel in self.niveles.items():
+            parcial = _agregar_parcial(nuevas, granularidad)
+            comunes = parcial.index.intersection(nivel.index)
+            combinados = _combinar(nivel.loc[comunes], parcial.loc[comunes])
+            columnas = parcial.columns
+            nivel = pd.concat([
+                nivel.drop(comunes)[columnas],
+                combinados[columnas],
+                parcial.drop(comunes),
+            ]).sort_index()
+            extendido.niveles[granularidad] = _completar(nivel)
+        return extendido
+
+
+class CacheCubos:
+    """LRU acotado de cubos por versión de datos; una versión que sólo agrega días extiende el cubo anterior"""
+
+    def __init__(self, max_entradas=4):
+        self.max_entradas = max_entradas
+        self._cubos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, version, datos, anterior=None, agregadas=None):
+        """Cubo de `datos`; si `anterior` está en caché se extiende con las filas `agregadas`"""
+        with self._lock:
+            cubo = self._cubos.get(version)
+            if cubo is not None:
+                self._cubos.move_to_end(version)
+            base = self._cubos.get(anterior) if agregadas is not None else None
+        TELEMETRIA.registrar_cache('cubo', cubo is not None)
+        if cubo is not None:
+            return cubo
+
+        if base is not None:
+            with TELEMETRIA.etapa('cubo_incremental', filas=len(agregadas)):
+                cubo = base.extender(agregadas, version)
+        else:
+            with TELEMETRIA.etapa('cubo', filas=len(datos)):
+                cubo = CuboRollup(datos, version)
+        with self._lock:
+            self._cubos[version] = cubo
+            while len(self._cubos) > self.max_entradas:
+                self._cubos.popitem(last=False)
+        return cubo
+
+
+def resumen_periodos(cubo, granularidad, desde=None, hasta=None):
+    """Tabla resumen del saldo por período en el formato del análisis mensual"""
+    nivel = cubo.consultar(granularidad, desde, hasta)
+    resumen = pd.DataFrame({
+        'Saldo_Inicial': nivel['saldo_rem_first'],
+        'Saldo_Final': nivel['saldo_rem_last'],
+        'Saldo_Promedio': nivel['saldo_rem_mean'],
+        'Crecimiento_Diario_Promedio': nivel[f'{COLUMNA_CRECIMIENTO_DIARIO}_mean'],
+    }).round(2)
+    resumen['Crecimiento_Total'] = resumen['Saldo_Final'] - resumen['Saldo_Inicial']
+    resumen['Crecimiento_Pct'] = ((resumen['Saldo_Final'] / resumen['Saldo_Inicial']) - 1) * 100
+    if granularidad == 'W':
+        etiquetas = nivel.index.start_time.strftime('%Y-%m-%d')
+    else:
+        etiquetas = nivel.index.astype(str)
+    resumen.index = pd.Index(etiquetas, name='periodo')
+    return resumen.reset_index()
@@ -0,0 +1,126 @@
+"""Registro de eventos (cambios de tasa, campañas) y cálculo vectorizado de su impacto con sumas prefijas."""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+RUTA_EVENTOS = 'eventos.csv'
+VENTANAS_DIAS = (7, 14, 30)
+TIPOS_EVENTO = ('tasa', 'campaña', 'producto', 'otro')
+MESES_CORTOS = ('ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic')
+
+
+@dataclass(frozen=True)
+class Evento:
+    fecha: pd.Timestamp
+    nombre: str
+    tipo: str = 'tasa'
+
+
+EVENTO_PRINCIPAL = Evento(pd.Timestamp('2025-12-21'), 'Reducción de Tasa', 'tasa')
+EVENTOS_BASE = (EVENTO_PRINCIPAL,)
+
+
+def cargar_eventos(ruta=RUTA_EVENTOS):
+    """Eventos base más los de `ruta` (CSV con fecha, nombre y opcionalmente tipo), ordenados por fecha"""
+    eventos = list(EVENTOS_BASE)
+    if os.path.exists(ruta):
+        tabla = pd.read_csv(ruta, parse_dates=['fecha'])
+        for fila in tabla.itertuples(index=False):
+            eventos.append(Evento(pd.Timestamp(fila.fecha), fila.nombre, getattr(fila, 'tipo', 'otro')))
+    return tuple(sorted(set(eventos), key=lambda e: e.fecha))
+
+
+def etiqueta_fecha(fecha):
+    """'21-dic' para el 21 de diciembre"""
+    return f'{fecha.day}-{MESES_CORTOS[fecha.month - 1]}'
+
+
+def _suma_prefija(valores):
+    """(sumas, conteos) acumulados ignorando NaN, con un 0 inicial: la suma de [i, j) es s[j] - s[i]"""
+    validos = ~np.isnan(valores)
+    sumas = np.concatenate([[0.0], np.cumsum(np.where(validos, valores, 0.0))])
+    conteos = np.concatenate([[0], np.cumsum(validos)])
+    return sumas, conteos
+
+
+class IndiceImpacto:
+    """Sumas prefijas del crecimiento diario; cada par (evento, ventana) se evalúa en O(1)
+
+    Para un evento en la fecha F y una ventana de W días, "antes" son los días [F - W, F)
+    y "después" los días [F, F + W). Con `ventana=None` se toma todo el período a cada lado.
+    """
+
+    def __init__(self, datos, version=None):
+        self.version = version
+        self.fechas = datos['fecha'].to_numpy()
+        self.saldo = datos['saldo_rem'].to_numpy(dtype=float)
+        self._abs = _suma_prefija(datos['saldo_crecimiento_absoluto_diario'].to_numpy(dtype=float))
+        self._pct = _suma_prefija(datos['saldo_crecimiento_pct_diario'].to_numpy(dtype=float))
+
+    def _posiciones(self, fechas):
+        return np.searchsorted(self.fechas, np.asarray(fechas, dtype='datetime64[ns]').astype(self.fechas.dtype), side='left')
+
+    @staticmethod
+    def _media(prefijas, i, j):
+        sumas, conteos = prefijas
+        n = conteos[j] - conteos[i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 0, (sumas[j] - sumas[i]) / np.maximum(n, 1), np.nan)
+
+    def _crecimiento(self, i, j):
+        """Crecimiento % del saldo entre la primera y la última fila de [i, j)"""
+        hay_filas = j > i
+        if len(self.saldo) == 0:
+            return np.full(np.shape(hay_filas), np.nan)
+        inicial = self.saldo[np.where(hay_filas, i, 0)]
+        final = self.saldo[np.where(hay_filas, j - 1, 0)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(hay_filas & (inicial > 0), (final / inicial - 1) * 100, np.nan)
+
+    def _saldo_en(self, posiciones, hay_filas):
+        return np.where(hay_filas, self.saldo[np.clip(posiciones, 0, len(self.saldo) - 1)], np.nan)
+
+    def evaluar(self, eventos, ventanas=VENTANAS_DIAS):
+        """Tabla con una fila por (evento, ventana): velocidades, tasas y crecimiento antes/después y sus cambios"""
+        if not eventos or not ventanas:
+            return pd.DataFrame()
+        fechas_eventos = np.array([e.fecha for e in eventos], dtype='datetime64[ns]')
+        dias = np.array([w if w is not None else -1 for w in ventanas])
+
+        # Matrices (evento, ventana) de límites: [inicio, centro) antes y [centro, fin) después
+        centro = np.broadcast_to(self._posiciones(fechas_eventos)[:, None], (len(eventos), len(ventanas)))
+        desplazamiento = dias.astype('timedelta64[D]')
+        inicio = np.where(dias < 0, 0, self._posiciones((fechas_eventos[:, None] - desplazamiento).ravel()).reshape(centro.shape))
+        fin = np.where(dias < 0, len(self.fechas),
+                       self._posiciones((fechas_eventos[:, None] + desplazamiento).ravel()).reshape(centro.shape))
+
+        velocidad_antes = self._media(self._abs, inicio, centro)
+        velocidad_despues = self._media(self._abs, centro, fin)
+        tasa_antes = self._media(self._pct, inicio, centro)
+        tasa_despues = self._media(self._pct, centro, fin)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cambio_velocidad_pct = (tasa_despues / tasa_antes - 1) * 100
+
+        return pd.DataFrame({
+            'evento': np.repeat([e.nombre for e in eventos], len(ventanas)),
+            'fecha': np.repeat(fechas_eventos, len(ventanas)),
+            'tipo': np.repeat([e.tipo for e in eventos], len(ventanas)),
+            'ventana_dias': np.tile([w if w is not None else 0 for w in ventanas], len(eventos)),
+            'dias_antes': (centro - inicio).ravel(),
+            'dias_despues': (fin - centro).ravel(),
+            'velocidad_antes': velocidad_antes.ravel(),
+            'velocidad_despues': velocidad_despues.ravel(),
+            'cambio_velocidad': (velocidad_despues - velocidad_antes).ravel(),
+            'tasa_antes': tasa_antes.ravel(),
+            'tasa_despues': tasa_despues.ravel(),
+            'cambio_tasa_pp': (tasa_despues - tasa_antes).ravel(),
+            'cambio_velocidad_pct': cambio_velocidad_pct.ravel(),
+            'crecimiento_antes': self._crecimiento(inicio, centro).ravel(),
+            'crecimiento_despues': self._crecimiento(centro, fin).ravel(),
+            'saldo_inicial_antes': self._saldo_en(inicio, centro > inicio).ravel(),
+            'saldo_final_antes': self._saldo_en(centro - 1, centro > inicio).ravel(),
+            'saldo_inicial_despues': self._saldo_en(centro, fin > centro).ravel(),
+            'saldo_final_despues': self._saldo_en(fin - 1, fin > centro).ravel(),
+        })
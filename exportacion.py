@@ -0,0 +1,87 @@
+"""Exportación diferida de datos a CSV/Parquet, escrita por bloques y cacheada en disco."""
+import os
+import threading
+
+import pyarrow.parquet as pq
+
+from snapshot import a_tabla_arrow, esquema_para
+
+DIRECTORIO_EXPORTACIONES = '.exportaciones'
+TAMANO_CHUNK = 50000
+MAX_ARCHIVOS = 20
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Contenido exportable: columnas derivadas completas o sólo el detalle diario crudo
+DETALLES = {
+    'derivadas': 'Métricas derivadas',
+    'diario': 'Detalle diario crudo',
+}
+COLUMNAS_DETALLE_DIARIO = ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']
+
+
+def escribir_csv_por_chunks(df, archivo, tamano_chunk=TAMANO_CHUNK):
+    """Escribe `df` como CSV en bloques de `tamano_chunk` filas"""
+    for inicio in range(0, max(len(df), 1), tamano_chunk):
+        bloque = df.iloc[inicio:inicio + tamano_chunk]
+        archivo.write(bloque.to_csv(index=False, header=(inicio == 0)).encode('utf-8'))
+
+
+def escribir_parquet_por_chunks(df, ruta, tamano_chunk=TAMANO_CHUNK):
+    """Escribe `df` como Parquet (zstd), un row group por bloque, con el esquema compacto del snapshot"""
+    esquema = esquema_para(df)
+    with pq.ParquetWriter(ruta, esquema, compression='zstd') as writer:
+        for inicio in range(0, len(df), tamano_chunk):
+            writer.write_table(a_tabla_arrow(df.iloc[inicio:inicio + tamano_chunk]).cast(esquema))
+
+
+def _mtime(ruta):
+    try:
+        return os.path.getmtime(ruta)
+    except FileNotFoundError:
+        return 0.0
+
+
+def _limpiar(directorio, max_archivos=MAX_ARCHIVOS):
+    """Borra las exportaciones más antiguas; otra sesión puede estar limpiando a la vez"""
+    archivos = sorted(
+        (os.path.join(directorio, nombre) for nombre in os.listdir(directorio) if not nombre.endswith('.tmp')),
+        key=_mtime
+    )
+    for ruta in archivos[:-max_archivos]:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def generar_exportacion(df, version, inicio, fin, formato='csv', detalle='derivadas',
+                        directorio=DIRECTORIO_EXPORTACIONES, tamano_chunk=TAMANO_CHUNK):
+    """Ruta del archivo exportado para (versión, rango, formato, detalle); sólo lo genera si no existe
+
+    Cada escritura usa un temporal propio del proceso e hilo y se publica con os.replace, así
+    que dos sesiones exportando el mismo rango nunca comparten archivo a medio escribir.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f'datos_rem_{version}_{inicio}_{fin}_{detalle}.{formato}')
+    try:
+        # Al reutilizarla pasa a ser la más reciente, para que _limpiar no la borre antes de servirla
+        os.utime(ruta)
+        return ruta
+    except FileNotFoundError:
+        pass
+
+    if detalle == 'diario':
+        df = df[COLUMNAS_DETALLE_DIARIO]
+    tmp = f'{ruta}.{os.getpid()}-{threading.get_ident()}.tmp'
+    if formato == 'parquet':
+        escribir_parquet_por_chunks(df, tmp, tamano_chunk)
+    else:
+        with open(tmp, 'wb') as archivo:
+            escribir_csv_por_chunks(df, archivo, tamano_chunk)
+    os.replace(tmp, ruta)
+    _limpiar(directorio)
+    return ruta
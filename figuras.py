@@ -0,0 +1,309 @@
+"""Construcción de los gráficos Plotly del dashboard y caché de las figuras por versión de datos."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+from instrumentacion import TELEMETRIA
+from muestreo import UMBRAL_WEBGL, reducir_serie
+from tablas import recortar_rango
+
+COLOR_POSITIVO = '#28a745'
+COLOR_NEGATIVO = '#dc3545'
+COLOR_ANTES = '#2E86AB'
+COLOR_DESPUES = '#F18F01'
+COLOR_CAMBIO = '#7B2CBF'
+
+
+def _colores_signo(valores):
+    return np.where(np.asarray(valores, dtype=float) > 0, COLOR_POSITIVO, COLOR_NEGATIVO)
+
+
+def traza_serie(df, columna, max_puntos=None, **kwargs):
+    """Traza de línea reducida a `max_puntos`; usa WebGL si aún quedan más de UMBRAL_WEBGL puntos"""
+    x, y = reducir_serie(df['fecha'].to_numpy(), df[columna].to_numpy(), max_puntos)
+    clase = go.Scattergl if len(x) > UMBRAL_WEBGL else go.Scatter
+    return clase(x=x, y=y, **kwargs)
+
+
+def marcar_cambios(fig, df, columna, cambios):
+    """Líneas punteadas en las fechas de cambio de régimen y un marcador por cambio con su valor en `columna`"""
+    if not cambios or df.empty:
+        return fig
+    fechas_df = df['fecha'].to_numpy(dtype='datetime64[ns]')
+    fechas = np.array(cambios, dtype='datetime64[ns]')
+    # Sólo los cambios dentro del rango visible de `df`
+    posiciones = np.minimum(np.searchsorted(fechas_df, fechas), len(fechas_df) - 1)
+    visibles = fechas_df[posiciones] == fechas
+    fechas, posiciones = fechas[visibles], posiciones[visibles]
+    if len(fechas) == 0:
+        return fig
+    # Shapes en un solo update: add_vline por cambio es lento con muchos cambios
+    fig.update_layout(shapes=list(fig.layout.shapes) + [
+        dict(type='line', xref='x', yref='paper', x0=f, x1=f, y0=0, y1=1,
+             line=dict(color=COLOR_CAMBIO, width=1, dash='dot'))
+        for f in fechas.astype('datetime64[ms]').tolist()
+    ])
+    fig.add_trace(go.Scatter(
+        x=fechas,
+        y=df[columna].to_numpy()[posiciones],
+        mode='markers',
+        name='Cambio de régimen',
+        marker=dict(color=COLOR_CAMBIO, size=9, symbol='diamond'),
+        hovertemplate='Cambio de régimen %{x|%d-%m-%Y}<extra></extra>'
+    ))
+    return fig
+
+
+def figura_saldo(df, fecha_evento, max_puntos=None, rango=None, cambios=()):
+    """Evolución del saldo con media móvil 7d, marca del evento y cambios de régimen detectados"""
+    df = recortar_rango(df, rango)
+    fig = go.Figure()
+
+    fig.add_trace(traza_serie(
+        df,
+        'saldo_rem',
+        max_puntos,
+        mode='lines',
+        name='Saldo REM',
+        line=dict(color='#2E86AB', width=2),
+        fill='tozeroy',
+        fillcolor='rgba(46, 134, 171, 0.2)'
+    ))
+
+    fig.add_trace(traza_serie(
+        df,
+        'saldo_ma7',
+        max_puntos,
+        mode='lines',
+        name='Media Móvil 7d',
+        line=dict(color='#F18F01', width=2, dash='dash')
+    ))
+
+    # Línea vertical para reducción de tasa
+    fig.add_vline(
+        x=fecha_evento.timestamp() * 1000,
+        line_dash="dash",
+        line_color="red",
+        annotation_text="Reducción de Tasa",
+        annotation_position="top"
+    )
+
+    fig.update_layout(
+        height=500,
+        hovermode='x unified',
+        xaxis_title="Fecha",
+        yaxis_title="Saldo (Millones CLP)",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return marcar_cambios(fig, df, 'saldo_rem', cambios)
+
+
+def figura_area(df, columna, color, relleno, titulo_y, max_puntos=None, rango=None, cambios=()):
+    """Serie diaria simple rellena hasta cero (MAU, engagement), con cambios de régimen opcionales"""
+    df = recortar_rango(df, rango)
+    fig = go.Figure()
+    fig.add_trace(traza_serie(
+        df,
+        columna,
+        max_puntos,
+        mode='lines',
+        fill='tozeroy',
+        line=dict(color=color, width=2),
+        fillcolor=relleno
+    ))
+    fig.update_layout(height=300, xaxis_title="Fecha", yaxis_title=titulo_y, showlegend=bool(cambios))
+    return marcar_cambios(fig, df, columna, cambios)
+
+
+def figura_crecimiento(df, fecha_evento, cambios=()):
+    """Crecimiento diario absoluto en barras con media móvil 7d y cambios de régimen del saldo"""
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=df['fecha'],
+        y=df['saldo_crecimiento_absoluto_diario'],
+        marker_color=_colores_signo(df['saldo_crecimiento_absoluto_diario']),
+        name='Crecimiento Diario',
+        opacity=0.6
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=df['fecha'],
+        y=df['saldo_crecimiento_absoluto_diario_ma7'],
+        mode='lines',
+        name='Media Móvil 7d',
+        line=dict(color='black', width=2)
+    ))
+
+    fig.add_vline(
+        x=fecha_evento.timestamp() * 1000,
+        line_dash="dash",
+        line_color="red",
+        annotation_text="Reducción de Tasa"
+    )
+
+    fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
+
+    fig.update_layout(
+        height=400,
+        xaxis_title="Fecha",
+        yaxis_title="Cambio Diario (Millones CLP)",
+        hovermode='x unified'
+    )
+    return marcar_cambios(fig, df, 'saldo_crecimiento_absoluto_diario_ma7', cambios)
+
+
+def figura_periodos(resumen, nombre_periodo):
+    """Crecimiento total por período en barras"""
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=resumen['periodo'],
+        y=resumen['Crecimiento_Total'],
+        marker_color=_colores_signo(resumen['Crecimiento_Total']),
+        text=resumen['Crecimiento_Total'].round(0),
+        texttemplate='%{text:,.0f}M',
+        textposition='outside'
+    ))
+
+    fig.update_layout(
+        height=400,
+        xaxis_title=nombre_periodo,
+        yaxis_title=f"Crecimiento por {nombre_periodo} (Millones CLP)",
+        showlegend=False
+    )
+    return fig
+
+
+def figura_comparacion(velocidad_antes, velocidad_despues, etiqueta='21-dic'):
+    """Velocidad diaria promedio antes y después del evento"""
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=[f'Antes {etiqueta}', f'Después {etiqueta}'],
+        y=[velocidad_antes, velocidad_despues],
+        marker_color=[COLOR_ANTES, COLOR_DESPUES],
+        text=[f'${velocidad_antes:,.0f}M', f'${velocidad_despues:,.0f}M'],
+        textposition='outside',
+        textfont=dict(size=14, color='black', family='Arial Black')
+    ))
+
+    fig.update_layout(
+        title="Velocidad Promedio de Crecimiento Diario",
+        yaxis_title="Crecimiento Diario Promedio (Millones CLP)",
+        height=400,
+        showlegend=False
+    )
+    return fig
+
+
+def figura_ventana(ventana, fecha_evento, dias, nombre_evento='Reducción de Tasa'):
+    """Crecimiento diario en la ventana de ±`dias` alrededor del evento"""
+    fig = go.Figure()
+
+    colores = np.where(ventana['fecha'].to_numpy() < np.datetime64(fecha_evento), COLOR_ANTES, COLOR_DESPUES)
+
+    fig.add_trace(go.Bar(
+        x=ventana['fecha'],
+        y=ventana['saldo_crecimiento_absoluto_diario'],
+        marker_color=colores,
+        text=ventana['saldo_crecimiento_absoluto_diario'].round(0),
+        texttemplate='%{text:+,.0f}M',
+        textposition='outside'
+    ))
+
+    fig.add_vline(
+        x=fecha_evento.timestamp() * 1000,
+        line_dash="dash",
+        line_color="red",
+        line_width=3,
+        annotation_text=nombre_evento.upper(),
+        annotation_position="top"
+    )
+
+    fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
+
+    fig.update_layout(
+        title=f"Crecimiento Diario: {dias} días antes y después",
+        xaxis_title="Fecha",
+        yaxis_title="Cambio Diario (Millones CLP)",
+        height=400
+    )
+    return fig
+
+
+def figura_impacto_eventos(comparacion, eventos, ventanas):
+    """Cambio de velocidad diaria por evento, una serie de barras por ventana"""
+    fig = go.Figure()
+    etiquetas = comparacion['evento'] + ' ' + comparacion['fecha'].dt.strftime('%Y-%m-%d')
+
+    for ventana in ventanas:
+        filas = comparacion['ventana_dias'] == (ventana or 0)
+        fig.add_trace(go.Bar(
+            x=etiquetas[filas],
+            y=comparacion.loc[filas, 'cambio_velocidad'],
+            name="Período completo" if ventana is None else f"±{ventana} días",
+            text=comparacion.loc[filas, 'cambio_velocidad_pct'].round(1),
+            texttemplate='%{text:+.1f}%',
+            textposition='outside'
+        ))
+
+    fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
+
+    fig.update_layout(
+        barmode='group',
+        height=400,
+        xaxis_title="Evento",
+        yaxis_title="Cambio en velocidad diaria (Millones CLP)",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+
+class CacheFiguras:
+    """LRU acotado de figuras ya construidas y validadas, por (constructor, versión de datos, parámetros)
+
+    Se guarda el go.Figure y no su JSON: volver a validarlo desde un dict en cada rerun
+    cuesta casi lo mismo que construirlo. st.plotly_chart no modifica la figura, así que
+    la misma instancia se comparte entre sesiones.
+    """
+
+    def __init__(self, max_entradas=64):
+        self.max_entradas = max_entradas
+        self._figuras = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, constructor, version, datos, *params):
+        """go.Figure lista para st.plotly_chart; sólo llama a `constructor` si no está en caché
+
+        `datos` no forma parte de la clave: su identidad la da `version`. Sólo para frames
+        derivados de la versión; los valores chicos van en `params` (ver `obtener_parametros`).
+        """
+        return self._obtener((constructor.__name__, version, params), lambda: constructor(datos, *params),
+                             len(datos) if hasattr(datos, '__len__') else None)
+
+    def obtener_parametros(self, constructor, version, *params):
+        """Como `obtener` para figuras sin DataFrame: todos los argumentos forman parte de la clave"""
+        return self._obtener((constructor.__name__, version, params), lambda: constructor(*params), None)
+
+    def _obtener(self, clave, construir, filas):
+        with self._lock:
+            if clave in self._figuras:
+                self._figuras.move_to_end(clave)
+                self.aciertos += 1
+                TELEMETRIA.registrar_cache('figuras', True)
+                return self._figuras[clave]
+
+        with TELEMETRIA.etapa('figura_plotly', filas=filas):
+            figura = construir()
+        TELEMETRIA.registrar_cache('figuras', False)
+        with self._lock:
+            self.fallos += 1
+            self._figuras[clave] = figura
+            while len(self._figuras) > self.max_entradas:
+                self._figuras.popitem(last=False)
+        return figura
@@ -0,0 +1,217 @@
+"""Fuentes de datos intercambiables: BigQuery, snapshot local y motor SQL local (SQLite) sobre tablas de usuarios."""
+import argparse
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from consultas import construir_consulta_diaria, ejecutar_consulta, historial_cargas, registrar_ingesta
+from metricas import COLUMNAS_BASE
+from sincronizacion import FECHA_INICIO_HISTORIA
+from snapshot import RUTA_SNAPSHOT, leer_snapshot, tabla_a_dataframe
+from sql_metricas import DIAS_CONTEXTO_VENTANAS, RENOMBRES_SQL, sql_metricas_derivadas
+
+# Filas de SQLite que se trasponen a Arrow por vez
+TAMANO_LOTE_SQLITE = 65536
+
+
+class FuenteDatos(ABC):
+    """Interfaz de fuente: `cargar(desde, hasta)` devuelve la serie diaria ordenada por fecha
+
+    Las instancias son invocables con `desde`, que es lo que espera `sincronizacion.sincronizar`.
+    """
+
+    nombre = 'fuente'
+    metricas_precalculadas = False
+
+    @abstractmethod
+    def cargar(self, desde, hasta=None):
+        """Serie diaria (fecha, saldo_rem, mau_rem, dau_rem) en [desde, hasta]"""
+
+    def __call__(self, desde):
+        return self.cargar(desde)
+
+
+def _inicio_con_contexto(desde):
+    """Inicio de la base para que las ventanas de métricas tengan historia previa y el MAU parta a inicio de mes"""
+    inicio = (desde - timedelta(days=DIAS_CONTEXTO_VENTANAS)).replace(day=1)
+    return max(inicio, FECHA_INICIO_HISTORIA)
+
+
+class FuenteBigQuery(FuenteDatos):
+    """Serie diaria desde BigQuery, con o sin las métricas derivadas calculadas en el warehouse"""
+
+    nombre = 'BigQuery'
+
+    def __init__(self, metricas_en_warehouse=False, arrow=True):
+        self.metricas_precalculadas = metricas_en_warehouse
+        self.arrow = arrow
+
+    def cargar(self, desde, hasta=None):
+        if not self.metricas_precalculadas:
+            consulta = construir_consulta_diaria(desde, hasta)
+            consulta.sql += "ORDER BY fecha"
+            return ejecutar_consulta(consulta, arrow=self.arrow)
+
+        consulta = construir_consulta_diaria(_inicio_con_contexto(desde), hasta)
+        consulta.sql = sql_metricas_derivadas(f"({consulta.sql})", 'bigquery', desde)
+        return ejecutar_consulta(consulta, arrow=self.arrow).rename(columns=RENOMBRES_SQL)
+
+
+class FuenteSnapshot(FuenteDatos):
+    """Serie diaria leída del snapshot Arrow local (sólo las columnas base)"""
+
+    nombre = 'Snapshot'
+
+    def __init__(self, ruta=RUTA_SNAPSHOT):
+        self.ruta = ruta
+
+    def cargar(self, desde, hasta=None):
+        df = leer_snapshot(self.ruta, columnas=COLUMNAS_BASE)
+        df = df[df['fecha'] >= pd.Timestamp(desde)]
+        if hasta is not None:
+            df = df[df['fecha'] <= pd.Timestamp(hasta)]
+        return df.reset_index(drop=True)
+
+
+class FuenteSQLLocal(FuenteDatos):
+    """Misma consulta de BigQuery (dedup, joins, MAU acumulado) ejecutada en SQLite sobre tablas de usuarios"""
+
+    nombre = 'SQL local'
+
+    def __init__(self, ruta, metricas_en_warehouse=False, arrow=True):
+        self.ruta = ruta
+        self.metricas_precalculadas = metricas_en_warehouse
+        self.arrow = arrow
+
+    def cargar(self, desde, hasta=None):
+        if self.metricas_precalculadas:
+            consulta = construir_consulta_diaria(_inicio_con_contexto(desde), hasta, dialecto='sqlite')
+            consulta.sql = sql_metricas_derivadas(f"({consulta.sql})", 'sqlite', desde)
+        else:
+            consulta = construir_consulta_diaria(desde, hasta, dialecto='sqlite')
+            consulta.sql += "ORDER BY fecha"
+
+        parametros = {nombre: valor.isoformat() for nombre, valor in consulta.parametros.items()}
+        inicio = time.perf_counter()
+        with sqlite3.connect(self.ruta) as conexion:
+            if self.arrow:
+                df = tabla_a_dataframe(_leer_columnas(conexion, consulta.sql, parametros))
+            else:
+                df = pd.read_sql_query(consulta.sql, conexion, params=parametros)
+                df['fecha'] = pd.to_datetime(df['fecha'])
+        df = df.rename(columns=RENOMBRES_SQL)
+        registrar_ingesta(consulta, df, inicio, 'sqlite-arrow' if self.arrow else 'sqlite')
+        return df
+
+
+def _leer_columnas(conexion, sql, parametros, tamano_lote=TAMANO_LOTE_SQLITE):
+    """Resultado de SQLite como tabla Arrow, armada por lotes sin crear un DataFrame intermedio
+
+    El driver sqlite3 entrega una tupla de Python por fila, así que la lectura no es
+    columnar de punta a punta: las filas de cada lote se trasponen a arrays Arrow y se
+    descartan, y los objetos de Python vivos se acotan a `tamano_lote` filas.
+    """
+    cursor = conexion.execute(sql, parametros)
+    nombres = [RENOMBRES_SQL.get(d[0], d[0]) for d in cursor.description]
+    lotes = []
+    while filas := cursor.fetchmany(tamano_lote):
+        lotes.append(pa.table({nombre: pa.array(valores) for nombre, valores in zip(nombres, zip(*filas))}))
+    if not lotes:
+        return pa.table({nombre: pa.array([]) for nombre in nombres})
+    # Un lote puede inferir null o int64 donde otro infiere double: se promueven al tipo común
+    return pa.concat_tables(lotes, promote_options='permissive')
+
+
+def crear_fixtures_locales(ruta, desde=FECHA_INICIO_HISTORIA, dias=365, usuarios=50000,
+                           tasa_duplicados=0.05, semilla=0):
+    """Crea en SQLite las tablas interest_payment, cohorts_cuenta_rem y dataform_revenue_app con filas por usuario
+
+    Los usuarios activos crecen a lo largo del período; una fracción de los pagos viene
+    duplicada con un `updated_at` anterior para ejercitar el deduplicado.
+    """
+    rng = np.random.default_rng(semilla)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+    with sqlite3.connect(ruta) as conexion:
+        conexion.executescript("""
+            CREATE TABLE interest_payment (date TEXT, user_id INTEGER, user_balance REAL, status TEXT, updated_at INTEGER);
+            CREATE TABLE cohorts_cuenta_rem (fecha TEXT, user INTEGER);
+            CREATE TABLE dataform_revenue_app (fecha TEXT, user INTEGER, tipo TEXT, revenue REAL);
+        """)
+        saldos = rng.lognormal(mean=13, sigma=1.2, size=usuarios)
+        vistos_en_mes = np.zeros(usuarios, dtype=bool)
+        mes_actual = None
+
+        for i in range(dias):
+            dia = desde + timedelta(days=i)
+            texto_dia = dia.isoformat()
+            if dia.month != mes_actual:
+                vistos_en_mes[:] = False
+                mes_actual = dia.month
+
+            # Fracción de usuarios activos que crece de 30% a 80%
+            activos = np.flatnonzero(rng.random(usuarios) < 0.3 + 0.5 * i / max(dias - 1, 1))
+            saldos[activos] *= rng.normal(1.001, 0.01, size=len(activos))
+            estados = np.where(rng.random(len(activos)) < 0.98, 'SUCCEEDED', 'FAILED')
+            actualizado = int(time.mktime(dia.timetuple())) + 3600
+            pagos = pd.DataFrame({
+                'date': texto_dia,
+                'user_id': activos,
+                'user_balance': saldos[activos].round(0),
+                'status': estados,
+                'updated_at': actualizado,
+            })
+            duplicados = pagos.sample(frac=tasa_duplicados, random_state=int(rng.integers(2**31)))
+            duplicados = duplicados.assign(updated_at=actualizado - 1800, user_balance=duplicados['user_balance'] * 0.5)
+            pd.concat([pagos, duplicados]).to_sql('interest_payment', conexion, if_exists='append', index=False)
+
+            nuevos = activos[~vistos_en_mes[activos]]
+            vistos_en_mes[activos] = True
+            pd.DataFrame({'fecha': texto_dia, 'user': nuevos}).to_sql('cohorts_cuenta_rem', conexion, if_exists='append', index=False)
+
+            con_revenue = activos[rng.random(len(activos)) < 0.1]
+            pd.DataFrame({
+                'fecha': texto_dia,
+                'user': con_revenue,
+                'tipo': 'revenue_servicios',
+                'revenue': rng.exponential(0.001, size=len(con_revenue)),
+            }).to_sql('dataform_revenue_app', conexion, if_exists='append', index=False)
+
+        conexion.executescript("""
+            CREATE INDEX idx_pagos_fecha ON interest_payment (date, user_id);
+            CREATE INDEX idx_cohortes_fecha ON cohorts_cuenta_rem (fecha);
+            CREATE INDEX idx_revenue_fecha ON dataform_revenue_app (fecha, user);
+        """)
+    return ruta
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fixtures y carga con el motor SQL local')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_fixtures = sub.add_parser('fixtures', help='Crea las tablas de usuarios en SQLite')
+    p_fixtures.add_argument('ruta')
+    p_fixtures.add_argument('--dias', type=int, default=365)
+    p_fixtures.add_argument('--usuarios', type=int, default=50000)
+    p_cargar = sub.add_parser('cargar', help='Ejecuta la consulta diaria sobre las tablas locales')
+    p_cargar.add_argument('ruta')
+    p_cargar.add_argument('--metricas-en-sql', action='store_true')
+    p_cargar.add_argument('--sin-arrow', action='store_true', help='Ingesta genérica con pandas, para comparar')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.comando == 'fixtures':
+        crear_fixtures_locales(args.ruta, dias=args.dias, usuarios=args.usuarios)
+        print(f'Fixtures escritos en {args.ruta} ({time.perf_counter() - inicio:,.1f} s)')
+    else:
+        df = FuenteSQLLocal(args.ruta, args.metricas_en_sql, arrow=not args.sin_arrow).cargar(FECHA_INICIO_HISTORIA)
+        carga = historial_cargas()[0]
+        print(df.dtypes.to_string())
+        print(f'{len(df):,} días cargados en {time.perf_counter() - inicio:,.2f} s '
+              f'(ingesta {carga.modo}: {carga.segundos:,.2f} s, {carga.bytes_memoria / 1e3:,.1f} kB en memoria)')
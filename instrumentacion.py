@@ -0,0 +1,221 @@
+"""Telemetría del proceso: tiempo, filas y memoria por etapa, aciertos/fallos de cachés, logs JSON y endpoint Prometheus."""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from memoria import rss_bytes
+
+MAX_EVENTOS = 200
+PREFIJO_METRICAS = 'rem'
+# Por defecto /metrics sólo escucha en la máquina local
+HOST_METRICAS = '127.0.0.1'
+
+# Un evento por etapa medida, como una línea JSON; sin handler configurado no se escribe nada
+logger = logging.getLogger('rem.telemetria')
+# Avisos del propio exportador, fuera del log JSON de etapas
+logger_exportador = logging.getLogger('rem.exportador')
+
+
+@dataclass
+class EstadisticasEtapa:
+    llamadas: int = 0
+    segundos_total: float = 0.0
+    segundos_max: float = 0.0
+    ultimo_segundos: float = 0.0
+    filas_total: int = 0
+    ultimas_filas: int = None
+    ultimo_delta_memoria: int = None
+
+    @property
+    def promedio_segundos(self):
+        return self.segundos_total / self.llamadas if self.llamadas else 0.0
+
+
+class MedicionEtapa:
+    """Lo que el código medido puede completar dentro de `Telemetria.etapa`"""
+
+    def __init__(self):
+        self.filas = None
+
+
+class Telemetria:
+    """Acumulados por etapa y por caché de este proceso, compartidos por todas las sesiones"""
+
+    def __init__(self, max_eventos=MAX_EVENTOS):
+        self._etapas = {}
+        self._caches = {}
+        self._eventos = deque(maxlen=max_eventos)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nombre, filas=None):
+        """Mide tiempo de reloj y variación de RSS del bloque; `filas` se puede fijar después en la medición"""
+        medicion = MedicionEtapa()
+        medicion.filas = filas
+        rss_inicial = rss_bytes()
+        inicio = time.perf_counter()
+        try:
+            yield medicion
+        finally:
+            segundos = time.perf_counter() - inicio
+            rss_final = rss_bytes()
+            delta = rss_final - rss_inicial if rss_inicial is not None and rss_final is not None else None
+            self.registrar_etapa(nombre, segundos, medicion.filas, delta)
+
+    def registrar_etapa(self, nombre, segundos, filas=None, delta_memoria=None):
+        evento = {'tipo': 'etapa', 'etapa': nombre, 'segundos': round(segundos, 6), 'filas': filas,
+                  'delta_memoria_bytes': delta_memoria, 'momento': time.time(), 'pid': os.getpid()}
+        with self._lock:
+            estadisticas = self._etapas.setdefault(nombre, EstadisticasEtapa())
+            estadisticas.llamadas += 1
+            estadisticas.segundos_total += segundos
+            estadisticas.segundos_max = max(estadisticas.segundos_max, segundos)
+            estadisticas.ultimo_segundos = segundos
+            if filas is not None:
+                estadisticas.filas_total += filas
+                estadisticas.ultimas_filas = filas
+            estadisticas.ultimo_delta_memoria = delta_memoria
+            self._eventos.append(evento)
+        logger.info(json.dumps(evento))
+
+    def registrar_cache(self, nombre, acierto):
+        with self._lock:
+            conteo = self._caches.setdefault(nombre, [0, 0])
+            conteo[0 if acierto else 1] += 1
+
+    def etapas(self):
+        """{nombre: EstadisticasEtapa} (copias) ordenado por tiempo total descendente"""
+        with self._lock:
+            copias = {n: EstadisticasEtapa(**vars(e)) for n, e in self._etapas.items()}
+        return dict(sorted(copias.items(), key=lambda item: -item[1].segundos_total))
+
+    def caches(self):
+        """{nombre: (aciertos, fallos)}"""
+        with self._lock:
+            return {n: tuple(c) for n, c in sorted(self._caches.items())}
+
+    def eventos(self):
+        """Últimos eventos de etapa, del más reciente al más antiguo"""
+        with self._lock:
+            return list(reversed(self._eventos))
+
+    def formato_prometheus(self, prefijo=PREFIJO_METRICAS):
+        """Acumulados en el formato de texto de Prometheus"""
+        lineas = []
+
+        def metrica(nombre, tipo, ayuda, valores):
+            lineas.append(f'# HELP {prefijo}_{nombre} {ayuda}')
+            lineas.append(f'# TYPE {prefijo}_{nombre} {tipo}')
+            for etiquetas, valor in valores:
+                lineas.append(f'{prefijo}_{nombre}{{{etiquetas}}} {valor}')
+
+        etapas = self.etapas()
+        caches = self.caches()
+        metrica('etapa_llamadas_total', 'counter', 'Ejecuciones de cada etapa',
+                [(f'etapa="{n}"', e.llamadas) for n, e in etapas.items()])
+        metrica('etapa_segundos_total', 'counter', 'Tiempo de reloj acumulado por etapa',
+                [(f'etapa="{n}"', f'{e.segundos_total:.6f}') for n, e in etapas.items()])
+        metrica('etapa_segundos_max', 'gauge', 'Ejecución más lenta de cada etapa',
+                [(f'etapa="{n}"', f'{e.segundos_max:.6f}') for n, e in etapas.items()])
+        metrica('etapa_filas_total', 'counter', 'Filas procesadas por etapa',
+                [(f'etapa="{n}"', e.filas_total) for n, e in etapas.items()])
+        metrica('etapa_delta_memoria_bytes', 'gauge', 'Variación de RSS en la última ejecución de cada etapa',
+                [(f'etapa="{n}"', e.ultimo_delta_memoria) for n, e in etapas.items() if e.ultimo_delta_memoria is not None])
+        metrica('cache_aciertos_total', 'counter', 'Aciertos de cada caché',
+                [(f'cache="{n}"', a) for n, (a, _) in caches.items()])
+        metrica('cache_fallos_total', 'counter', 'Fallos de cada caché',
+                [(f'cache="{n}"', f) for n, (_, f) in caches.items()])
+        rss = rss_bytes()
+        if rss is not None:
+            metrica('proceso_rss_bytes', 'gauge', 'RSS del proceso', [('', rss)])
+        return '\n'.join(lineas) + '\n'
+
+
+TELEMETRIA = Telemetria()
+
+
+def filas_de(resultado):
+    """Filas de un DataFrame (o de una tupla que empieza con uno); None si no aplica"""
+    if isinstance(resultado, tuple) and resultado:
+        resultado = resultado[0]
+    try:
+        return len(resultado.index)
+    except AttributeError:
+        return None
+
+
+def instrumentar_cache(nombre, decorador_cache, telemetria=TELEMETRIA):
+    """Aplica `decorador_cache` (p. ej. st.cache_resource) contando aciertos y fallos, y mide como etapa cada cálculo
+
+    La función original sólo se ejecuta en un fallo: cada llamada que no la ejecuta es un acierto.
+    """
+    def decorador(func):
+        local = threading.local()
+
+        @functools.wraps(func)
+        def calcular(*args, **kwargs):
+            local.fallo = True
+            with telemetria.etapa(nombre) as medicion:
+                resultado = func(*args, **kwargs)
+                medicion.filas = filas_de(resultado)
+            return resultado
+
+        cacheada = decorador_cache(calcular)
+
+        @functools.wraps(func)
+        def llamar(*args, **kwargs):
+            local.fallo = False
+            resultado = cacheada(*args, **kwargs)
+            telemetria.registrar_cache(nombre, not local.fallo)
+            return resultado
+
+        llamar.clear = cacheada.clear
+        return llamar
+    return decorador
+
+
+def configurar_log(ruta):
+    """Escribe los eventos de etapa en `ruta` como líneas JSON"""
+    if any(getattr(h, 'baseFilename', None) == os.path.abspath(ruta) for h in logger.handlers):
+        return
+    handler = logging.FileHandler(ruta)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def servir_metricas(puerto, telemetria=TELEMETRIA, host=HOST_METRICAS):
+    """Expone /metrics en formato Prometheus desde un hilo en segundo plano; devuelve el servidor
+
+    Si el puerto ya está tomado (otro worker del mismo host o un proceso anterior) se avisa
+    y se sigue sin endpoint: devuelve None.
+    """
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            cuerpo = telemetria.formato_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    try:
+        servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    except OSError as e:
+        logger_exportador.warning('No se pudo exponer /metrics en %s:%s (%s); se sigue sin endpoint', host, puerto, e)
+        return None
+    threading.Thread(target=servidor.serve_forever, name='metricas-prometheus', daemon=True).start()
+    return servidor
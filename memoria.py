@@ -0,0 +1,75 @@
+"""Medición de memoria del proceso (RSS) y de su reparto entre las sesiones activas."""
+import argparse
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Una sesión sin reruns en este lapso deja de contarse como activa
+VENTANA_SESION_ACTIVA_SEGUNDOS = 600
+
+
+def rss_bytes():
+    """RSS actual del proceso; sin /proc (macOS) se usa el máximo histórico"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        if resource is None:
+            return None
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if os.uname().sysname == 'Darwin' else maximo * 1024
+
+
+def bytes_dataframe(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+class RegistroSesiones:
+    """Sesiones vistas por el proceso con su último rerun, para repartir el RSS entre ellas"""
+
+    def __init__(self, ventana_activa=VENTANA_SESION_ACTIVA_SEGUNDOS):
+        self.ventana_activa = ventana_activa
+        self._vistas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, id_sesion):
+        with self._lock:
+            self._vistas[id_sesion] = time.time()
+
+    def activas(self):
+        limite = time.time() - self.ventana_activa
+        with self._lock:
+            self._vistas = {s: t for s, t in self._vistas.items() if t >= limite}
+            return len(self._vistas)
+
+
+def medir_sesiones(ruta_app, sesiones, timeout=120):
+    """RSS tras abrir `sesiones` sesiones simuladas de la app en este proceso (comparten las cachés)"""
+    from streamlit.testing.v1 import AppTest
+
+    abiertas = []
+    mediciones = [(0, rss_bytes())]
+    for n in range(1, sesiones + 1):
+        app = AppTest.from_file(ruta_app, default_timeout=timeout)
+        app.run()
+        abiertas.append(app)
+        mediciones.append((n, rss_bytes()))
+    return mediciones
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='RSS del proceso a medida que se abren sesiones de la app')
+    parser.add_argument('sesiones', type=int, nargs='?', default=10)
+    parser.add_argument('--app', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_analisis_rem.py'))
+    args = parser.parse_args()
+
+    mediciones = medir_sesiones(args.app, args.sesiones)
+    base = mediciones[1][1]
+    for n, rss in mediciones:
+        extra = f'  (+{(rss - base) / 1e6 / (n - 1):,.2f} MB por sesión adicional)' if n > 1 else ''
+        print(f'{n:>3} sesiones: {rss / 1e6:,.1f} MB{extra}')
@@ -0,0 +1,283 @@
+"""Motor de métricas derivadas del saldo REM, memoizado por versión de los datos crudos."""
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import TELEMETRIA
+
+COLUMNAS_BASE = ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']
+# Saldo del primer y último día del mes, calculados en el warehouse junto con las métricas
+COLUMNAS_EXTREMOS_MES = ['saldo_inicial_mes', 'saldo_final_mes']
+# Con más días nuevos que esto conviene recalcular la serie completa (vectorizado) en vez de fila a fila
+MAX_FILAS_INCREMENTALES = 31
+# Se incrementa al cambiar cómo se derivan las métricas; invalida los snapshot procesados escritos antes
+VERSION_DERIVACION = '1'
+
+# Métricas que produce el motor (nombre de columna -> descripción)
+METRICAS_DERIVADAS = {
+    'saldo_crecimiento_absoluto_diario': 'Cambio diario del saldo (MM CLP)',
+    'saldo_crecimiento_pct_diario': 'Cambio diario del saldo (%)',
+    'saldo_crecimiento_absoluto_semanal': 'Cambio del saldo vs 7 días antes (MM CLP)',
+    'saldo_crecimiento_pct_semanal': 'Cambio del saldo vs 7 días antes (%)',
+    'saldo_crecimiento_absoluto_mensual': 'Cambio del saldo vs 30 días antes (MM CLP)',
+    'saldo_crecimiento_pct_mensual': 'Cambio del saldo vs 30 días antes (%)',
+    'saldo_ma7': 'Media móvil 7d del saldo',
+    'crecimiento_diario_ma7': 'Media móvil 7d del crecimiento diario (%)',
+    'saldo_crecimiento_absoluto_diario_ma7': 'Media móvil 7d del cambio diario (MM CLP, requiere 7 días)',
+    'saldo_por_mau': 'Saldo por usuario activo mensual (CLP)',
+    'dau_mau_ratio': 'DAU/MAU (%)',
+    'año_mes': 'Mes calendario (YYYY-MM)',
+}
+
+
+def version_datos(df):
+    """Hash de contenido de las columnas base; identifica una versión del dataset crudo"""
+    if 'version_datos' in df.attrs:
+        return df.attrs['version_datos']
+    base = df[COLUMNAS_BASE].copy()
+    base['fecha'] = pd.to_datetime(base['fecha'])
+    hashes = pd.util.hash_pandas_object(base, index=False).values
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:16]
+
+
+def calcular_metricas(df):
+    """Ordena por fecha y calcula todas las métricas derivadas sin modificar `df`"""
+    df = df[COLUMNAS_BASE].copy()
+    df['fecha'] = pd.to_datetime(df['fecha'])
+    df = df.sort_values('fecha').reset_index(drop=True)
+
+    saldo = df['saldo_rem']
+    df['saldo_crecimiento_absoluto_diario'] = saldo.diff()
+    df['saldo_crecimiento_pct_diario'] = saldo.pct_change() * 100
+    df['saldo_crecimiento_absoluto_semanal'] = saldo.diff(7)
+    df['saldo_crecimiento_pct_semanal'] = ((saldo / saldo.shift(7)) - 1) * 100
+    df['saldo_crecimiento_absoluto_mensual'] = saldo.diff(30)
+    df['saldo_crecimiento_pct_mensual'] = ((saldo / saldo.shift(30)) - 1) * 100
+    df['saldo_ma7'] = saldo.rolling(window=7, min_periods=1).mean()
+    df['crecimiento_diario_ma7'] = df['saldo_crecimiento_pct_diario'].rolling(window=7, min_periods=1).mean()
+    df['saldo_crecimiento_absoluto_diario_ma7'] = df['saldo_crecimiento_absoluto_diario'].rolling(7).mean()
+    df['saldo_por_mau'] = (saldo / df['mau_rem']) * 1000000
+    df['dau_mau_ratio'] = (df['dau_rem'] / df['mau_rem']) * 100
+    df['año_mes'] = df['fecha'].dt.to_period('M').astype(str).astype('category')
+    return df
+
+
+class EstadoMetricas:
+    """Estado incremental de las métricas: guarda los últimos saldos y emite sólo las filas nuevas
+
+    Cada fila nueva cuesta O(VENTANA) sin importar el largo de la historia, y los valores
+    coinciden con `calcular_metricas` (salvo redondeo de punto flotante de las medias móviles).
+    """
+
+    VENTANA = 30  # mayor rezago usado (diff/shift de 30 días)
+    VENTANA_MEDIA = 7
+    COLUMNAS_VENTANA = [
+        'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario',
+        'saldo_crecimiento_absoluto_semanal', 'saldo_crecimiento_pct_semanal',
+        'saldo_crecimiento_absoluto_mensual', 'saldo_crecimiento_pct_mensual',
+        'saldo_ma7', 'crecimiento_diario_ma7', 'saldo_crecimiento_absoluto_diario_ma7',
+    ]
+
+    def __init__(self):
+        self.saldos = deque(maxlen=self.VENTANA)
+        self.ultima_fecha = None
+
+    @classmethod
+    def desde_datos(cls, df):
+        """Reconstruye el estado a partir de las últimas filas de un dataset ya ordenado"""
+        estado = cls()
+        cola = df.tail(cls.VENTANA)
+        estado.saldos.extend(cola['saldo_rem'].astype(float))
+        if len(cola) > 0:
+            estado.ultima_fecha = pd.Timestamp(cola['fecha'].iloc[-1])
+        return estado
+
+    def _fila(self, saldo):
+        s = np.append(np.fromiter(self.saldos, dtype=float, count=len(self.saldos)), saldo)
+        n = len(s)
+
+        def rezago(k):
+            return s[-1 - k] if n > k else np.nan
+
+        # Cambios % diarios de las últimas 7 filas, igual que pct_change() * 100
+        previos = s[-self.VENTANA_MEDIA - 1:]
+        pct_ventana = (previos[1:] / previos[:-1] - 1) * 100
+        dif_ventana = np.diff(previos)
+
+        return {
+            'saldo_crecimiento_absoluto_diario': saldo - rezago(1),
+            'saldo_crecimiento_pct_diario': (saldo / rezago(1) - 1) * 100,
+            'saldo_crecimiento_absoluto_semanal': saldo - rezago(7),
+            'saldo_crecimiento_pct_semanal': ((saldo / rezago(7)) - 1) * 100,
+            'saldo_crecimiento_absoluto_mensual': saldo - rezago(30),
+            'saldo_crecimiento_pct_mensual': ((saldo / rezago(30)) - 1) * 100,
+            'saldo_ma7': s[-self.VENTANA_MEDIA:].mean(),
+            'crecimiento_diario_ma7': pct_ventana.mean() if len(pct_ventana) else np.nan,
+            'saldo_crecimiento_absoluto_diario_ma7': dif_ventana.mean() if len(dif_ventana) == self.VENTANA_MEDIA else np.nan,
+        }
+
+    def actualizar(self, nuevas):
+        """Incorpora filas nuevas (posteriores a la última fecha) y devuelve sólo sus métricas derivadas"""
+        nuevas = nuevas[COLUMNAS_BASE].copy()
+        nuevas['fecha'] = pd.to_datetime(nuevas['fecha'])
+        nuevas = nuevas.sort_values('fecha').reset_index(drop=True)
+        if self.ultima_fecha is not None and len(nuevas) and nuevas['fecha'].iloc[0] <= self.ultima_fecha:
+            raise ValueError(f"Las filas nuevas deben ser posteriores a {self.ultima_fecha:%Y-%m-%d}")
+
+        filas = []
+        for saldo in nuevas['saldo_rem'].astype(float):
+            filas.append(self._fila(saldo))
+            self.saldos.append(saldo)
+        if len(nuevas):
+            self.ultima_fecha = nuevas['fecha'].iloc[-1]
+
+        derivadas = pd.DataFrame(filas, index=nuevas.index, columns=self.COLUMNAS_VENTANA)
+        df = pd.concat([nuevas, derivadas], axis=1)
+        df['saldo_por_mau'] = (df['saldo_rem'] / df['mau_rem']) * 1000000
+        df['dau_mau_ratio'] = (df['dau_rem'] / df['mau_rem']) * 100
+        df['año_mes'] = df['fecha'].dt.to_period('M').astype(str)
+        return df
+
+
+def preparar_precalculadas(df):
+    """Normaliza un dataset que ya trae las métricas derivadas (p. ej. calculadas en el warehouse)
+
+    Se conservan los extremos del mes si vienen, para que el cubo no los recalcule.
+    """
+    extremos = [c for c in COLUMNAS_EXTREMOS_MES if c in df.columns]
+    df = df[COLUMNAS_BASE + list(METRICAS_DERIVADAS) + extremos].copy()
+    df['fecha'] = pd.to_datetime(df['fecha'])
+    df = df.sort_values('fecha').reset_index(drop=True)
+    df['año_mes'] = df['año_mes'].astype(str).astype('category')
+    return df
+
+
+def filas_comunes(datos, nuevos):
+    """Cantidad de filas iniciales cuyas columnas base coinciden en `datos` y `nuevos` (ambos ordenados por fecha)"""
+    n = min(len(datos), len(nuevos))
+    iguales = np.ones(n, dtype=bool)
+    for col in COLUMNAS_BASE:
+        a = datos[col].iloc[:n]
+        b = nuevos[col].iloc[:n]
+        if col == 'fecha':
+            iguales &= pd.to_datetime(a).to_numpy('datetime64[ns]') == pd.to_datetime(b).to_numpy('datetime64[ns]')
+        else:
+            a = a.to_numpy(dtype=float)
+            b = b.to_numpy(dtype=float)
+            iguales &= (a == b) | (np.isnan(a) & np.isnan(b))
+    distintas = np.flatnonzero(~iguales)
+    return int(distintas[0]) if len(distintas) else n
+
+
+@dataclass(frozen=True)
+class ResultadoMetricas:
+    """Dataset con métricas derivadas para una versión de datos, más la lista de métricas producidas
+
+    Si la versión sólo agregó días a otra, `anterior` es esa versión y `agregadas` las filas
+    nuevas ya derivadas, para que otros agregados (p. ej. el cubo) se extiendan en vez de
+    recalcularse.
+    """
+    version: str
+    datos: pd.DataFrame
+    metricas: tuple
+    anterior: str = None
+    agregadas: pd.DataFrame = None
+
+
+class MotorMetricas:
+    """Calcula métricas derivadas una sola vez por versión de datos (LRU de pocas versiones)"""
+
+    def __init__(self, max_versiones=4, compartido=None):
+        self.max_versiones = max_versiones
+        # Caché entre procesos opcional (cache_compartido.CacheCompartido): se consulta antes de calcular
+        self.compartido = compartido
+        self._memo = OrderedDict()
+        self._estados = {}
+        self._lock = threading.Lock()
+        self.calculos = 0
+
+    def obtener(self, df, version=None):
+        """Devuelve el ResultadoMetricas de `df`, recalculando sólo si la versión es nueva"""
+        version = version or version_datos(df)
+        with self._lock:
+            TELEMETRIA.registrar_cache('metricas', version in self._memo)
+            if version in self._memo:
+                self._memo.move_to_end(version)
+                return self._memo[version]
+
+            if df.attrs.get('metricas_derivadas'):
+                # Snapshot procesado: las métricas ya vienen calculadas y tipadas
+                datos = df
+            elif (extendido := self._extender_ultima(df, version)) is not None:
+                return extendido
+            elif self.compartido is not None:
+                datos = self.compartido.obtener_metricas(version, lambda: self._calcular(df))
+            else:
+                datos = self._calcular(df)
+            resultado = ResultadoMetricas(version, datos, tuple(METRICAS_DERIVADAS))
+            self._guardar(resultado)
+            return resultado
+
+    def _calcular(self, df):
+        if df.attrs.get('metricas_precalculadas'):
+            return preparar_precalculadas(df)
+        self.calculos += 1
+        with TELEMETRIA.etapa('metricas_derivadas', filas=len(df)):
+            return calcular_metricas(df)
+
+    def _guardar(self, resultado):
+        self._memo[resultado.version] = resultado
+        while len(self._memo) > self.max_versiones:
+            version_antigua, _ = self._memo.popitem(last=False)
+            self._estados.pop(version_antigua, None)
+
+    def resultado(self, version):
+        """ResultadoMetricas memoizado de `version`, o None"""
+        with self._lock:
+            return self._memo.get(version)
+
+    def _extender_ultima(self, df, version):
+        """Si `df` sólo agrega días (y reescribe a lo más unos pocos finales) a la última versión
+        calculada, deriva sólo las filas nuevas; si no, None"""
+        if df.attrs.get('metricas_precalculadas') or not self._memo:
+            return None
+        ultima = next(reversed(self._memo.values()))
+        base = df[COLUMNAS_BASE]
+        if not pd.to_datetime(base['fecha']).is_monotonic_increasing:
+            return None
+        comunes = filas_comunes(ultima.datos, base)
+        if comunes == 0 or comunes == len(base) or len(base) - comunes > MAX_FILAS_INCREMENTALES:
+            return None
+        if comunes < len(ultima.datos):
+            # Llegadas tardías reescribieron los últimos días: se parte del prefijo que no cambió
+            ultima = ResultadoMetricas(None, ultima.datos.iloc[:comunes], ultima.metricas)
+        with TELEMETRIA.etapa('metricas_incrementales', filas=len(base) - comunes):
+            extendido = self._agregar(ultima, base.iloc[comunes:], version)
+        extendido.datos.attrs = dict(df.attrs)
+        return extendido
+
+    def _agregar(self, resultado, nuevas, version=None):
+        estado = self._estados.pop(resultado.version, None) or EstadoMetricas.desde_datos(resultado.datos)
+        derivadas = estado.actualizar(nuevas)
+        datos = pd.concat([resultado.datos, derivadas], ignore_index=True)
+        datos['año_mes'] = datos['año_mes'].astype(str).astype('category')
+        if version is None:
+            # La versión nueva encadena la anterior con el hash de las filas agregadas
+            hashes = pd.util.hash_pandas_object(derivadas[COLUMNAS_BASE], index=False).values
+            version = hashlib.sha1(str(resultado.version).encode() + hashes.tobytes()).hexdigest()[:16]
+        extendido = ResultadoMetricas(version, datos, resultado.metricas, resultado.version, derivadas)
+        self._estados[version] = estado
+        self._guardar(extendido)
+        return extendido
+
+    def agregar_filas(self, resultado, nuevas, version=None):
+        """Extiende un resultado con días nuevos derivando sólo esas filas (O(ventana) por fila)
+
+        Sin `version`, la versión nueva encadena la anterior con el hash de las filas agregadas.
+        """
+        with self._lock:
+            return self._agregar(resultado, nuevas, version)
@@ -0,0 +1,64 @@
+"""Reducción de puntos de series largas para graficar (LTTB y min/max por bucket)."""
+import numpy as np
+
+# Sobre este número de puntos visibles se usan trazas WebGL en vez de SVG
+UMBRAL_WEBGL = 5000
+ANCHO_OBJETIVO_PX = 1200
+
+
+def indices_lttb(x, y, n_salida):
+    """Índices elegidos por Largest-Triangle-Three-Buckets; conserva la forma visual de la serie"""
+    n = len(y)
+    if n_salida >= n or n_salida < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    bordes = np.linspace(1, n - 1, n_salida - 1).astype(int)
+    indices = np.empty(n_salida, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(n_salida - 2):
+        ini, fin = bordes[i], max(bordes[i + 1], bordes[i] + 1)
+        sig_ini = fin
+        sig_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        sig_fin = max(sig_fin, sig_ini + 1)
+        prom_x = x[sig_ini:sig_fin].mean()
+        prom_y = y[sig_ini:sig_fin].mean()
+        areas = np.abs((x[a] - prom_x) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (prom_y - y[a]))
+        a = ini + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def indices_min_max(y, n_buckets):
+    """Índices del mínimo y máximo de cada bucket (más el primer y último punto)"""
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    bucket = np.arange(n) * n_buckets // n
+    orden = np.lexsort((y, bucket))
+    inicios = np.searchsorted(bucket[orden], np.arange(n_buckets), side='left')
+    finales = np.searchsorted(bucket[orden], np.arange(n_buckets), side='right') - 1
+    return np.unique(np.concatenate([[0, n - 1], orden[inicios], orden[finales]]))
+
+
+def reducir_serie(x, y, max_puntos, metodo='lttb'):
+    """Devuelve (x, y) con a lo más ~`max_puntos` puntos; los NaN se descartan antes de reducir"""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    validos = np.flatnonzero(~np.isnan(y))
+    if max_puntos is None or len(validos) <= max_puntos:
+        return x, y
+
+    xv = x[validos]
+    yv = y[validos]
+    if metodo == 'minmax':
+        elegidos = indices_min_max(yv, max_puntos // 2)
+    else:
+        elegidos = indices_lttb(xv.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(xv.dtype, np.datetime64) else xv, yv, max_puntos)
+    return xv[elegidos], yv[elegidos]
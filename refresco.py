@@ -0,0 +1,145 @@
+"""Refresco en segundo plano (stale-while-revalidate) del dataset cargado desde el warehouse."""
+import threading
+import time
+from dataclasses import dataclass
+
+TTL_SEGUNDOS = 3600
+# Se refresca al cumplirse esta fracción del TTL, para que nadie vea el dataset ya vencido
+FRACCION_REFRESCO = 0.8
+# Espera mínima antes de reintentar tras un refresco fallido
+REINTENTO_SEGUNDOS = 300
+
+
+@dataclass(frozen=True)
+class EstadoRefresco:
+    """Foto del refresco para mostrar en la UI"""
+    estado: str
+    edad_segundos: float
+    version: str
+    refrescos: int
+    ultimo_error: str
+    emergencia: bool = False
+
+
+class RefrescoDatos:
+    """Sirve siempre el último dataset bueno y lo recarga en un hilo de fondo antes de que venza
+
+    `cargar()` hace la carga completa contra el warehouse y devuelve (datos, momento).
+    `respaldo()` devuelve lo último persistido sin consultar, o None; se usa al arrancar
+    para no bloquear al primer usuario. `emergencia()` devuelve (datos, momento) de otra
+    fuente local, o None; se sirve, con el error a la vista, si no hay respaldo y la primera
+    carga falla. Sólo hay un refresco en curso a la vez.
+    """
+
+    def __init__(self, cargar, respaldo=None, nombre='warehouse', ttl=TTL_SEGUNDOS,
+                 fraccion_refresco=FRACCION_REFRESCO, reintento=REINTENTO_SEGUNDOS, emergencia=None):
+        self.nombre = nombre
+        self._cargar = cargar
+        self._respaldo = respaldo
+        self._emergencia = emergencia
+        self.ttl = ttl
+        self.fraccion_refresco = fraccion_refresco
+        self.reintento = reintento
+        self._datos = None
+        self._momento = None
+        self._hilo = None
+        self._ultimo_intento = None
+        self._ultimo_error = None
+        self._en_emergencia = False
+        self._lock = threading.Lock()
+        self._lock_inicial = threading.Lock()
+        self.refrescos = 0
+
+    def hay_datos(self):
+        return self._datos is not None
+
+    def obtener(self):
+        """Dataset vigente; sólo bloquea si todavía no hay nada que servir"""
+        if self._datos is None:
+            self._carga_inicial()
+        if self._debe_refrescar():
+            self.refrescar()
+        return self._datos
+
+    def _carga_inicial(self):
+        with self._lock_inicial:
+            if self._datos is not None:
+                return
+            respaldo = self._respaldo() if self._respaldo is not None else None
+            if respaldo is not None:
+                self._publicar(*respaldo)
+                return
+            intento = time.time()
+            try:
+                datos, momento = self._cargar()
+            except Exception as e:
+                emergencia = self._emergencia() if self._emergencia is not None else None
+                if emergencia is None:
+                    raise
+                self._publicar(*emergencia, en_emergencia=True)
+                with self._lock:
+                    # Se reintenta contra el warehouse pasado el tiempo de espera de los refrescos fallidos
+                    self._ultimo_intento = intento
+                    self._ultimo_error = f'{type(e).__name__}: {e}'
+                return
+            self._publicar(datos, momento)
+            self.refrescos += 1
+
+    def _publicar(self, datos, momento, en_emergencia=False):
+        with self._lock:
+            self._datos = datos
+            self._momento = momento
+            self._ultimo_error = None
+            self._en_emergencia = en_emergencia
+
+    def _debe_refrescar(self):
+        ahora = time.time()
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return False
+            if self._ultimo_error is not None and ahora - self._ultimo_intento < self.reintento:
+                return False
+            if self._en_emergencia:
+                return True
+            return self._momento is None or ahora - self._momento >= self.ttl * self.fraccion_refresco
+
+    def refrescar(self):
+        """Lanza un refresco en segundo plano salvo que ya haya uno en curso; devuelve el hilo"""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return self._hilo
+            self._ultimo_intento = time.time()
+            self._hilo = threading.Thread(target=self._refrescar, name='refresco-datos', daemon=True)
+            self._hilo.start()
+            return self._hilo
+
+    def _refrescar(self):
+        try:
+            datos, momento = self._cargar()
+        except Exception as e:
+            # Se sigue sirviendo el último dataset bueno
+            with self._lock:
+                self._ultimo_error = f'{type(e).__name__}: {e}'
+            return
+        self._publicar(datos, momento)
+        self.refrescos += 1
+
+    def estado(self):
+        with self._lock:
+            refrescando = self._hilo is not None and self._hilo.is_alive()
+            if refrescando:
+                estado = 'refrescando'
+            elif self._ultimo_error is not None:
+                estado = 'error'
+            elif self._datos is None:
+                estado = 'sin datos'
+            else:
+                estado = 'vigente'
+            return EstadoRefresco(
+                estado=estado,
+                edad_segundos=time.time() - self._momento if self._momento is not None else None,
+                version=self._datos.attrs.get('version_datos') if self._datos is not None else None,
+                refrescos=self.refrescos,
+                ultimo_error=self._ultimo_error,
+                emergencia=self._en_emergencia,
+            )
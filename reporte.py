@@ -0,0 +1,161 @@
+"""Generación por lotes de reportes (tablas CSV y figuras HTML/PNG) para varios rangos y eventos, en paralelo."""
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+from analisis import generar_reporte
+from eventos import EVENTO_PRINCIPAL, Evento, cargar_eventos
+from metricas import calcular_metricas
+from snapshot import RUTA_CSV, RUTA_SNAPSHOT, convertir_csv_a_snapshot, leer_snapshot, snapshot_vigente
+
+DIRECTORIO_REPORTES = 'reportes'
+
+# Dataset con métricas de cada proceso del pool, recibido una sola vez al iniciarlo
+_datos_worker = None
+
+
+def cargar_datos(ruta_bd=None):
+    """Dataset con métricas derivadas: del motor SQL local si se indica `ruta_bd`, si no del snapshot"""
+    if ruta_bd:
+        from fuentes import FuenteSQLLocal
+        from sincronizacion import FECHA_INICIO_HISTORIA
+        df = FuenteSQLLocal(ruta_bd).cargar(FECHA_INICIO_HISTORIA)
+    else:
+        if not snapshot_vigente(RUTA_SNAPSHOT, RUTA_CSV):
+            convertir_csv_a_snapshot(RUTA_CSV, RUTA_SNAPSHOT)
+        df = leer_snapshot(RUTA_SNAPSHOT)
+    return calcular_metricas(df)
+
+
+def _tabla_html(df, formato=None):
+    return df.to_html(index=False, float_format=formato or '{:,.2f}'.format, border=0, classes='tabla')
+
+
+def escribir_reporte(reporte, directorio, png=False):
+    """Escribe tablas (CSV), figuras (HTML y opcionalmente PNG) y un index.html del reporte; devuelve su ruta"""
+    os.makedirs(directorio, exist_ok=True)
+    tablas = {
+        'impacto_eventos': reporte.impacto,
+        'top_crecimientos': reporte.top_mayores,
+        'top_decrecimientos': reporte.top_menores,
+        'anomalias': reporte.anomalias,
+        'cambios_regimen': reporte.cambios,
+        **{f'periodos_{g}': resumen for g, resumen in reporte.periodos.items()},
+    }
+    for nombre, tabla in tablas.items():
+        tabla.to_csv(os.path.join(directorio, f'{nombre}.csv'), index=False)
+    with open(os.path.join(directorio, 'indicadores.json'), 'w') as f:
+        json.dump({'indicadores': reporte.indicadores, 'velocidad': reporte.velocidad}, f, indent=2, default=float)
+
+    imagenes = []
+    for nombre, figura in reporte.figuras.items():
+        figura.write_html(os.path.join(directorio, f'{nombre}.html'), include_plotlyjs='cdn', full_html=True)
+        if png:
+            try:
+                figura.write_image(os.path.join(directorio, f'{nombre}.png'))
+                imagenes.append(nombre)
+            except (ImportError, ValueError, RuntimeError):
+                # write_image requiere kaleido; sin él quedan sólo las figuras HTML
+                png = False
+
+    indicadores = pd.DataFrame([{**reporte.indicadores, **reporte.velocidad}])
+    secciones = [
+        f"<h1>{html.escape(reporte.nombre)}</h1>",
+        f"<p>{reporte.rango[0]} → {reporte.rango[1]} · evento foco: {html.escape(reporte.evento.nombre)} ({reporte.evento.fecha:%Y-%m-%d})</p>",
+        "<h2>Indicadores</h2>", _tabla_html(indicadores),
+        "<h2>Figuras</h2>",
+        "<ul>" + "".join(
+            f'<li><a href="{n}.html">{n}</a>' + (f' · <a href="{n}.png">png</a>' if n in imagenes else '') + '</li>'
+            for n in reporte.figuras
+        ) + "</ul>",
+        "<h2>Impacto por evento y ventana</h2>", _tabla_html(reporte.impacto),
+        "<h2>Resumen mensual</h2>", _tabla_html(reporte.periodos['M']),
+        "<h2>Top 10 crecimientos</h2>", _tabla_html(reporte.top_mayores),
+        "<h2>Top 10 decrecimientos</h2>", _tabla_html(reporte.top_menores),
+        "<h2>Cambios de régimen</h2>", _tabla_html(reporte.cambios, '{:,.4f}'.format),
+        "<h2>Anomalías</h2>", _tabla_html(reporte.anomalias),
+    ]
+    ruta = os.path.join(directorio, 'index.html')
+    with open(ruta, 'w') as f:
+        f.write('<!doctype html><html><head><meta charset="utf-8"><title>' + html.escape(reporte.nombre)
+                + '</title></head><body>' + '\n'.join(secciones) + '</body></html>')
+    return ruta
+
+
+def _inicializar_worker(datos):
+    global _datos_worker
+    _datos_worker = datos
+
+
+def _ejecutar_tarea(tarea):
+    nombre, rango, evento, eventos, directorio, png = tarea
+    inicio = time.perf_counter()
+    try:
+        reporte = generar_reporte(_datos_worker, nombre, rango, evento, eventos)
+    except ValueError as e:
+        # Un rango sin datos no aborta el resto del lote
+        return nombre, None, time.perf_counter() - inicio, str(e)
+    ruta = escribir_reporte(reporte, os.path.join(directorio, nombre), png)
+    return nombre, ruta, time.perf_counter() - inicio, None
+
+
+def tareas_reporte(rangos=(), fechas_eventos=(), eventos=None, directorio=DIRECTORIO_REPORTES, png=False):
+    """Un reporte por rango (con el evento principal) y uno por fecha de evento (sobre todo el período)"""
+    eventos = tuple(eventos or cargar_eventos())
+    tareas = [
+        (f'rango_{inicio}_{fin}', (inicio, fin), EVENTO_PRINCIPAL, eventos, directorio, png)
+        for inicio, fin in rangos
+    ]
+    por_fecha = {e.fecha: e for e in eventos}
+    for fecha in fechas_eventos:
+        evento = por_fecha.get(pd.Timestamp(fecha), Evento(pd.Timestamp(fecha), f'Evento {fecha}', 'otro'))
+        tareas.append((f'evento_{fecha}', None, evento, eventos, directorio, png))
+    if not tareas:
+        tareas.append(('completo', None, EVENTO_PRINCIPAL, eventos, directorio, png))
+    return tareas
+
+
+def generar_reportes(datos, tareas, procesos=None):
+    """Genera los reportes de `tareas` en un pool de procesos; devuelve (nombre, index.html, segundos, error)
+
+    Las tareas sin datos en su rango quedan con index.html None y el motivo en `error`.
+    """
+    if procesos == 1:
+        _inicializar_worker(datos)
+        return [_ejecutar_tarea(t) for t in tareas]
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                             initializer=_inicializar_worker, initargs=(datos,)) as pool:
+        return list(pool.map(_ejecutar_tarea, tareas))
+
+
+def _rango(texto):
+    inicio, fin = texto.split(':')
+    return date.fromisoformat(inicio), date.fromisoformat(fin)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reportes del dashboard REM sin Streamlit, en paralelo')
+    parser.add_argument('--rangos', nargs='*', type=_rango, default=[], metavar='DESDE:HASTA')
+    parser.add_argument('--eventos', nargs='*', type=date.fromisoformat, default=[], metavar='FECHA')
+    parser.add_argument('--salida', default=DIRECTORIO_REPORTES)
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--png', action='store_true', help='Exporta también PNG (requiere kaleido)')
+    parser.add_argument('--bd-local', default=os.environ.get('REM_BD_LOCAL'), help='Base SQLite del motor SQL local')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    datos = cargar_datos(args.bd_local)
+    tareas = tareas_reporte(args.rangos, args.eventos, directorio=args.salida, png=args.png)
+    resultados = generar_reportes(datos, tareas, args.procesos)
+    for nombre, ruta, segundos, error in resultados:
+        print(f'{nombre}: omitido, {error}' if error else f'{nombre}: {ruta} ({segundos:,.2f} s)')
+    generados = sum(error is None for *_, error in resultados)
+    print(f'{generados} de {len(tareas)} reportes en {time.perf_counter() - inicio:,.2f} s')
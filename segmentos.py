@@ -0,0 +1,256 @@
+"""Series diarias por segmento (banda de saldo, cohorte, revenue) agregadas por lotes y en paralelo desde filas por usuario."""
+import argparse
+import multiprocessing
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from consultas import (PROJECT_ID, EstadisticasCarga, construir_consulta_cohortes, construir_consulta_usuarios,
+                       ejecutar_consulta, estimar_bytes, registrar_carga, registrar_ingesta)
+from sincronizacion import FECHA_INICIO_HISTORIA
+
+TAMANO_CHUNK = 200000
+
+DIMENSIONES = {
+    'banda_saldo': 'Banda de saldo',
+    'cohorte': 'Mes de cohorte',
+    'con_revenue': 'Revenue de servicios',
+}
+# Límites de las bandas de saldo por usuario, en CLP
+LIMITES_BANDAS = (100000, 1000000, 10000000)
+ETIQUETAS_BANDAS = ('< 100 mil', '100 mil – 1 MM', '1 MM – 10 MM', '≥ 10 MM')
+ETIQUETAS_REVENUE = ('Sin revenue', 'Con revenue')
+COLUMNAS_SEGMENTOS = ['dimension', 'segmento', 'fecha', 'saldo_rem', 'mau_rem', 'dau_rem']
+
+# Cohorte por usuario de cada proceso del pool, recibida una sola vez al iniciarlo
+_cohortes_worker = None
+
+
+def _lotes_sqlite(ruta, consulta, tamano_chunk):
+    parametros = {nombre: valor.isoformat() for nombre, valor in consulta.parametros.items()}
+    with sqlite3.connect(ruta) as conexion:
+        cursor = conexion.execute(consulta.sql, parametros)
+        columnas = [d[0] for d in cursor.description]
+        while filas := cursor.fetchmany(tamano_chunk):
+            yield pd.DataFrame.from_records(filas, columns=columnas)
+
+
+def _lotes_bigquery(project_id, consulta, tamano_chunk):
+    from google.cloud import bigquery
+
+    cliente = bigquery.Client(project=project_id)
+    config = bigquery.QueryJobConfig(query_parameters=consulta.parametros_bigquery())
+    filas = cliente.query(consulta.sql, job_config=config).result(page_size=tamano_chunk)
+    for lote in filas.to_arrow_iterable():
+        yield lote.to_pandas()
+
+
+def cargar_cohortes(origen, desde=FECHA_INICIO_HISTORIA, hasta=None):
+    """(índice de usuarios, cohorte YYYYMM de cada uno) con una sola consulta acotada a [desde, hasta]"""
+    tipo, destino = origen
+    consulta = construir_consulta_cohortes(desde, hasta, dialecto='sqlite' if tipo == 'sqlite' else 'bigquery')
+    if tipo == 'sqlite':
+        parametros = {nombre: valor.isoformat() for nombre, valor in consulta.parametros.items()}
+        inicio = time.perf_counter()
+        with sqlite3.connect(destino) as conexion:
+            df = pd.read_sql_query(consulta.sql, conexion, params=parametros)
+        registrar_ingesta(consulta, df, inicio, 'sqlite')
+    else:
+        df = ejecutar_consulta(consulta, destino)
+    return pd.Index(df['user']), df['cohorte'].to_numpy(dtype=np.int64)
+
+
+def _cohorte_de(usuarios, cohortes):
+    """Cohorte de cada usuario del lote; 0 si no aparece en cohorts_cuenta_rem"""
+    indice, valores = cohortes
+    posiciones = indice.get_indexer(usuarios)
+    return np.where(posiciones >= 0, valores[posiciones], 0)
+
+
+def _codigos_segmento(lote, cohortes):
+    """Código de segmento de cada fila para cada dimensión"""
+    return {
+        'banda_saldo': np.searchsorted(LIMITES_BANDAS, lote['saldo'].to_numpy(dtype=float), side='right'),
+        'cohorte': _cohorte_de(lote['user_id'].to_numpy(), cohortes),
+        'con_revenue': lote['con_revenue'].to_numpy(dtype=np.int64),
+    }
+
+
+class AgregadoMes:
+    """Agregado parcial de un mes: sumas por (día, segmento) y usuarios ya vistos por segmento
+
+    Los lotes llegan ordenados por fecha, así que la primera aparición de un (segmento,
+    usuario) dentro del mes es la que cuenta para el MAU acumulado.
+    """
+
+    def __init__(self, cohortes):
+        self.cohortes = cohortes
+        self._parciales = []
+        self._vistos = {dimension: np.empty(0, dtype=np.uint64) for dimension in DIMENSIONES}
+
+    def agregar(self, lote):
+        usuarios = lote['user_id'].to_numpy()
+        for dimension, codigos in _codigos_segmento(lote, self.cohortes).items():
+            claves = pd.util.hash_pandas_object(
+                pd.DataFrame({'segmento': codigos, 'usuario': usuarios}), index=False
+            ).to_numpy()
+            unicas, primeras = np.unique(claves, return_index=True)
+            nuevas = ~np.isin(unicas, self._vistos[dimension], assume_unique=True)
+            self._vistos[dimension] = np.union1d(self._vistos[dimension], unicas[nuevas])
+            primera_vez = np.zeros(len(lote), dtype=np.int64)
+            primera_vez[primeras[nuevas]] = 1
+
+            parcial = pd.DataFrame({
+                'dia': lote['dia'].to_numpy(),
+                'segmento': codigos,
+                'saldo_rem': lote['saldo'].to_numpy(dtype=float),
+                'dau_rem': 1,
+                'nuevos': primera_vez,
+            }).groupby(['dia', 'segmento'], as_index=False).sum()
+            parcial.insert(0, 'dimension', dimension)
+            self._parciales.append(parcial)
+
+        # Se combinan los parciales para que la memoria dependa de días x segmentos, no de lotes
+        if len(self._parciales) > 2 * len(DIMENSIONES):
+            self._parciales = [self.resultado()]
+
+    def resultado(self):
+        if not self._parciales:
+            return pd.DataFrame(columns=['dimension', 'dia', 'segmento', 'saldo_rem', 'dau_rem', 'nuevos'])
+        return pd.concat(self._parciales, ignore_index=True).groupby(
+            ['dimension', 'dia', 'segmento'], as_index=False
+        ).sum()
+
+
+def _agregar_tramo(origen, desde, hasta, tamano_chunk=TAMANO_CHUNK, cohortes=None):
+    """(agregado del tramo, segundos, filas por usuario leídas)"""
+    inicio = time.perf_counter()
+    tipo, destino = origen
+    cohortes = cohortes or _cohortes_worker or cargar_cohortes(origen, min(desde, FECHA_INICIO_HISTORIA), hasta)
+    consulta = construir_consulta_usuarios(desde, hasta, dialecto='sqlite' if tipo == 'sqlite' else 'bigquery')
+    lotes = _lotes_sqlite(destino, consulta, tamano_chunk) if tipo == 'sqlite' else _lotes_bigquery(destino, consulta, tamano_chunk)
+
+    agregado = AgregadoMes(cohortes)
+    filas = 0
+    for lote in lotes:
+        agregado.agregar(lote)
+        filas += len(lote)
+    resultado = agregado.resultado()
+    resultado['fecha'] = pd.Timestamp(desde) + pd.to_timedelta(resultado['dia'].astype(np.int64), unit='D')
+    return resultado.drop(columns='dia'), time.perf_counter() - inicio, filas
+
+
+def agregar_mes(origen, desde, hasta, tamano_chunk=TAMANO_CHUNK, cohortes=None):
+    """Agregado de [desde, hasta], dentro de un mismo mes, leyendo las filas por lotes
+
+    `origen` es ('sqlite', ruta) o ('bigquery', project_id). `cohortes` es el resultado de
+    `cargar_cohortes`; sin él se consulta para este tramo.
+    """
+    return _agregar_tramo(origen, desde, hasta, tamano_chunk, cohortes)[0]
+
+
+def _inicializar_worker(cohortes):
+    global _cohortes_worker
+    _cohortes_worker = cohortes
+
+
+def _meses(desde, hasta):
+    """Tramos [inicio, fin] de a un mes calendario que cubren [desde, hasta]"""
+    tramos = []
+    inicio = desde
+    while inicio <= hasta:
+        siguiente = (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+        tramos.append((inicio, min(siguiente - timedelta(days=1), hasta)))
+        inicio = siguiente
+    return tramos
+
+
+def _etiquetar(dimension, codigos):
+    if dimension == 'banda_saldo':
+        return np.asarray(ETIQUETAS_BANDAS)[codigos]
+    if dimension == 'con_revenue':
+        return np.asarray(ETIQUETAS_REVENUE)[codigos]
+    etiquetas = np.char.add(np.char.add((codigos // 100).astype(str), '-'), np.char.zfill((codigos % 100).astype(str), 2))
+    return np.where(codigos > 0, etiquetas, 'Sin cohorte')
+
+
+def agregar_segmentos(origen, desde, hasta=None, procesos=None, tamano_chunk=TAMANO_CHUNK):
+    """Series diarias (saldo, MAU, DAU) por dimensión y segmento, un mes por tarea en un pool de procesos
+
+    Como el MAU es acumulado dentro del mes y cada tarea cubre un mes completo, los
+    distintos de cada tarea no se solapan y la combinación final es una concatenación.
+    Las cohortes se consultan una sola vez y cada tarea recibe las suyas al iniciar el
+    proceso; así cada consulta mensual sólo toca las particiones de su mes. En BigQuery
+    cada tramo pasa antes por un dry-run y todos quedan en el historial de cargas.
+    """
+    hasta = hasta or date.today() - timedelta(days=2)
+    tramos = _meses(desde, hasta)
+    tipo, destino = origen
+    cohortes = cargar_cohortes(origen, min(desde, FECHA_INICIO_HISTORIA), hasta)
+    bytes_estimados = [
+        estimar_bytes(construir_consulta_usuarios(inicio, fin), destino) if tipo == 'bigquery' else None
+        for inicio, fin in tramos
+    ]
+    if procesos == 1:
+        resultados = [_agregar_tramo(origen, inicio, fin, tamano_chunk, cohortes) for inicio, fin in tramos]
+    else:
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                                 initializer=_inicializar_worker, initargs=(cohortes,)) as pool:
+            resultados = list(pool.map(_agregar_tramo, *zip(*[(origen, inicio, fin, tamano_chunk) for inicio, fin in tramos])))
+
+    for (inicio, fin), estimados, (parcial, segundos, filas) in zip(tramos, bytes_estimados, resultados):
+        registrar_carga(EstadisticasCarga(
+            desde=inicio, hasta=fin, bytes_estimados=estimados, segundos=segundos, filas=filas,
+            momento=time.time(), modo=f'{tipo}-lotes', bytes_memoria=int(parcial.memory_usage(deep=True).sum()),
+        ))
+
+    parciales = [parcial for parcial, _, _ in resultados if len(parcial) > 0]
+    if not parciales:
+        return pd.DataFrame(columns=COLUMNAS_SEGMENTOS).astype(
+            {'fecha': 'datetime64[ns]', 'saldo_rem': float, 'mau_rem': np.int64, 'dau_rem': np.int64})
+    df = pd.concat(parciales, ignore_index=True)
+    df = df.astype({'segmento': np.int64, 'saldo_rem': float, 'dau_rem': np.int64, 'nuevos': np.int64})
+    df['saldo_rem'] = df['saldo_rem'] / 1000000
+    df = df.sort_values(['dimension', 'segmento', 'fecha']).reset_index(drop=True)
+    df['mau_rem'] = df.groupby(['dimension', 'segmento', df['fecha'].dt.to_period('M')])['nuevos'].cumsum()
+    for dimension in DIMENSIONES:
+        filas = df['dimension'] == dimension
+        df.loc[filas, 'etiqueta'] = _etiquetar(dimension, df.loc[filas, 'segmento'].to_numpy(dtype=np.int64))
+    return df[['dimension', 'etiqueta', 'fecha', 'saldo_rem', 'mau_rem', 'dau_rem']].rename(columns={'etiqueta': 'segmento'})
+
+
+def segmentos_de(segmentos, dimension):
+    """Segmentos de una dimensión, en el orden de sus códigos (bandas crecientes, cohortes por mes)"""
+    return list(segmentos.loc[segmentos['dimension'] == dimension, 'segmento'].unique())
+
+
+def serie_segmento(segmentos, dimension, segmento):
+    """Serie diaria (fecha, saldo_rem, mau_rem, dau_rem) de un segmento, con el formato del dataset global
+
+    El formato es el mismo pero `mau_rem` no: acá es la cantidad de usuarios distintos con
+    pago exitoso en interest_payment en lo que va del mes, mientras que el MAU global sale
+    de cohorts_cuenta_rem (suma acumulada en el mes de los usuarios de cada día). Por eso
+    el MAU de las bandas no suma el MAU del tablero; el saldo y el DAU sí.
+    """
+    filas = (segmentos['dimension'] == dimension) & (segmentos['segmento'] == segmento)
+    return segmentos.loc[filas, ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agregación por segmento desde filas por usuario')
+    parser.add_argument('ruta', nargs='?', help='Base SQLite con las tablas de usuarios; sin ruta se usa BigQuery')
+    parser.add_argument('--desde', type=date.fromisoformat, default=date(2025, 1, 1))
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=TAMANO_CHUNK)
+    args = parser.parse_args()
+
+    origen = ('sqlite', args.ruta) if args.ruta else ('bigquery', PROJECT_ID)
+    inicio = time.perf_counter()
+    resultado = agregar_segmentos(origen, args.desde, procesos=args.procesos, tamano_chunk=args.chunk)
+    print(resultado.groupby(['dimension', 'segmento']).tail(1).to_string(index=False))
+    print(f'{len(resultado):,} filas (día, segmento) en {time.perf_counter() - inicio:,.2f} s')
@@ -0,0 +1,167 @@
+"""Sincronización incremental de los datos diarios REM contra un almacén local particionado por fecha."""
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import pandas as pd
+import pyarrow as pa
+
+from snapshot import escribir_snapshot, leer_tabla_snapshot
+
+DIRECTORIO_ALMACEN = '.almacen_rem'
+FECHA_INICIO_HISTORIA = date(2025, 1, 1)
+VENTANA_LLEGADA_TARDIA_DIAS = 2
+COLUMNAS_BASE = ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']
+
+
+@dataclass
+class ResultadoSincronizacion:
+    """Resumen de una sincronización: rango consultado y filas traídas"""
+    desde: date
+    marca_agua_anterior: date
+    marca_agua: date
+    filas_traidas: int
+
+
+class AlmacenParticionado:
+    """Almacén local de filas diarias, una partición por mes de `fecha` más una marca de agua"""
+
+    def __init__(self, directorio=DIRECTORIO_ALMACEN):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    @property
+    def _ruta_meta(self):
+        return os.path.join(self.directorio, '_meta.json')
+
+    def _ruta_particion(self, mes):
+        return os.path.join(self.directorio, f'fecha={mes}.arrow')
+
+    def marca_agua(self):
+        """Última fecha almacenada, o None si el almacén está vacío"""
+        if not os.path.exists(self._ruta_meta):
+            return None
+        with open(self._ruta_meta) as f:
+            meta = json.load(f)
+        return date.fromisoformat(meta['marca_agua'])
+
+    def momento_sincronizacion(self):
+        """Epoch de la última sincronización (cuando se escribió la marca de agua), o None"""
+        if not os.path.exists(self._ruta_meta):
+            return None
+        return os.path.getmtime(self._ruta_meta)
+
+    def particiones(self):
+        """Meses ('YYYY-MM') con partición escrita, ordenados"""
+        return sorted(
+            nombre[len('fecha='):-len('.arrow')]
+            for nombre in os.listdir(self.directorio)
+            if nombre.startswith('fecha=') and nombre.endswith('.arrow')
+        )
+
+    @staticmethod
+    def _vacio():
+        return pd.DataFrame({c: pd.Series(dtype='datetime64[ms]' if c == 'fecha' else 'float64') for c in COLUMNAS_BASE})
+
+    def _leer_particion(self, mes):
+        ruta = self._ruta_particion(mes)
+        if not os.path.exists(ruta):
+            return self._vacio()
+        return leer_tabla_snapshot(ruta).to_pandas(date_as_object=False)
+
+    def _escribir_particion(self, mes, df):
+        escribir_snapshot(df, self._ruta_particion(mes))
+
+    def leer(self, desde=None, hasta=None):
+        """Lee las filas en [desde, hasta] abriendo sólo las particiones de ese rango"""
+        meses = self.particiones()
+        if desde is not None:
+            meses = [m for m in meses if m >= f'{desde:%Y-%m}']
+        if hasta is not None:
+            meses = [m for m in meses if m <= f'{hasta:%Y-%m}']
+        if not meses:
+            return self._vacio()
+
+        tabla = pa.concat_tables([leer_tabla_snapshot(self._ruta_particion(m)) for m in meses])
+        df = tabla.to_pandas(date_as_object=False)
+        if desde is not None:
+            df = df[df['fecha'] >= pd.Timestamp(desde)]
+        if hasta is not None:
+            df = df[df['fecha'] <= pd.Timestamp(hasta)]
+        return df.sort_values('fecha').reset_index(drop=True)
+
+    def fusionar(self, df_nuevo, desde):
+        """Reemplaza todo lo almacenado desde `desde` por `df_nuevo` y avanza la marca de agua"""
+        columnas = COLUMNAS_BASE + [c for c in df_nuevo.columns if c not in COLUMNAS_BASE]
+        df_nuevo = df_nuevo[columnas].copy()
+        df_nuevo['fecha'] = pd.to_datetime(df_nuevo['fecha'])
+        df_nuevo = df_nuevo[df_nuevo['fecha'] >= pd.Timestamp(desde)]
+        mes_desde = f'{desde:%Y-%m}'
+
+        # Sólo se reescriben las particiones desde el mes de `desde`
+        meses_nuevos = set(df_nuevo['fecha'].dt.strftime('%Y-%m'))
+        meses_afectados = sorted(meses_nuevos | {m for m in self.particiones() if m >= mes_desde})
+
+        for mes in meses_afectados:
+            existente = self._leer_particion(mes)
+            existente = existente[existente['fecha'] < pd.Timestamp(desde)]
+            nuevo_mes = df_nuevo[df_nuevo['fecha'].dt.strftime('%Y-%m') == mes]
+            particion = pd.concat([existente, nuevo_mes], ignore_index=True)
+            if len(particion) == 0:
+                if os.path.exists(self._ruta_particion(mes)):
+                    os.remove(self._ruta_particion(mes))
+                continue
+            self._escribir_particion(mes, particion.sort_values('fecha'))
+
+        marca_anterior = self.marca_agua()
+        if len(df_nuevo) > 0:
+            marca = df_nuevo['fecha'].max().date()
+        elif marca_anterior is not None and marca_anterior >= desde:
+            # El rango re-consultado vino vacío: la marca retrocede a lo que quedó guardado
+            marca = desde - timedelta(days=1)
+        else:
+            marca = marca_anterior
+        if marca is not None:
+            tmp = self._ruta_meta + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'marca_agua': marca.isoformat()}, f)
+            os.replace(tmp, self._ruta_meta)
+        return marca
+
+
+class FuenteLocal:
+    """Fuente de reemplazo sin red: sirve un DataFrame y registra cada rango consultado"""
+
+    def __init__(self, df):
+        self.df = df.copy()
+        self.df['fecha'] = pd.to_datetime(self.df['fecha'])
+        self.consultas = []
+
+    def __call__(self, desde):
+        resultado = self.df[self.df['fecha'] >= pd.Timestamp(desde)][COLUMNAS_BASE]
+        self.consultas.append((desde, len(resultado)))
+        return resultado.reset_index(drop=True)
+
+
+def calcular_desde(marca_agua, ventana_tardia_dias=VENTANA_LLEGADA_TARDIA_DIAS):
+    """Primer día a re-consultar dada la marca de agua y la ventana de llegadas tardías"""
+    if marca_agua is None:
+        return FECHA_INICIO_HISTORIA
+    desde = marca_agua - timedelta(days=ventana_tardia_dias)
+    # mau_rem es acumulado dentro del mes, así que se re-consulta desde el día 1 de ese mes
+    return max(desde.replace(day=1), FECHA_INICIO_HISTORIA)
+
+
+def sincronizar(fuente, almacen, ventana_tardia_dias=VENTANA_LLEGADA_TARDIA_DIAS):
+    """Trae de `fuente` sólo los días posteriores a la marca de agua (más la ventana tardía) y los fusiona"""
+    marca_anterior = almacen.marca_agua()
+    desde = calcular_desde(marca_anterior, ventana_tardia_dias)
+    df_nuevo = fuente(desde)
+    marca = almacen.fusionar(df_nuevo, desde)
+    return ResultadoSincronizacion(
+        desde=desde,
+        marca_agua_anterior=marca_anterior,
+        marca_agua=marca,
+        filas_traidas=len(df_nuevo),
+    )
@@ -0,0 +1,167 @@
+"""Snapshot columnar local (Arrow IPC) con esquema compacto y lecturas mapeadas en memoria."""
+import argparse
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+RUTA_CSV = 'datos_saldo_detallado.csv'
+RUTA_SNAPSHOT = 'datos_saldo_detallado.arrow'
+# Snapshot con las métricas derivadas ya calculadas: el arranque no parsea ni deriva nada
+RUTA_SNAPSHOT_PROCESADO = 'datos_saldo_procesado.arrow'
+METADATO_VERSION = b'version_datos'
+METADATO_DERIVACION = b'version_derivacion'
+
+# Tipos explícitos de las columnas conocidas; el resto se infiere de forma compacta
+TIPOS_COLUMNAS = {
+    'fecha': pa.date32(),
+    'saldo_rem': pa.float64(),
+    'mau_rem': pa.int32(),
+    'dau_rem': pa.int32(),
+    'año_mes': pa.dictionary(pa.int16(), pa.string()),
+    'producto': pa.dictionary(pa.int16(), pa.string()),
+}
+
+
+def _tipo_columna(nombre, serie):
+    if nombre in TIPOS_COLUMNAS:
+        return TIPOS_COLUMNAS[nombre]
+    if pd.api.types.is_float_dtype(serie):
+        return pa.float64()
+    if pd.api.types.is_integer_dtype(serie):
+        return pa.int32() if serie.abs().max() < 2**31 else pa.int64()
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return pa.date32()
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def esquema_para(df):
+    """Esquema Arrow compacto para las columnas de `df`"""
+    return pa.schema([pa.field(c, _tipo_columna(c, df[c])) for c in df.columns])
+
+
+def a_tabla_arrow(df):
+    """Convierte un DataFrame a tabla Arrow con el esquema compacto"""
+    df = df.copy()
+    if 'fecha' in df.columns:
+        df['fecha'] = pd.to_datetime(df['fecha'])
+    return pa.Table.from_pandas(df, schema=esquema_para(df), preserve_index=False)
+
+
+def compactar_tabla(tabla):
+    """Castea las columnas conocidas de `tabla` a los tipos de TIPOS_COLUMNAS sin pasar por pandas"""
+    for i, nombre in enumerate(tabla.column_names):
+        tipo = TIPOS_COLUMNAS.get(nombre)
+        if tipo is not None and tabla.schema.field(i).type != tipo:
+            tabla = tabla.set_column(i, nombre, tabla.column(i).cast(tipo))
+    return tabla
+
+
+def tabla_a_dataframe(tabla):
+    """DataFrame con los tipos compactos del snapshot a partir de una tabla Arrow"""
+    return compactar_tabla(tabla).to_pandas(date_as_object=False)
+
+
+def escribir_snapshot(df, ruta=RUTA_SNAPSHOT):
+    """Escribe `df` como archivo Arrow IPC sin compresión (apto para memory-map)"""
+    tabla = df if isinstance(df, pa.Table) else a_tabla_arrow(df)
+    # Temporal propio de cada proceso/hilo: varios pueden escribir la misma ruta a la vez
+    tmp = f'{ruta}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+    os.replace(tmp, ruta)
+
+
+def leer_tabla_snapshot(ruta=RUTA_SNAPSHOT, columnas=None):
+    """Lee el snapshot como tabla Arrow mapeada en memoria, proyectando sólo `columnas`"""
+    with pa.memory_map(ruta, 'r') as fuente:
+        tabla = pa.ipc.open_file(fuente).read_all()
+    if columnas is not None:
+        tabla = tabla.select(columnas)
+    return tabla
+
+
+def leer_snapshot(ruta=RUTA_SNAPSHOT, columnas=None):
+    """Lee el snapshot como DataFrame: `fecha` datetime64, enteros int32 y meses categóricos"""
+    return tabla_a_dataframe(leer_tabla_snapshot(ruta, columnas))
+
+
+def snapshot_vigente(ruta_snapshot=RUTA_SNAPSHOT, ruta_csv=RUTA_CSV):
+    """True si el snapshot existe y no es más antiguo que el CSV de origen"""
+    if not os.path.exists(ruta_snapshot):
+        return False
+    if not os.path.exists(ruta_csv):
+        return True
+    return os.path.getmtime(ruta_snapshot) >= os.path.getmtime(ruta_csv)
+
+
+def convertir_csv_a_snapshot(ruta_csv=RUTA_CSV, ruta_snapshot=RUTA_SNAPSHOT):
+    """Convierte el CSV de datos al snapshot columnar"""
+    df = pd.read_csv(ruta_csv, parse_dates=['fecha'])
+    escribir_snapshot(df, ruta_snapshot)
+    return ruta_snapshot
+
+
+def escribir_snapshot_procesado(datos, version, ruta=RUTA_SNAPSHOT_PROCESADO, version_derivacion=None):
+    """Escribe un dataset con métricas derivadas, guardando en el esquema la versión de sus datos crudos
+    y la de la derivación que lo produjo
+    """
+    if version_derivacion is None:
+        from metricas import VERSION_DERIVACION as version_derivacion
+    tabla = a_tabla_arrow(datos)
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}),
+        METADATO_VERSION: version.encode(),
+        METADATO_DERIVACION: version_derivacion.encode(),
+    })
+    escribir_snapshot(tabla, ruta)
+    return ruta
+
+
+def snapshot_procesado_vigente(ruta=RUTA_SNAPSHOT_PROCESADO, ruta_csv=RUTA_CSV, version_derivacion=None):
+    """True si el snapshot procesado no es más antiguo que el CSV y lo escribió la derivación actual"""
+    if not snapshot_vigente(ruta, ruta_csv):
+        return False
+    if version_derivacion is None:
+        from metricas import VERSION_DERIVACION as version_derivacion
+    try:
+        with pa.memory_map(ruta, 'r') as fuente:
+            metadatos = pa.ipc.open_file(fuente).schema.metadata or {}
+    except pa.ArrowInvalid:
+        return False
+    return metadatos.get(METADATO_DERIVACION) == version_derivacion.encode()
+
+
+def leer_snapshot_procesado(ruta=RUTA_SNAPSHOT_PROCESADO):
+    """Dataset con métricas derivadas y su versión en `attrs`; None si el archivo no es un snapshot procesado"""
+    tabla = leer_tabla_snapshot(ruta)
+    version = (tabla.schema.metadata or {}).get(METADATO_VERSION)
+    if version is None:
+        return None
+    df = tabla_a_dataframe(tabla)
+    df.attrs['version_datos'] = version.decode()
+    df.attrs['metricas_derivadas'] = True
+    return df
+
+
+def construir_snapshot_procesado(ruta_csv=RUTA_CSV, ruta=RUTA_SNAPSHOT_PROCESADO):
+    """Parsea el CSV, deriva las métricas y escribe el snapshot procesado; es lo que ahorra el arranque"""
+    from metricas import calcular_metricas, version_datos
+
+    base = tabla_a_dataframe(a_tabla_arrow(pd.read_csv(ruta_csv, parse_dates=['fecha'])))
+    return escribir_snapshot_procesado(calcular_metricas(base), version_datos(base), ruta)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convierte el CSV de datos REM a snapshot Arrow IPC')
+    parser.add_argument('csv', nargs='?', default=RUTA_CSV)
+    parser.add_argument('snapshot', nargs='?', default=None)
+    parser.add_argument('--procesado', action='store_true', help='Incluye las métricas derivadas (snapshot de arranque)')
+    args = parser.parse_args()
+    if args.procesado:
+        ruta = construir_snapshot_procesado(args.csv, args.snapshot or RUTA_SNAPSHOT_PROCESADO)
+    else:
+        ruta = convertir_csv_a_snapshot(args.csv, args.snapshot or RUTA_SNAPSHOT)
+    print(f'Snapshot escrito en {ruta}')
@@ -0,0 +1,126 @@
+"""Generación de SQL con funciones de ventana que calcula en el warehouse las mismas métricas que `metricas.py`."""
+import sqlite3
+
+import pandas as pd
+
+from metricas import COLUMNAS_BASE, COLUMNAS_EXTREMOS_MES, calcular_metricas
+
+# Filas previas que necesitan las ventanas (rezago de 30 días), con holgura por días faltantes
+DIAS_CONTEXTO_VENTANAS = 45
+
+COLUMNAS_SQL = [
+    'saldo_crecimiento_absoluto_diario', 'saldo_crecimiento_pct_diario',
+    'saldo_crecimiento_absoluto_semanal', 'saldo_crecimiento_pct_semanal',
+    'saldo_crecimiento_absoluto_mensual', 'saldo_crecimiento_pct_mensual',
+    'saldo_ma7', 'crecimiento_diario_ma7', 'saldo_crecimiento_absoluto_diario_ma7',
+    'saldo_por_mau', 'dau_mau_ratio', 'año_mes', *COLUMNAS_EXTREMOS_MES,
+]
+# Los identificadores SQL no llevan ñ; se renombra al leer el resultado
+RENOMBRES_SQL = {'anio_mes': 'año_mes'}
+
+_DIALECTOS = {
+    'bigquery': {
+        'float': 'FLOAT64',
+        'mes': "FORMAT_DATE('%Y-%m', fecha)",
+        'fecha': "DATE '{}'",
+        # x/0 da ±inf y 0/0 NaN, como pandas; '/' aborta la consulta
+        'dividir': 'IEEE_DIVIDE({}, {})',
+    },
+    'sqlite': {
+        'float': 'REAL',
+        'mes': "strftime('%Y-%m', fecha)",
+        'fecha': "'{}'",
+        # SQLite devuelve NULL al dividir por cero; se emula ±inf (9e999) para igualar a pandas
+        'dividir': 'CASE WHEN {1} = 0 THEN CASE WHEN {0} > 0 THEN 9e999 WHEN {0} < 0 THEN -9e999 END ELSE {0} / {1} END',
+    },
+}
+
+
+def sql_metricas_derivadas(fuente, dialecto='bigquery', desde=None):
+    """SQL que devuelve las columnas base más las métricas derivadas a partir de `fuente`
+
+    `fuente` es una tabla o subconsulta con fecha, saldo_rem, mau_rem y dau_rem. Si se
+    indica `desde`, las ventanas se calculan sobre toda la fuente pero sólo se devuelven
+    las filas desde esa fecha.
+    """
+    d = _DIALECTOS[dialecto]
+    flotante = d['float']
+
+    def dividir(numerador, denominador):
+        return d['dividir'].format(numerador, denominador)
+
+    orden = 'ORDER BY fecha'
+    ventana_7 = f'{orden} ROWS BETWEEN 6 PRECEDING AND CURRENT ROW'
+    mes_completo = f"PARTITION BY anio_mes {orden} ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING"
+    filtro = f"WHERE fecha >= {d['fecha'].format(f'{desde:%Y-%m-%d}')}" if desde is not None else ''
+
+    return f"""
+    WITH base AS (
+      SELECT fecha, saldo_rem, mau_rem, dau_rem, {d['mes']} AS anio_mes
+      FROM {fuente}
+    ),
+    rezagos AS (
+      SELECT
+        *,
+        saldo_rem - LAG(saldo_rem, 1) OVER ({orden}) AS saldo_crecimiento_absoluto_diario,
+        ({dividir('saldo_rem', f'LAG(saldo_rem, 1) OVER ({orden})')} - 1) * 100 AS saldo_crecimiento_pct_diario,
+        saldo_rem - LAG(saldo_rem, 7) OVER ({orden}) AS saldo_crecimiento_absoluto_semanal,
+        ({dividir('saldo_rem', f'LAG(saldo_rem, 7) OVER ({orden})')} - 1) * 100 AS saldo_crecimiento_pct_semanal,
+        saldo_rem - LAG(saldo_rem, 30) OVER ({orden}) AS saldo_crecimiento_absoluto_mensual,
+        ({dividir('saldo_rem', f'LAG(saldo_rem, 30) OVER ({orden})')} - 1) * 100 AS saldo_crecimiento_pct_mensual,
+        AVG(saldo_rem) OVER ({ventana_7}) AS saldo_ma7
+      FROM base
+    ),
+    metricas AS (
+      SELECT
+        fecha, saldo_rem, mau_rem, dau_rem,
+        saldo_crecimiento_absoluto_diario, saldo_crecimiento_pct_diario,
+        saldo_crecimiento_absoluto_semanal, saldo_crecimiento_pct_semanal,
+        saldo_crecimiento_absoluto_mensual, saldo_crecimiento_pct_mensual,
+        saldo_ma7,
+        AVG(saldo_crecimiento_pct_diario) OVER ({ventana_7}) AS crecimiento_diario_ma7,
+        CASE WHEN COUNT(saldo_crecimiento_absoluto_diario) OVER ({ventana_7}) = 7
+             THEN AVG(saldo_crecimiento_absoluto_diario) OVER ({ventana_7}) END AS saldo_crecimiento_absoluto_diario_ma7,
+        {dividir('saldo_rem', f'CAST(mau_rem AS {flotante})')} * 1000000 AS saldo_por_mau,
+        {dividir(f'CAST(dau_rem AS {flotante})', 'mau_rem')} * 100 AS dau_mau_ratio,
+        anio_mes,
+        FIRST_VALUE(saldo_rem) OVER ({mes_completo}) AS saldo_inicial_mes,
+        LAST_VALUE(saldo_rem) OVER ({mes_completo}) AS saldo_final_mes
+      FROM rezagos
+    )
+    SELECT * FROM metricas
+    {filtro}
+    ORDER BY fecha
+    """
+
+
+def calcular_metricas_sql_local(df, desde=None):
+    """Ejecuta el SQL de métricas sobre `df` en un SQLite en memoria (paridad y uso sin red)"""
+    base = df[COLUMNAS_BASE].copy()
+    base['fecha'] = pd.to_datetime(base['fecha']).dt.strftime('%Y-%m-%d')
+    with sqlite3.connect(':memory:') as conexion:
+        base.to_sql('diario', conexion, index=False)
+        resultado = pd.read_sql_query(sql_metricas_derivadas('diario', 'sqlite', desde), conexion)
+    resultado['fecha'] = pd.to_datetime(resultado['fecha'])
+    return resultado.rename(columns=RENOMBRES_SQL)
+
+
+def diferencias_con_pandas(df):
+    """Máxima diferencia relativa por columna entre el cálculo SQL local y `calcular_metricas`"""
+    esperado = calcular_metricas(df)
+    obtenido = calcular_metricas_sql_local(df)
+    diferencias = {}
+    for columna in COLUMNAS_SQL:
+        if columna not in esperado.columns:
+            continue
+        if columna == 'año_mes':
+            diferencias[columna] = float((esperado[columna].astype(str) != obtenido[columna]).sum())
+            continue
+        a = esperado[columna].to_numpy(dtype=float)
+        b = obtenido[columna].to_numpy(dtype=float)
+        nulos_distintos = (pd.isna(a) != pd.isna(b)).sum()
+        comparables = ~pd.isna(a) & ~pd.isna(b) & (a != b)  # iguales incluye ±inf en ambos
+        a, b = a[comparables], b[comparables]
+        relativa = abs(a - b) / abs(a).clip(min=1)
+        diferencias[columna] = float(max(relativa.max(initial=0), nulos_distintos))
+    return diferencias
@@ -0,0 +1,42 @@
+"""Cortes por rango de fechas con búsqueda binaria y paginación de tablas."""
+import math
+
+import numpy as np
+
+
+def indices_rango(fechas, inicio, fin):
+    """(i, j) tales que fechas[i:j] cae en los días [inicio, fin]; `fechas` ordenadas"""
+    fechas = np.asarray(fechas)
+    i = np.searchsorted(fechas, np.datetime64(inicio, 'D').astype(fechas.dtype), side='left')
+    j = np.searchsorted(fechas, (np.datetime64(fin, 'D') + 1).astype(fechas.dtype), side='left')
+    return int(i), int(max(i, j))
+
+
+def recortar_rango(df, rango):
+    """Filas con `fecha` dentro de los días de `rango` (inclusive); `df` ordenado por fecha"""
+    if rango is None:
+        return df
+    i, j = indices_rango(df['fecha'].to_numpy(), rango[0], rango[1])
+    return df.iloc[i:j]
+
+
+def ventana_alrededor(df, fecha, dias):
+    """Filas de los `dias` días antes y después de `fecha`, inclusive"""
+    fecha = np.datetime64(fecha, 'D')
+    return recortar_rango(df, (fecha - dias, fecha + dias))
+
+
+def total_paginas(filas, tamano_pagina):
+    """Cantidad de páginas (al menos una) para `filas` filas"""
+    return max(1, math.ceil(filas / tamano_pagina))
+
+
+def pagina(df, numero, tamano_pagina):
+    """Filas de la página `numero` (desde 1)"""
+    inicio = (numero - 1) * tamano_pagina
+    return df.iloc[inicio:inicio + tamano_pagina]
+
+
+def formatear_pagina(df, formatos):
+    """Styler sólo de las filas recibidas; aplicar a una página, nunca al dataset completo"""
+    return df.style.format(formatos)
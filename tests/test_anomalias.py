@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomalias import UMBRAL_Z, cambios_de_regimen, detectar, pelt, zscores_robustos
+from metricas import calcular_metricas
+
+
+def serie(dias=365, semilla=11):
+    generador = np.random.default_rng(semilla)
+    fechas = pd.date_range('2025-01-01', periods=dias, freq='D')
+    saldo = 1000 * np.cumprod(1 + generador.normal(0.002, 0.002, dias))
+    # MAU acumulado dentro del mes y DAU estable: DAU/MAU con diente de sierra mensual
+    dia_mes = fechas.day.to_numpy()
+    mau = (2000 + 40 * dia_mes + generador.normal(0, 5, dias)).round()
+    dau = (1500 + generador.normal(0, 15, dias)).round()
+    return pd.DataFrame({'fecha': fechas, 'saldo_rem': saldo, 'mau_rem': mau, 'dau_rem': dau})
+
+
+def test_outlier_plantado_es_la_mayor_anomalia():
+    base = serie()
+    base.loc[200, 'dau_rem'] *= 1.6
+    datos = calcular_metricas(base)
+    zscores, _ = zscores_robustos(datos)
+    assert zscores['dau_rem'].abs().idxmax() == 200
+    assert zscores.loc[200, 'dau_rem'] > 3 * UMBRAL_Z
+
+    anomalias = detectar(datos).anomalias
+    dau = anomalias[anomalias['columna'] == 'dau_rem']
+    assert dau.iloc[0]['fecha'] == datos.loc[200, 'fecha']
+    # La tendencia es una mediana: el outlier no contamina los z de sus vecinos
+    vecinos = zscores.loc[[195, 196, 197, 203, 204, 205], 'dau_rem'].abs()
+    assert (vecinos < UMBRAL_Z).all()
+
+
+def test_pelt_encuentra_escalon_plantado():
+    generador = np.random.default_rng(5)
+    x = np.r_[generador.normal(0, 1, 200), generador.normal(3, 1, 150)]
+    cambios = pelt(x)
+    assert len(cambios) == 1
+    assert abs(cambios[0] - 200) <= 3
+
+
+def test_pelt_sin_cambios_en_ruido():
+    generador = np.random.default_rng(6)
+    assert pelt(generador.normal(0, 1, 500)) == []
+
+
+def test_escalon_en_dau_mau_con_diente_de_sierra():
+    base = serie()
+    base.loc[180:, 'dau_rem'] *= 1.08
+    cambios = cambios_de_regimen(calcular_metricas(base))
+    dau_mau = cambios[cambios['columna'] == 'dau_mau_ratio']
+    # Un solo régimen nuevo, sin cortes en cada inicio o mitad de mes
+    assert len(dau_mau) == 1
+    assert abs((dau_mau.iloc[0]['fecha'] - base.loc[180, 'fecha']).days) <= 3
+    assert dau_mau.iloc[0]['cambio'] > 0
+
+
+def test_pelt_en_serie_larga_constante_no_es_cuadratico():
+    # Sin cambios la poda no descarta candidatos: sin bloques, 40 mil puntos tardaban ~10 s
+    inicio = time.perf_counter()
+    assert pelt(np.full(40000, 5.0)) == []
+    assert time.perf_counter() - inicio < 2
+
+
+def test_pelt_en_serie_larga_afina_el_cambio_al_dia():
+    generador = np.random.default_rng(7)
+    x = generador.normal(0, 1, 40000)
+    x[23457:] += 1.5
+    # Lo mismo que sin bloques, que sobre esta serie corta en 23458 por el ruido
+    assert pelt(x) == [23458]
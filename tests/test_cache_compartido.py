@@ -0,0 +1,46 @@
+import os
+
+import pandas as pd
+
+import cache_compartido
+from cache_compartido import CacheCompartido
+
+
+def dataset(version):
+    df = pd.DataFrame({'fecha': pd.date_range('2025-01-01', periods=3), 'saldo_rem': [1.0, 2.0, 3.0]})
+    df.attrs['version_datos'] = version
+    return df
+
+
+def test_limpiar_ignora_archivos_que_desaparecen(tmp_path, monkeypatch):
+    cache = CacheCompartido(str(tmp_path), max_versiones=1)
+    listar = os.listdir
+    # Otro worker borra un archivo entre el listado y el orden por mtime
+    monkeypatch.setattr(cache_compartido.os, 'listdir', lambda d: listar(d) + ['metricas_fantasma.arrow'])
+    cache.obtener_metricas('a', lambda: dataset('a'))
+    cache.obtener_metricas('b', lambda: dataset('b'))
+    assert sorted(n for n in listar(tmp_path) if n.endswith('.arrow')) == ['metricas_b.arrow']
+
+
+def test_dataset_borrado_cuenta_como_fallo(tmp_path):
+    cache = CacheCompartido(str(tmp_path))
+    cache.publicar_dataset('bigquery', dataset('v1'))
+    os.remove(tmp_path / 'dataset_bigquery_v1.arrow')
+    assert cache.leer_dataset('bigquery') is None
+
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        return dataset('v1')
+
+    datos, _ = cache.obtener_o_refrescar('bigquery', cargar, max_edad=3600)
+    assert cargas == [1] and len(datos) == 3
+    assert cache.leer_dataset('bigquery') is not None
+
+
+def test_metricas_borradas_se_recalculan(tmp_path):
+    cache = CacheCompartido(str(tmp_path))
+    cache.obtener_metricas('v1', lambda: dataset('v1'))
+    os.remove(tmp_path / 'metricas_v1.arrow')
+    assert len(cache.obtener_metricas('v1', lambda: dataset('v1'))) == 3
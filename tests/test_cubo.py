@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from cubo import GRANULARIDADES, CacheCubos, CuboRollup
+from metricas import MotorMetricas, calcular_metricas
+
+
+def serie(dias=200):
+    generador = np.random.default_rng(3)
+    return pd.DataFrame({
+        'fecha': pd.date_range('2025-01-01', periods=dias, freq='D'),
+        'saldo_rem': 1000 * np.cumprod(1 + generador.normal(0.002, 0.01, dias)),
+        'mau_rem': np.arange(dias) + 1000,
+        'dau_rem': generador.integers(100, 400, dias),
+    })
+
+
+def comparar(cubo, esperado):
+    for granularidad in GRANULARIDADES:
+        pd.testing.assert_frame_equal(
+            cubo.niveles[granularidad].sort_index(axis=1),
+            esperado.niveles[granularidad].sort_index(axis=1),
+            check_dtype=False,
+        )
+
+
+def test_cubo_extendido_coincide_con_cubo_completo():
+    completo = calcular_metricas(serie())
+    cubo = CuboRollup(completo.iloc[:123]).extender(completo.iloc[123:])
+    comparar(cubo, CuboRollup(completo))
+
+
+def test_extender_no_modifica_el_cubo_original():
+    completo = calcular_metricas(serie())
+    original = CuboRollup(completo.iloc[:150])
+    meses = len(original.niveles['M'])
+    original.extender(completo.iloc[150:])
+    assert len(original.niveles['M']) == meses
+    comparar(original, CuboRollup(completo.iloc[:150]))
+
+
+def test_cache_extiende_el_cubo_de_la_version_anterior():
+    completo = serie()
+    motor = MotorMetricas()
+    cache = CacheCubos()
+    previo = motor.obtener(completo.iloc[:180])
+    cache.obtener(previo.version, previo.datos)
+    nuevo = motor.obtener(completo)
+    cubo = cache.obtener(nuevo.version, nuevo.datos, nuevo.anterior, nuevo.agregadas)
+    assert cubo.version == nuevo.version
+    comparar(cubo, CuboRollup(calcular_metricas(completo)))
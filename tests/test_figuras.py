@@ -0,0 +1,11 @@
+from figuras import CacheFiguras, figura_comparacion
+
+
+def test_comparacion_distingue_la_velocidad_antes():
+    cache = CacheFiguras()
+    primera = cache.obtener_parametros(figura_comparacion, 'v1', 10.0, 20.0, '21-dic')
+    segunda = cache.obtener_parametros(figura_comparacion, 'v1', 15.0, 20.0, '21-dic')
+    assert primera is not segunda
+    assert list(segunda.data[0].y) == [15.0, 20.0]
+    assert cache.obtener_parametros(figura_comparacion, 'v1', 10.0, 20.0, '21-dic') is primera
+    assert (cache.aciertos, cache.fallos) == (1, 2)
@@ -0,0 +1,16 @@
+import pytest
+
+from fuentes import FuenteDatos, FuenteSQLLocal
+
+
+def test_fuente_sin_cargar_falla_al_instanciarse():
+    class Incompleta(FuenteDatos):
+        nombre = 'incompleta'
+
+    with pytest.raises(TypeError):
+        Incompleta()
+
+
+def test_fuentes_concretas_se_instancian(tmp_path):
+    fuente = FuenteSQLLocal(str(tmp_path / 'base.db'))
+    assert isinstance(fuente, FuenteDatos)
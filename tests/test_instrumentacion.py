@@ -0,0 +1,21 @@
+import logging
+import urllib.request
+
+from instrumentacion import Telemetria, servir_metricas
+
+
+def test_segundo_servidor_en_el_mismo_puerto_no_falla(caplog):
+    telemetria = Telemetria()
+    with telemetria.etapa('carga'):
+        pass
+    primero = servir_metricas(0, telemetria)
+    try:
+        puerto = primero.server_address[1]
+        with caplog.at_level(logging.WARNING, logger='rem.exportador'):
+            assert servir_metricas(puerto, telemetria) is None
+        assert 'No se pudo exponer /metrics' in caplog.text
+        with urllib.request.urlopen(f'http://127.0.0.1:{puerto}/metrics') as respuesta:
+            assert b'rem_' in respuesta.read()
+    finally:
+        primero.shutdown()
+        primero.server_close()
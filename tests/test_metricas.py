@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metricas import METRICAS_DERIVADAS, MotorMetricas, calcular_metricas
+
+COLUMNAS_NUMERICAS = [c for c in METRICAS_DERIVADAS if c != 'año_mes']
+
+
+def serie(dias=120, inicio='2025-01-01'):
+    generador = np.random.default_rng(7)
+    saldo = 1000 * np.cumprod(1 + generador.normal(0.002, 0.01, dias))
+    mau = np.maximum.accumulate(generador.integers(900, 1100, dias)) + np.arange(dias)
+    return pd.DataFrame({
+        'fecha': pd.date_range(inicio, periods=dias, freq='D'),
+        'saldo_rem': saldo,
+        'mau_rem': mau,
+        'dau_rem': generador.integers(100, 400, dias),
+    })
+
+
+def comparar(obtenido, esperado):
+    assert list(obtenido['fecha']) == list(esperado['fecha'])
+    for col in COLUMNAS_NUMERICAS:
+        np.testing.assert_allclose(
+            obtenido[col].to_numpy(dtype=float), esperado[col].to_numpy(dtype=float),
+            rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col,
+        )
+    assert list(obtenido['año_mes'].astype(str)) == list(esperado['año_mes'].astype(str))
+
+
+# Cortes justo antes, en y después de los rezagos de 7 y 30 días, y dentro de la historia
+@pytest.mark.parametrize('corte', [1, 6, 7, 8, 29, 30, 31, 90])
+def test_agregar_filas_coincide_con_calculo_completo(corte):
+    completo = serie()
+    motor = MotorMetricas()
+    cabeza = motor.obtener(completo.iloc[:corte])
+    extendido = motor.agregar_filas(cabeza, completo.iloc[corte:])
+    comparar(extendido.datos, calcular_metricas(completo))
+
+
+def test_agregar_filas_dia_a_dia():
+    completo = serie(45)
+    motor = MotorMetricas()
+    resultado = motor.obtener(completo.iloc[:5])
+    for i in range(5, len(completo)):
+        resultado = motor.agregar_filas(resultado, completo.iloc[i:i + 1])
+    comparar(resultado.datos, calcular_metricas(completo))
+
+
+def test_agregar_filas_rechaza_dias_anteriores():
+    completo = serie(40)
+    motor = MotorMetricas()
+    resultado = motor.obtener(completo)
+    with pytest.raises(ValueError):
+        motor.agregar_filas(resultado, completo.iloc[-3:])
+
+
+def test_obtener_extiende_la_version_anterior_cuando_solo_se_agregan_dias():
+    completo = serie()
+    motor = MotorMetricas()
+    previo = motor.obtener(completo.iloc[:100])
+    nuevo = motor.obtener(completo)
+    assert motor.calculos == 1
+    assert nuevo.anterior == previo.version
+    assert len(nuevo.agregadas) == 20
+    comparar(nuevo.datos, calcular_metricas(completo))
+
+
+def test_obtener_recalcula_desde_los_dias_reescritos():
+    completo = serie()
+    motor = MotorMetricas()
+    motor.obtener(completo.iloc[:100])
+    corregido = completo.copy()
+    corregido.loc[98, 'saldo_rem'] *= 1.01
+    nuevo = motor.obtener(corregido)
+    assert motor.calculos == 1
+    assert nuevo.anterior is None
+    comparar(nuevo.datos, calcular_metricas(corregido))
+
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from refresco import RefrescoDatos
+
+
+def _fallar():
+    raise RuntimeError('warehouse caído')
+
+
+def test_primera_carga_fallida_sirve_la_emergencia():
+    local = pd.DataFrame({'saldo_rem': [1.0]})
+    refresco = RefrescoDatos(_fallar, emergencia=lambda: (local, 0.0), reintento=0)
+    assert refresco.obtener() is local
+    refresco._hilo.join()
+    estado = refresco.estado()
+    assert estado.emergencia and estado.estado == 'error'
+    assert 'warehouse caído' in estado.ultimo_error
+
+
+def test_refresco_exitoso_reemplaza_la_emergencia():
+    nuevo = pd.DataFrame({'saldo_rem': [2.0]})
+    intentos = []
+
+    def cargar():
+        intentos.append(1)
+        if len(intentos) == 1:
+            _fallar()
+        return nuevo, 1.0
+
+    refresco = RefrescoDatos(cargar, emergencia=lambda: (pd.DataFrame(), 0.0), reintento=0)
+    refresco.obtener()
+    refresco._hilo.join()
+    assert refresco.obtener() is nuevo
+    assert not refresco.estado().emergencia
+
+
+def test_sin_emergencia_el_error_se_propaga():
+    with pytest.raises(RuntimeError):
+        RefrescoDatos(_fallar).obtener()
@@ -0,0 +1,46 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fuentes import FuenteSQLLocal, crear_fixtures_locales
+from segmentos import COLUMNAS_SEGMENTOS, _etiquetar, agregar_segmentos, serie_segmento
+
+DESDE = date(2025, 1, 1)
+
+
+@pytest.fixture(scope='module')
+def ruta_fixtures(tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp('segmentos') / 'fixtures.db')
+    crear_fixtures_locales(ruta, DESDE, dias=45, usuarios=200)
+    return ruta
+
+
+def test_bandas_suman_el_total(ruta_fixtures):
+    segmentos = agregar_segmentos(('sqlite', ruta_fixtures), DESDE, date(2025, 2, 14), procesos=1)
+    total = FuenteSQLLocal(ruta_fixtures).cargar(DESDE).set_index('fecha')
+    bandas = segmentos[segmentos['dimension'] == 'banda_saldo'].groupby('fecha')[['saldo_rem', 'dau_rem']].sum()
+    np.testing.assert_allclose(bandas['saldo_rem'], total.loc[bandas.index, 'saldo_rem'])
+    np.testing.assert_array_equal(bandas['dau_rem'], total.loc[bandas.index, 'dau_rem'])
+    cohortes = segmentos[segmentos['dimension'] == 'cohorte'].groupby('fecha')['dau_rem'].sum()
+    np.testing.assert_array_equal(cohortes, bandas['dau_rem'])
+    assert list(serie_segmento(segmentos, 'con_revenue', 'Con revenue').columns) == ['fecha', 'saldo_rem', 'mau_rem', 'dau_rem']
+
+
+def test_varios_procesos_dan_el_mismo_resultado(ruta_fixtures):
+    origen = ('sqlite', ruta_fixtures)
+    en_serie = agregar_segmentos(origen, DESDE, date(2025, 2, 14), procesos=1)
+    en_paralelo = agregar_segmentos(origen, DESDE, date(2025, 2, 14), procesos=2)
+    pd.testing.assert_frame_equal(en_paralelo, en_serie)
+
+
+def test_rango_sin_datos_devuelve_frame_vacio(ruta_fixtures):
+    segmentos = agregar_segmentos(('sqlite', ruta_fixtures), date(2030, 1, 1), date(2030, 2, 10), procesos=1)
+    assert segmentos.empty
+    assert list(segmentos.columns) == COLUMNAS_SEGMENTOS
+
+
+def test_etiquetas_de_cohorte():
+    etiquetas = _etiquetar('cohorte', np.array([202501, 202412, 0], dtype=np.int64))
+    assert list(etiquetas) == ['2025-01', '2024-12', 'Sin cohorte']
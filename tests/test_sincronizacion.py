@@ -0,0 +1,101 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sincronizacion import AlmacenParticionado, FuenteLocal, calcular_desde, sincronizar
+
+
+def datos(hasta='2025-03-20'):
+    fechas = pd.date_range('2025-01-01', hasta, freq='D')
+    generador = np.random.default_rng(3)
+    return pd.DataFrame({
+        'fecha': fechas,
+        'saldo_rem': 1000 + np.cumsum(generador.normal(1, 0.5, len(fechas))),
+        'mau_rem': (2000 + 40 * fechas.day.to_numpy()).astype(float),
+        'dau_rem': (1500 + generador.normal(0, 15, len(fechas))).round(),
+    })
+
+
+def carga_completa(directorio, df):
+    almacen = AlmacenParticionado(str(directorio))
+    sincronizar(FuenteLocal(df), almacen)
+    return almacen.leer()
+
+
+def test_dos_sincronizaciones_equivalen_a_una_carga_completa(tmp_path):
+    completo = datos()
+    almacen = AlmacenParticionado(str(tmp_path / 'incremental'))
+    primera = sincronizar(FuenteLocal(completo[completo['fecha'] <= '2025-02-15']), almacen)
+    assert primera.desde == date(2025, 1, 1) and primera.marca_agua == date(2025, 2, 15)
+
+    fuente = FuenteLocal(completo)
+    segunda = sincronizar(fuente, almacen)
+    # Sólo se re-consulta desde el inicio del mes de la marca de agua menos la ventana tardía
+    assert segunda.desde == date(2025, 2, 1)
+    assert fuente.consultas == [(date(2025, 2, 1), 48)]
+    assert segunda.marca_agua == date(2025, 3, 20)
+    assert almacen.particiones() == ['2025-01', '2025-02', '2025-03']
+    pd.testing.assert_frame_equal(almacen.leer(), carga_completa(tmp_path / 'completo', completo))
+
+
+def test_filas_reentregadas_reemplazan_a_las_anteriores(tmp_path):
+    almacen = AlmacenParticionado(str(tmp_path))
+    sincronizar(FuenteLocal(datos('2025-02-15')), almacen)
+
+    # Llegada tardía: el warehouse corrige días ya cargados del mes parcialmente guardado
+    corregidos = datos('2025-02-20')
+    tardios = corregidos['fecha'].between('2025-02-13', '2025-02-15')
+    corregidos.loc[tardios, 'saldo_rem'] += 500
+    sincronizar(FuenteLocal(corregidos), almacen)
+
+    guardado = almacen.leer()
+    assert guardado['fecha'].is_unique
+    assert len(guardado) == len(corregidos)
+    np.testing.assert_allclose(guardado['saldo_rem'], corregidos['saldo_rem'])
+
+
+def test_marca_de_agua_persiste_entre_instancias(tmp_path):
+    sincronizar(FuenteLocal(datos('2025-02-15')), AlmacenParticionado(str(tmp_path)))
+    reabierto = AlmacenParticionado(str(tmp_path))
+    assert reabierto.marca_agua() == date(2025, 2, 15)
+    assert calcular_desde(reabierto.marca_agua()) == date(2025, 2, 1)
+    assert reabierto.momento_sincronizacion() is not None
+
+
+def test_escritura_fallida_no_avanza_la_marca_de_agua(tmp_path, monkeypatch):
+    completo = datos()
+    almacen = AlmacenParticionado(str(tmp_path / 'incremental'))
+    sincronizar(FuenteLocal(completo[completo['fecha'] <= '2025-02-15']), almacen)
+
+    escribir = AlmacenParticionado._escribir_particion
+
+    def fallar_en_marzo(self, mes, df):
+        if mes == '2025-03':
+            raise OSError('disco lleno')
+        escribir(self, mes, df)
+
+    monkeypatch.setattr(AlmacenParticionado, '_escribir_particion', fallar_en_marzo)
+    with pytest.raises(OSError):
+        sincronizar(FuenteLocal(completo), almacen)
+    assert almacen.marca_agua() == date(2025, 2, 15)
+
+    # El reintento re-consulta desde la misma marca y deja el almacén como una carga completa
+    monkeypatch.setattr(AlmacenParticionado, '_escribir_particion', escribir)
+    assert sincronizar(FuenteLocal(completo), almacen).desde == date(2025, 2, 1)
+    pd.testing.assert_frame_equal(almacen.leer(), carga_completa(tmp_path / 'completo', completo))
+
+
+def test_fuente_vacia(tmp_path):
+    almacen = AlmacenParticionado(str(tmp_path))
+    resultado = sincronizar(FuenteLocal(datos().iloc[:0]), almacen)
+    assert resultado.filas_traidas == 0 and resultado.marca_agua is None
+    assert almacen.marca_agua() is None and almacen.particiones() == []
+    assert almacen.leer().empty
+
+    # Con datos guardados, un rango re-consultado vacío retrocede la marca a lo que quedó
+    sincronizar(FuenteLocal(datos('2025-02-15')), almacen)
+    resultado = sincronizar(FuenteLocal(datos('2025-01-31')), almacen)
+    assert resultado.marca_agua == date(2025, 1, 31)
+    assert almacen.particiones() == ['2025-01']
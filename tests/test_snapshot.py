@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+
+from metricas import VERSION_DERIVACION, calcular_metricas, version_datos
+from snapshot import escribir_snapshot_procesado, leer_snapshot_procesado, snapshot_procesado_vigente
+
+
+def _base():
+    return pd.DataFrame({
+        'fecha': pd.date_range('2025-01-01', periods=40),
+        'saldo_rem': [1000.0 + i for i in range(40)],
+        'mau_rem': [100 + i for i in range(40)],
+        'dau_rem': [10 + i % 7 for i in range(40)],
+    })
+
+
+def test_snapshot_procesado_se_invalida_al_cambiar_la_derivacion(tmp_path):
+    ruta_csv = tmp_path / 'datos.csv'
+    ruta = str(tmp_path / 'procesado.arrow')
+    base = _base()
+    base.to_csv(ruta_csv, index=False)
+    os.utime(ruta_csv, (0, 0))
+    escribir_snapshot_procesado(calcular_metricas(base), version_datos(base), ruta)
+
+    assert snapshot_procesado_vigente(ruta, str(ruta_csv))
+    assert not snapshot_procesado_vigente(ruta, str(ruta_csv), version_derivacion=VERSION_DERIVACION + '-otra')
+    assert leer_snapshot_procesado(ruta).attrs['version_datos'] == version_datos(base)
+
+
+def test_snapshot_procesado_sin_version_de_derivacion_no_esta_vigente(tmp_path):
+    ruta = str(tmp_path / 'procesado.arrow')
+    base = _base()
+    escribir_snapshot_procesado(calcular_metricas(base), version_datos(base), ruta, version_derivacion='')
+    assert not snapshot_procesado_vigente(ruta, str(tmp_path / 'no_existe.csv'))
@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cubo import GRANULARIDADES, CuboRollup
+from fuentes import FuenteSQLLocal, crear_fixtures_locales
+from metricas import COLUMNAS_EXTREMOS_MES, METRICAS_DERIVADAS, calcular_metricas, preparar_precalculadas
+from sql_metricas import calcular_metricas_sql_local, diferencias_con_pandas
+
+COLUMNAS_NUMERICAS = [c for c in METRICAS_DERIVADAS if c != 'año_mes']
+DESDE = date(2025, 1, 1)
+
+
+@pytest.fixture(scope='module')
+def ruta_fixtures(tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp('sql') / 'fixtures.db')
+    crear_fixtures_locales(ruta, DESDE, dias=75, usuarios=400)
+    return ruta
+
+
+def test_sql_sobre_fixtures_coincide_con_pandas(ruta_fixtures):
+    base = FuenteSQLLocal(ruta_fixtures).cargar(DESDE)
+    obtenido = FuenteSQLLocal(ruta_fixtures, metricas_en_warehouse=True).cargar(DESDE)
+    esperado = calcular_metricas(base)
+
+    assert len(obtenido) == len(esperado) == 75
+    assert list(pd.to_datetime(obtenido['fecha'])) == list(esperado['fecha'])
+    for col in COLUMNAS_NUMERICAS:
+        np.testing.assert_allclose(
+            obtenido[col].to_numpy(dtype=float), esperado[col].to_numpy(dtype=float),
+            rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col,
+        )
+    assert list(obtenido['año_mes'].astype(str)) == list(esperado['año_mes'].astype(str))
+
+    meses = esperado.groupby('año_mes', observed=True)['saldo_rem']
+    extremos = obtenido.groupby('año_mes')[COLUMNAS_EXTREMOS_MES].last()
+    np.testing.assert_allclose(extremos['saldo_inicial_mes'], meses.first())
+    np.testing.assert_allclose(extremos['saldo_final_mes'], meses.last())
+
+
+def test_cubo_con_extremos_del_warehouse_coincide(ruta_fixtures):
+    precalculadas = preparar_precalculadas(FuenteSQLLocal(ruta_fixtures, metricas_en_warehouse=True).cargar(DESDE))
+    assert set(COLUMNAS_EXTREMOS_MES) <= set(precalculadas.columns)
+    con_warehouse = CuboRollup(precalculadas)
+    esperado = CuboRollup(calcular_metricas(precalculadas))
+    for granularidad in GRANULARIDADES:
+        pd.testing.assert_frame_equal(
+            con_warehouse.niveles[granularidad].sort_index(axis=1),
+            esperado.niveles[granularidad].sort_index(axis=1),
+            check_dtype=False,
+        )
+
+
+def test_divisiones_por_cero_igual_que_pandas():
+    dias = 40
+    df = pd.DataFrame({
+        'fecha': pd.date_range('2025-01-01', periods=dias, freq='D'),
+        'saldo_rem': np.r_[0.0, 0.0, np.linspace(1, 100, dias - 2)],
+        'mau_rem': np.r_[0, 0, np.arange(1, dias - 1)],
+        'dau_rem': np.r_[0, 3, np.arange(dias - 2)],
+    })
+    esperado = calcular_metricas(df)
+    obtenido = calcular_metricas_sql_local(df)
+    # Las medias móviles sobre ventanas con ±inf no están definidas ni en pandas ni en SQL
+    for col in ['saldo_crecimiento_pct_diario', 'saldo_crecimiento_pct_semanal', 'saldo_crecimiento_pct_mensual',
+                'saldo_por_mau', 'dau_mau_ratio']:
+        np.testing.assert_array_equal(
+            np.isinf(obtenido[col].to_numpy(dtype=float)), np.isinf(esperado[col].to_numpy(dtype=float)), err_msg=col)
+        np.testing.assert_allclose(
+            obtenido[col].to_numpy(dtype=float), esperado[col].to_numpy(dtype=float),
+            rtol=1e-9, equal_nan=True, err_msg=col,
+        )
+    assert diferencias_con_pandas(df)['dau_mau_ratio'] == 0